@@ -0,0 +1,108 @@
+"""
+Crawl Jobs API Routes
+Status and live updates for preview, add and refresh crawls
+"""
+from datetime import datetime
+from typing import Optional
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from app.auth import get_current_user
+from app.config import settings
+from app.models import User
+from app.schemas import CrawlJobResponse
+from app.services.crawl_jobs import get_job, wait_for_job, job_events, JOB_SUCCEEDED, JOB_FAILED
+
+router = APIRouter(prefix="/crawl-jobs", tags=["Crawl Jobs"])
+
+
+def job_response(job: dict) -> CrawlJobResponse:
+    return CrawlJobResponse(
+        id=job["id"],
+        kind=job["kind"],
+        status=job["status"],
+        result=job["result"],
+        error=job["error"],
+        created_at=datetime.utcfromtimestamp(job["created_at"]),
+        updated_at=datetime.utcfromtimestamp(job["updated_at"]),
+    )
+
+
+def job_accepted(job: dict) -> JSONResponse:
+    """202 response pointing the client at the job to poll or stream"""
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content=job_response(job).model_dump(mode="json"),
+        headers={"Location": f"/api/v1/crawl-jobs/{job['id']}"},
+    )
+
+
+async def await_job(job: dict, wait: bool) -> Optional[dict]:
+    """
+    Wait for a job when the caller asked to
+    Returns the finished job, or None when the caller should answer 202
+    (wait=false, or the crawl is still running after CRAWL_JOB_WAIT_SECONDS).
+    """
+    if not wait:
+        return None
+
+    finished = await wait_for_job(job["id"], settings.CRAWL_JOB_WAIT_SECONDS)
+    if not finished:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Crawl job expired"
+        )
+    if finished["status"] == JOB_FAILED:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=finished["error"]
+        )
+    if finished["status"] != JOB_SUCCEEDED:
+        return None
+    return finished
+
+
+async def get_owned_job(job_id: UUID, current_user: User) -> dict:
+    job = await get_job(str(job_id))
+    if not job or job["user_id"] != str(current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Crawl job not found"
+        )
+    return job
+
+
+@router.get("/{job_id}", response_model=CrawlJobResponse)
+async def get_crawl_job(
+    job_id: UUID,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get the status (and result, once finished) of a crawl job
+    """
+    return job_response(await get_owned_job(job_id, current_user))
+
+
+@router.get("/{job_id}/events")
+async def crawl_job_events(
+    job_id: UUID,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Stream crawl job updates as server-sent events
+    Sends the current state, then one `status` event per transition, and
+    closes after the job succeeds or fails.
+    """
+    await get_owned_job(job_id, current_user)
+
+    async def stream():
+        async for job in job_events(str(job_id), timeout=settings.CRAWL_JOB_WAIT_SECONDS):
+            yield f"event: status\ndata: {job_response(job).model_dump_json()}\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,99 @@
+"""
+Ops API Routes
+Internal monitoring endpoints for crawl scheduling (requires X-Ops-Key)
+"""
+from typing import Optional, List
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, Header, HTTPException, status, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.celery_app import (
+    QUEUE_CRAWL_INTERACTIVE, QUEUE_CRAWL_BULK, QUEUE_NOTIFICATIONS, QUEUE_DISPATCH, QUEUE_MAINTENANCE
+)
+from app.config import settings
+from app.database import get_db, pool_stats, reported_pool_stats
+from app.schemas import (
+    QueueWaitResponse, QueueWaitStats, QueueStats, CrawlSweepProgress, DatabasePoolStats
+)
+from app.scheduler import get_queue_wait_stats
+from app.scheduler.admission import queue_depth, oldest_task_age
+from app.scheduler.sweeps import get_sweeps, live_counters, sweep_progress
+
+router = APIRouter(prefix="/ops", tags=["Ops"])
+
+
+def require_ops_key(x_ops_key: Optional[str] = Header(None)):
+    """Dependency guarding ops endpoints with a shared key"""
+    if not settings.OPS_API_KEY:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
+    
+    if x_ops_key != settings.OPS_API_KEY:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid ops key")
+
+
+@router.get("/queue-wait", response_model=QueueWaitResponse, dependencies=[Depends(require_ops_key)])
+def queue_wait(
+    user_id: Optional[str] = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+):
+    """
+    Per-user crawl queue-wait percentiles (seconds)
+    Without user_id, returns the most recently active users sorted by p95
+    """
+    stats = get_queue_wait_stats(user_id=user_id, limit=limit)
+    return QueueWaitResponse(users=[QueueWaitStats(**s) for s in stats])
+
+
+@router.get("/queues", response_model=List[QueueStats], dependencies=[Depends(require_ops_key)])
+def queues():
+    """
+    Depth and oldest-task age for each Celery lane
+    """
+    return [
+        QueueStats(queue=name, depth=queue_depth(name), oldest_age_seconds=oldest_task_age(name))
+        for name in (
+            QUEUE_CRAWL_INTERACTIVE, QUEUE_CRAWL_BULK, QUEUE_NOTIFICATIONS, QUEUE_DISPATCH, QUEUE_MAINTENANCE
+        )
+    ]
+
+
+@router.get("/sweeps", response_model=List[CrawlSweepProgress], dependencies=[Depends(require_ops_key)])
+async def sweeps(
+    limit: int = Query(20, ge=1, le=200),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Recent bulk crawl sweeps with progress and throughput, newest first
+    """
+    found = await get_sweeps(db, limit=limit)
+    return [
+        CrawlSweepProgress(**sweep_progress(sweep, counters))
+        for sweep, counters in zip(found, await live_counters(found))
+    ]
+
+
+@router.get("/sweeps/{sweep_id}", response_model=CrawlSweepProgress, dependencies=[Depends(require_ops_key)])
+async def sweep_detail(
+    sweep_id: UUID,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Progress of one crawl sweep
+    """
+    found = await get_sweeps(db, limit=1, sweep_id=sweep_id)
+    if not found:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Sweep not found")
+    [counters] = await live_counters(found)
+    return CrawlSweepProgress(**sweep_progress(found[0], counters))
+
+
+@router.get("/db-pools", response_model=List[DatabasePoolStats], dependencies=[Depends(require_ops_key)])
+def db_pools():
+    """
+    Database connection pool usage of this API process and recently active workers
+    Workers report at most every 30 seconds, after finishing a task.
+    """
+    current = pool_stats()
+    reports = [stats for stats in reported_pool_stats() if stats["process"] != current["process"]]
+    return [DatabasePoolStats(**stats) for stats in [current] + reports]
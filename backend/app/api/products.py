@@ -8,58 +8,63 @@ from typing import Optional
 from uuid import UUID
 from urllib.parse import urlparse
 
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Header
+from fastapi.responses import JSONResponse, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, desc
 
 from app.database import get_db
-from app.models import User, Product, PriceHistory, SubscriptionTier, CrawlStatus
+from app.models import User, Product, SubscriptionTier
 from app.schemas import (
     ProductCreate, ProductResponse, ProductUpdate, 
     ProductListResponse, ProductPreview,
-    PriceHistoryResponse, PricePoint
+    PriceHistoryResponse, PricePoint, CrawlJobResponse
 )
 from app.auth import get_current_user
-from app.crawler import crawl_product
+from app.api.crawl_jobs import await_job, job_accepted
+from app.crawler.cache import redeem_preview_token
+from app.tasks.crawler_tasks import create_tracked_product
+from app.services.downsampling import downsample_indices
+from app.services.history_encoding import (
+    negotiate, encode_columnar_json, encode_binary, MEDIA_COLUMNAR_JSON, MEDIA_BINARY,
+)
+from app.services.price_history import history_store
+from app.services.price_rollups import RESOLUTION_RAW, history_resolution, load_rollups, rollup_average
+from app.services.crawl_jobs import create_job, JOB_PREVIEW, JOB_ADD, JOB_REFRESH
 from app.config import settings
 
 router = APIRouter(prefix="/products", tags=["Products"])
 
 
-@router.post("/preview", response_model=ProductPreview)
+@router.post("/preview", response_model=ProductPreview, responses={202: {"model": CrawlJobResponse}})
 async def preview_product(
     data: ProductCreate,
+    wait: bool = Query(True, description="Wait for the crawl; false returns 202 with a crawl job"),
     current_user: User = Depends(get_current_user)
 ):
     """
     Preview product info before adding to track list
-    Crawls the URL and returns extracted product data
+    Crawls the URL on a crawl worker and returns extracted product data
     """
     url = str(data.url)
     
-    # Crawl the product page
-    result = await crawl_product(url)
+    job = await create_job(JOB_PREVIEW, str(current_user.id), {"url": url})
+    finished = await await_job(job, wait)
+    if not finished:
+        return job_accepted(job)
     
-    if not result.success:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Could not fetch product: {result.error}"
-        )
-    
-    return ProductPreview(
-        url=url,
-        name=result.name or "Unknown Product",
-        price=result.price,
-        currency=result.currency,
-        image_url=result.image_url,
-        domain=result.domain,
-        is_available=result.is_available
-    )
+    return ProductPreview(**finished["result"])
 
 
-@router.post("", response_model=ProductResponse, status_code=status.HTTP_201_CREATED)
+@router.post(
+    "",
+    response_model=ProductResponse,
+    status_code=status.HTTP_201_CREATED,
+    responses={202: {"model": CrawlJobResponse}},
+)
 async def add_product(
     data: ProductCreate,
+    wait: bool = Query(True, description="Wait for the crawl; false returns 202 with a crawl job"),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
@@ -101,66 +106,35 @@ async def add_product(
             detail="Already tracking this product"
         )
     
-    # Crawl the product
-    crawl_result = await crawl_product(url)
-    
-    if not crawl_result.success:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Could not fetch product: {crawl_result.error}"
-        )
-    
-    # Create product
-    product = Product(
-        user_id=current_user.id,
-        url=url,
-        name=crawl_result.name or "Unknown Product",
-        image_url=crawl_result.image_url,
-        current_price=crawl_result.price,
-        original_price=crawl_result.price,
-        lowest_price=crawl_result.price,
-        highest_price=crawl_result.price,
-        currency=crawl_result.currency,
-        target_price=data.target_price,
-        notify_any_drop=data.notify_any_drop,
-        domain=crawl_result.domain,
-        last_crawled_at=datetime.utcnow(),
-        last_crawl_status=CrawlStatus.SUCCESS,
-        is_available=crawl_result.is_available,
-    )
-    
-    db.add(product)
-    await db.flush()
-    
-    # Add initial price history
-    price_history = PriceHistory(
-        product_id=product.id,
-        price=crawl_result.price,
-        currency=crawl_result.currency,
-        is_available=crawl_result.is_available,
-    )
-    db.add(price_history)
+    # Reuse the preview's crawl when the client passes its token
+    if data.preview_token:
+        crawl_result = await redeem_preview_token(data.preview_token, str(current_user.id), url)
+        if crawl_result:
+            product = await create_tracked_product(
+                db,
+                user_id=current_user.id,
+                url=url,
+                crawl_result=crawl_result,
+                target_price=data.target_price,
+                notify_any_drop=data.notify_any_drop,
+            )
+            await db.commit()
+            return await get_product(product.id, current_user, db)
     
-    await db.refresh(product)
+    # Don't hold a DB connection while the crawl runs
+    await db.commit()
     
-    return ProductResponse(
-        id=product.id,
-        url=product.url,
-        name=product.name,
-        image_url=product.image_url,
-        current_price=product.current_price,
-        original_price=product.original_price,
-        lowest_price=product.lowest_price,
-        highest_price=product.highest_price,
-        currency=product.currency,
-        target_price=product.target_price,
-        notify_any_drop=product.notify_any_drop,
-        domain=product.domain,
-        last_crawled_at=product.last_crawled_at,
-        last_crawl_status=product.last_crawl_status.value,
-        is_available=product.is_available,
-        created_at=product.created_at
-    )
+    # Crawl and create the product on a crawl worker
+    job = await create_job(JOB_ADD, str(current_user.id), {
+        "url": url,
+        "target_price": str(data.target_price) if data.target_price is not None else None,
+        "notify_any_drop": data.notify_any_drop,
+    })
+    finished = await await_job(job, wait)
+    if not finished:
+        return job_accepted(job)
+    
+    return await get_product(UUID(finished["result"]["product_id"]), current_user, db)
 
 
 @router.get("", response_model=ProductListResponse)
@@ -212,6 +186,8 @@ async def list_products(
                 domain=p.domain,
                 last_crawled_at=p.last_crawled_at,
                 last_crawl_status=p.last_crawl_status.value,
+                tracking_status=p.tracking_status,
+                dead_since=p.dead_since,
                 is_available=p.is_available,
                 created_at=p.created_at
             )
@@ -261,6 +237,8 @@ async def get_product(
         domain=product.domain,
         last_crawled_at=product.last_crawled_at,
         last_crawl_status=product.last_crawl_status.value,
+        tracking_status=product.tracking_status,
+        dead_since=product.dead_since,
         is_available=product.is_available,
         created_at=product.created_at
     )
@@ -330,15 +308,25 @@ async def delete_product(
     await db.commit()
 
 
-@router.get("/{product_id}/history", response_model=PriceHistoryResponse)
+@router.get(
+    "/{product_id}/history",
+    response_model=PriceHistoryResponse,
+    responses={200: {"content": {MEDIA_COLUMNAR_JSON: {}, MEDIA_BINARY: {}}}},
+)
 async def get_price_history(
     product_id: UUID,
     days: int = Query(30, ge=1, le=365),
+    max_points: Optional[int] = Query(
+        None, ge=3, le=10000, description="Downsample to about this many points (price and stock changes are kept)"
+    ),
+    accept: Optional[str] = Header(None),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
     Get price history for a product
+    Accept: application/vnd.pricedrop.history+json or application/vnd.pricedrop.history
+    selects a compact columnar encoding (see app.services.history_encoding).
     """
     # Verify product ownership
     result = await db.execute(
@@ -356,23 +344,49 @@ async def get_price_history(
             detail="Product not found"
         )
     
-    # Get history
+    # Get history: raw rows for short ranges, rollups beyond (one row per bucket)
     from datetime import timedelta
     cutoff = datetime.utcnow() - timedelta(days=days)
+    resolution = history_resolution(days)
     
-    result = await db.execute(
-        select(PriceHistory)
-        .where(
-            PriceHistory.product_id == product_id,
-            PriceHistory.recorded_at >= cutoff
+    if resolution == RESOLUTION_RAW:
+        history = await history_store().read(db, product_id, cutoff)
+        points = [
+            PricePoint(
+                price=price,
+                recorded_at=recorded_at,
+                is_available=is_available
+            )
+            for price, recorded_at, is_available in history
+        ]
+        prices = [price for price, _, _ in history]
+        avg_price = sum(prices) / len(prices) if prices else None
+    else:
+        rollups = await load_rollups(db, product_id, resolution, cutoff)
+        points = [
+            PricePoint(
+                price=rollup.close_price,
+                recorded_at=rollup.bucket,
+                is_available=rollup.close_available,
+                low_price=rollup.low_price,
+                high_price=rollup.high_price,
+                average_price=round(rollup.average_price, 2),
+                availability=rollup.availability,
+            )
+            for rollup in rollups
+        ]
+        prices = [rollups[0].open_price, rollups[-1].close_price] if rollups else []
+        avg_price = rollup_average(rollups)
+    
+    # Stats above use the full series; only the returned points are reduced
+    if max_points:
+        keep = downsample_indices(
+            [point.recorded_at for point in points],
+            [point.price for point in points],
+            [point.is_available for point in points],
+            max_points,
         )
-        .order_by(PriceHistory.recorded_at)
-    )
-    history = result.scalars().all()
-    
-    # Calculate stats
-    prices = [h.price for h in history]
-    avg_price = sum(prices) / len(prices) if prices else None
+        points = [points[i] for i in keep]
     
     # Determine trend
     if len(prices) >= 2:
@@ -385,31 +399,33 @@ async def get_price_history(
     else:
         trend = "stable"
     
-    return PriceHistoryResponse(
+    response = PriceHistoryResponse(
         product_id=product_id,
-        history=[
-            PricePoint(
-                price=h.price,
-                recorded_at=h.recorded_at,
-                is_available=h.is_available
-            )
-            for h in history
-        ],
+        history=points,
         lowest_price=product.lowest_price,
         highest_price=product.highest_price,
         average_price=Decimal(str(round(avg_price, 2))) if avg_price else None,
-        price_trend=trend
+        price_trend=trend,
+        resolution=resolution
     )
+    
+    media_type = negotiate(accept)
+    if media_type == MEDIA_COLUMNAR_JSON:
+        return JSONResponse(encode_columnar_json(response), media_type=MEDIA_COLUMNAR_JSON)
+    if media_type == MEDIA_BINARY:
+        return Response(encode_binary(response), media_type=MEDIA_BINARY)
+    return response
 
 
-@router.post("/{product_id}/refresh", response_model=ProductResponse)
+@router.post("/{product_id}/refresh", response_model=ProductResponse, responses={202: {"model": CrawlJobResponse}})
 async def refresh_product(
     product_id: UUID,
+    wait: bool = Query(True, description="Wait for the crawl; false returns 202 with a crawl job"),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
-    Manually refresh product price (crawl now)
+    Manually refresh product price (crawl now, on a crawl worker)
     """
     result = await db.execute(
         select(Product).where(
@@ -426,37 +442,14 @@ async def refresh_product(
             detail="Product not found"
         )
     
-    # Crawl
-    crawl_result = await crawl_product(product.url)
-    
-    if crawl_result.success:
-        old_price = product.current_price
-        product.current_price = crawl_result.price
-        product.is_available = crawl_result.is_available
-        product.last_crawl_status = CrawlStatus.SUCCESS
-        product.crawl_error = None
-        
-        # Update price bounds
-        if crawl_result.price < product.lowest_price:
-            product.lowest_price = crawl_result.price
-        if crawl_result.price > product.highest_price:
-            product.highest_price = crawl_result.price
-        
-        # Add to history
-        price_history = PriceHistory(
-            product_id=product.id,
-            price=crawl_result.price,
-            currency=crawl_result.currency,
-            is_available=crawl_result.is_available,
-        )
-        db.add(price_history)
-    else:
-        product.last_crawl_status = CrawlStatus.FAILED
-        product.crawl_error = crawl_result.error
-    
-    product.last_crawled_at = datetime.utcnow()
-    product.updated_at = datetime.utcnow()
+    # Don't hold a DB connection while the crawl runs
+    await db.commit()
     
-    await db.refresh(product)
+    job = await create_job(JOB_REFRESH, str(current_user.id), {"product_id": str(product_id)})
+    finished = await await_job(job, wait)
+    if not finished:
+        return job_accepted(job)
     
+    # The worker updated the product in its own session
+    db.expire(product)
     return await get_product(product_id, current_user, db)
@@ -2,9 +2,35 @@
 Celery Application Configuration
 Background task processing for price crawling
 """
+import time
+
 from celery import Celery
+from celery.schedules import crontab
+from celery.signals import before_task_publish, worker_process_init, task_postrun
+from kombu import Queue
 from app.config import settings
 
+# Queues (lanes). Each gets its own worker profile so a bulk crawl backlog
+# never delays user-triggered crawls or notifications.
+QUEUE_CRAWL_INTERACTIVE = "crawl.interactive"  # User-triggered crawls
+QUEUE_CRAWL_BULK = "crawl.bulk"  # Scheduled sweeps
+QUEUE_NOTIFICATIONS = "notifications"  # Push/email alerts
+QUEUE_DISPATCH = "dispatch"  # Beat dispatch ticks, never behind cleanup
+QUEUE_MAINTENANCE = "maintenance"  # History cleanup, digests
+
+# Message priorities within a queue. The Redis transport keeps one list per
+# priority step and a worker drains lower steps first.
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 3
+PRIORITY_LOW = 6
+
+# Periodic task periods (tasks claim each tick once, see app.scheduler.beat).
+# Schedules are crontabs so ticks start on the period grid the claims use.
+DISPATCH_TICK_SECONDS = settings.CRAWL_DISPATCH_TICK_MINUTES * 60
+CLEANUP_TICK_SECONDS = 86400  # Daily
+if 60 % settings.CRAWL_DISPATCH_TICK_MINUTES:
+    raise ValueError("CRAWL_DISPATCH_TICK_MINUTES must divide an hour")
+
 # Create Celery app
 celery_app = Celery(
     "price_drop_alert",
@@ -27,27 +53,84 @@ celery_app.conf.update(
     task_reject_on_worker_lost=True,
     worker_prefetch_multiplier=1,
     
+    # Routing
+    task_queues=(
+        Queue(QUEUE_CRAWL_INTERACTIVE),
+        Queue(QUEUE_CRAWL_BULK),
+        Queue(QUEUE_NOTIFICATIONS),
+        Queue(QUEUE_DISPATCH),
+        Queue(QUEUE_MAINTENANCE),
+    ),
+    task_default_queue=QUEUE_MAINTENANCE,
+    task_default_priority=PRIORITY_NORMAL,
+    task_routes={
+        "app.tasks.crawler_tasks.crawl_single_product": {"queue": QUEUE_CRAWL_BULK},
+        "app.tasks.crawler_tasks.crawl_product_batch": {"queue": QUEUE_CRAWL_BULK},
+        "app.tasks.crawler_tasks.run_crawl_job": {"queue": QUEUE_CRAWL_INTERACTIVE},
+        "app.tasks.crawler_tasks.crawl_all_products": {"queue": QUEUE_DISPATCH},
+        "app.tasks.crawler_tasks.cleanup_old_history": {"queue": QUEUE_MAINTENANCE},
+        "app.tasks.notification_tasks.send_weekly_digest": {"queue": QUEUE_MAINTENANCE},
+        "app.tasks.notification_tasks.*": {"queue": QUEUE_NOTIFICATIONS},
+    },
+    broker_transport_options={
+        "priority_steps": [PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW, 9],
+    },
+    
     # Results
     result_expires=3600,  # 1 hour
     
+    # Beat: schedule and leader lock live in Redis (RedBeat), so beat can run on
+    # several nodes; a standby takes over within redbeat_lock_timeout
+    beat_scheduler="redbeat.RedBeatScheduler",
+    redbeat_redis_url=settings.REDIS_URL,
+    redbeat_key_prefix="redbeat:",
+    redbeat_lock_timeout=settings.BEAT_LOCK_TIMEOUT_SECONDS,
+    beat_max_loop_interval=settings.BEAT_MAX_LOOP_INTERVAL_SECONDS,
+    
     # Beat schedule (periodic tasks)
     beat_schedule={
-        # Crawl all products every 12 hours
+        # Dispatch due products every few minutes (each product is
+        # crawled once per CRAWL_INTERVAL_HOURS at its own jittered slot)
         "crawl-all-products": {
             "task": "app.tasks.crawler_tasks.crawl_all_products",
-            "schedule": settings.CRAWL_INTERVAL_HOURS * 3600,  # Convert to seconds
+            "schedule": crontab(minute=f"*/{settings.CRAWL_DISPATCH_TICK_MINUTES}"),
         },
-        # Cleanup old price history (keep 1 year)
+        # Drop expired price history partitions, create upcoming ones
         "cleanup-old-history": {
             "task": "app.tasks.crawler_tasks.cleanup_old_history",
-            "schedule": 86400,  # Daily
+            "schedule": crontab(minute=0, hour=0),
         },
     },
     
     # Rate limiting
     task_annotations={
         "app.tasks.crawler_tasks.crawl_single_product": {
-            "rate_limit": "10/m"  # 10 per minute to avoid overloading
+            # Per worker, to avoid overloading retailers; also sizes affinity queues
+            "rate_limit": f"{settings.CRAWL_NODE_CRAWLS_PER_MINUTE}/m"
         }
     },
 )
+
+
+@before_task_publish.connect
+def _stamp_sent_at(headers=None, **kwargs):
+    """Record the publish time; periodic tasks find their beat tick from it"""
+    from app.scheduler.beat import SENT_AT_HEADER
+    if headers is not None:
+        headers.setdefault(SENT_AT_HEADER, time.time())
+
+
+@worker_process_init.connect
+def _reset_db_pool(**kwargs):
+    """Forked worker children must not reuse connections inherited from the parent"""
+    from app.database import engine
+    engine.sync_engine.dispose(close=False)
+
+
+@task_postrun.connect
+def _report_db_pool(**kwargs):
+    from app.database import report_pool_stats
+    try:
+        report_pool_stats()
+    except Exception:
+        pass  # Metrics must never fail a task
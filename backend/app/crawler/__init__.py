@@ -1,4 +1,4 @@
 # Crawler Module
-from app.crawler.engine import PriceCrawler, CrawlResult, crawl_product, get_crawler
+from app.crawler.engine import PriceCrawler, CrawlResult, crawl_product, get_crawler, close_crawler
 
-__all__ = ["PriceCrawler", "CrawlResult", "crawl_product", "get_crawler"]
+__all__ = ["PriceCrawler", "CrawlResult", "crawl_product", "get_crawler", "close_crawler"]
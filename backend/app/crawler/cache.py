@@ -0,0 +1,136 @@
+"""
+Crawl Result Cache
+Short-lived cache of successful crawls, keyed by canonical URL
+
+Preview, add and refresh often crawl the same URL seconds apart. Results
+younger than CRAWL_CACHE_SECONDS are served from an in-process LRU, then
+from Redis, before a new crawl is started. A preview also issues a token
+that lets the following add reuse its result outright.
+"""
+import json
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+import redis
+import structlog
+
+from app.config import settings
+from app.crawler.engine import CrawlResult, crawl_product
+from app.crawler.singleflight import canonical_url, flight_key
+from app.redis_client import get_async_redis
+
+logger = structlog.get_logger()
+
+CACHE_KEY = "crawl:cache:{key}"
+PREVIEW_TOKEN_KEY = "crawl:preview:{token}"
+
+
+class CrawlCache:
+    """
+    Two-level cache (process LRU, then Redis) of successful crawl results
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, CrawlResult]" = OrderedDict()
+
+    def _fresh(self, result: CrawlResult, max_age: float) -> bool:
+        return result.crawled_at is not None and time.time() - result.crawled_at <= max_age
+
+    async def get(self, url: str, max_age: Optional[float] = None) -> Optional[CrawlResult]:
+        """Cached result for a URL if it is younger than max_age seconds"""
+        max_age = settings.CRAWL_CACHE_SECONDS if max_age is None else max_age
+        key = flight_key(url)
+
+        result = self._entries.get(key)
+        if result is not None and self._fresh(result, max_age):
+            self._entries.move_to_end(key)
+            return result
+
+        try:
+            raw = await get_async_redis().get(CACHE_KEY.format(key=key))
+        except redis.RedisError as e:
+            logger.warning("Crawl cache unavailable", url=url, error=str(e))
+            return None
+        if not raw:
+            return None
+
+        result = CrawlResult.from_dict(json.loads(raw))
+        if not self._fresh(result, max_age):
+            return None
+        self._remember(key, result)
+        return result
+
+    async def put(self, url: str, result: CrawlResult):
+        """Cache a successful result"""
+        if not result.success:
+            return
+        if result.crawled_at is None:
+            result.crawled_at = time.time()
+
+        key = flight_key(url)
+        self._remember(key, result)
+        try:
+            await get_async_redis().set(
+                CACHE_KEY.format(key=key),
+                json.dumps(result.to_dict()),
+                ex=settings.CRAWL_CACHE_SECONDS,
+            )
+        except redis.RedisError as e:
+            logger.warning("Failed to cache crawl result", url=url, error=str(e))
+
+    def _remember(self, key: str, result: CrawlResult):
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+crawl_cache = CrawlCache(settings.CRAWL_CACHE_LRU_SIZE)
+
+
+async def crawl_product_cached(url: str, max_age: Optional[float] = None) -> CrawlResult:
+    """Crawl a product unless a fresh enough result for its URL is cached"""
+    cached = await crawl_cache.get(url, max_age)
+    if cached is not None:
+        logger.info("Crawl cache hit", url=url)
+        return cached
+
+    result = await crawl_product(url)
+    await crawl_cache.put(url, result)
+    return result
+
+
+# ============ Preview Tokens ============
+
+async def issue_preview_token(user_id: str, url: str, result: CrawlResult) -> Optional[str]:
+    """Store a preview's result for the add that usually follows it"""
+    token = uuid.uuid4().hex
+    try:
+        await get_async_redis().set(
+            PREVIEW_TOKEN_KEY.format(token=token),
+            json.dumps({"user_id": user_id, "url": canonical_url(url), "result": result.to_dict()}),
+            ex=settings.CRAWL_PREVIEW_TOKEN_SECONDS,
+        )
+    except redis.RedisError as e:
+        logger.warning("Failed to issue preview token", url=url, error=str(e))
+        return None
+    return token
+
+
+async def redeem_preview_token(token: str, user_id: str, url: str) -> Optional[CrawlResult]:
+    """The preview's result, if the token is live and was issued to this user for this URL"""
+    try:
+        raw = await get_async_redis().get(PREVIEW_TOKEN_KEY.format(token=token))
+    except redis.RedisError as e:
+        logger.warning("Preview token lookup failed", error=str(e))
+        return None
+    if not raw:
+        return None
+
+    preview = json.loads(raw)
+    if preview["user_id"] != user_id or preview["url"] != canonical_url(url):
+        return None
+    return CrawlResult.from_dict(preview["result"])
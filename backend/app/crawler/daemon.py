@@ -0,0 +1,287 @@
+"""
+Async Crawl Daemon
+High-concurrency alternative to per-task Celery crawling
+
+Crawls are I/O-bound, so one event loop keeps hundreds of page loads in
+flight over a few shared browsers, instead of one page per prefork slot.
+Scheduling (jittered slots, domain windows, fair share, dispatch claims,
+resumable sweeps), URL coalescing, retry backoff and result handling are the
+same code the Celery tasks use; Celery stays in charge of notifications and
+maintenance.
+
+Run with: python -m app.crawler.daemon
+"""
+import asyncio
+import signal
+import time
+from collections import defaultdict
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+
+import structlog
+from sqlalchemy import select
+
+from app.config import settings
+from app.crawler.engine import PriceCrawler, CrawlResult, crawl_product, failure_kind_for
+from app.database import async_session_maker
+from app.models import Product
+from app.scheduler.retry import retry_delay
+from app.scheduler.sweeps import (
+    resume_or_start_sweep, checkpoint_sweep, finish_sweep, record_sweep_progress
+)
+from app.services.result_stream import publish_crawl_results
+from app.services.result_writer import write_crawl_results, result_items
+from app.tasks.crawler_tasks import (
+    crawl_interval_seconds, due_cutoff, load_due_schedule, enqueue_notifications,
+)
+
+logger = structlog.get_logger()
+
+# (product_id, price before the crawl, result, retry number)
+CrawlItem = Tuple[str, Optional[Decimal], CrawlResult, int]
+
+
+class CrawlDaemon:
+    """
+    Long-running crawl loop
+    Pulls due products every dispatch tick, crawls them under global and
+    per-domain concurrency limits, and writes results in batches. Transient
+    failures are crawled again after their backoff; only final results are
+    written. No database connection is held while a page loads.
+    """
+
+    def __init__(
+        self,
+        browsers: Optional[int] = None,
+        concurrency: Optional[int] = None,
+        domain_limit: Optional[int] = None,
+    ):
+        self.browser_count = browsers or settings.CRAWL_DAEMON_BROWSERS
+        self.concurrency = concurrency or settings.CRAWL_DAEMON_CONCURRENCY
+        self.domain_limit = domain_limit or settings.CRAWL_DAEMON_DOMAIN_LIMIT
+
+        self._crawlers: List[PriceCrawler] = []
+        self._next_crawler = 0
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._domain_slots: Dict[str, asyncio.Semaphore] = defaultdict(
+            lambda: asyncio.Semaphore(self.domain_limit)
+        )
+        self._results: "asyncio.Queue[Optional[CrawlItem]]" = asyncio.Queue()
+        self._inflight: set = set()
+        self._stopping = asyncio.Event()
+        self.stats = {"dispatched": 0, "succeeded": 0, "failed": 0, "retried": 0, "written": 0}
+        self._sweep_id: Optional[str] = None
+
+    def stop(self):
+        """Stop taking new work; in-flight crawls finish and are written"""
+        logger.info("Crawl daemon stopping", in_flight=len(self._inflight))
+        self._stopping.set()
+
+    async def run(self):
+        """Main loop: dispatch due work every tick until stopped"""
+        for _ in range(self.browser_count):
+            crawler = PriceCrawler()
+            await crawler.start()
+            self._crawlers.append(crawler)
+
+        writer = asyncio.create_task(self._write_loop())
+        logger.info(
+            "Crawl daemon started",
+            browsers=self.browser_count,
+            concurrency=self.concurrency,
+            domain_limit=self.domain_limit,
+        )
+
+        try:
+            while not self._stopping.is_set():
+                started = time.monotonic()
+                await self._dispatch_due()
+                logger.info("Crawl daemon tick", in_flight=len(self._inflight), **self.stats)
+
+                # Sleep out the rest of the tick (or until stopped)
+                remaining = settings.CRAWL_DISPATCH_TICK_MINUTES * 60 - (time.monotonic() - started)
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=max(remaining, 1))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            # Crawls finishing now still hand off results; pending retries return
+            while self._inflight:
+                await asyncio.gather(*list(self._inflight), return_exceptions=True)
+            await self._results.put(None)
+            await writer
+            for crawler in self._crawlers:
+                await crawler.close()
+            logger.info("Crawl daemon stopped", **self.stats)
+
+    async def _dispatch_due(self):
+        """Schedule the tick's due products and start their crawls in fair-share order"""
+        now = time.time()
+        
+        async with async_session_maker() as db:
+            # Resume the sweep a restart interrupted; commits release the connection
+            sweep = await resume_or_start_sweep(db, due_cutoff(), crawl_interval_seconds())
+            self._sweep_id = str(sweep.id)
+            
+            scheduler, cursor, scanned, exhausted = await load_due_schedule(db, sweep, now)
+            ordered = list(scheduler.drain())
+            targets = {}
+            page_size = settings.CRAWL_ENQUEUE_PAGE_SIZE
+            for start in range(0, len(ordered), page_size):
+                ids = [UUID(product_id) for _, (product_id, _) in ordered[start:start + page_size]]
+                result = await db.execute(
+                    select(Product.id, Product.url, Product.current_price).where(Product.id.in_(ids))
+                )
+                targets.update(
+                    (str(product_id), (url, price)) for product_id, url, price in result.fetchall()
+                )
+            if cursor is not None:
+                await checkpoint_sweep(db, sweep, cursor, scanned, len(targets))
+            if exhausted:
+                await finish_sweep(db, sweep)
+        
+        for _, (product_id, domain) in ordered:
+            if product_id not in targets:
+                continue
+            url, previous_price = targets[product_id]
+            # Backpressure: never more than `concurrency` crawls in flight
+            await self._slots.acquire()
+            self._spawn(self._crawl(product_id, url, domain, previous_price))
+            self.stats["dispatched"] += 1
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _fetch(self, url: str) -> CrawlResult:
+        """Load a page on the next browser of the pool"""
+        crawler = self._crawlers[self._next_crawler % len(self._crawlers)]
+        self._next_crawler += 1
+        return await crawler.crawl(url)
+
+    async def _crawl(
+        self,
+        product_id: str,
+        url: str,
+        domain: Optional[str],
+        previous_price: Optional[Decimal] = None,
+        attempt: int = 0,
+    ):
+        """Crawl one product under its domain limit and hand off the result (holds a slot)"""
+        try:
+            async with self._domain_slots[domain or ""]:
+                try:
+                    result = await crawl_product(url, fetch=self._fetch)
+                except Exception as e:
+                    result = CrawlResult(
+                        success=False, url=url, domain=domain, error=str(e),
+                        failure_kind=failure_kind_for(e),
+                    )
+        finally:
+            self._slots.release()
+
+        delay = None if result.success else retry_delay(result.failure_kind, attempt)
+        if delay is not None and not self._stopping.is_set():
+            self.stats["retried"] += 1
+            self._spawn(self._retry(product_id, url, domain, previous_price, attempt + 1, delay))
+            return
+
+        self.stats["succeeded" if result.success else "failed"] += 1
+        await self._results.put((product_id, previous_price, result, attempt))
+
+    async def _retry(
+        self,
+        product_id: str,
+        url: str,
+        domain: Optional[str],
+        previous_price: Optional[Decimal],
+        attempt: int,
+        delay: float,
+    ):
+        """Crawl a failed product again after its backoff"""
+        try:
+            await asyncio.wait_for(self._stopping.wait(), timeout=delay)
+            # Stopping: the product stays due and is picked up after restart
+            return
+        except asyncio.TimeoutError:
+            pass
+        await self._slots.acquire()
+        await self._crawl(product_id, url, domain, previous_price, attempt)
+
+    async def _write_loop(self):
+        """Collect crawl results and write them in batches"""
+        batch: List[CrawlItem] = []
+        done = False
+
+        while not done:
+            try:
+                item = await asyncio.wait_for(
+                    self._results.get(), timeout=settings.CRAWL_DAEMON_FLUSH_SECONDS
+                )
+                if item is None:
+                    done = True
+                else:
+                    batch.append(item)
+                    if len(batch) < settings.CRAWL_DAEMON_WRITE_BATCH:
+                        continue
+            except asyncio.TimeoutError:
+                pass
+
+            if batch:
+                await self._write(batch)
+                batch = []
+
+    async def _write(self, batch: List[CrawlItem]):
+        """Apply a batch of results in one transaction (or publish them to the result stream)"""
+        if self._sweep_id:
+            outcomes = [{"status": "success" if result.success else "failed"} for _, _, result, _ in batch]
+            try:
+                await asyncio.get_running_loop().run_in_executor(
+                    None, record_sweep_progress, self._sweep_id, outcomes
+                )
+            except Exception as e:
+                logger.warning("Failed to record sweep progress", sweep_id=self._sweep_id, error=str(e))
+        
+        # A result written while stopping may still have retries left
+        attempts = {product_id: attempt for product_id, _, _, attempt in batch}
+        if settings.CRAWL_RESULT_PIPELINE == "stream":
+            items = [(product_id, previous_price, result) for product_id, previous_price, result, _ in batch]
+            try:
+                await asyncio.get_running_loop().run_in_executor(
+                    None, publish_crawl_results, items, attempts
+                )
+                self.stats["written"] += len(batch)
+            except Exception as e:
+                logger.error("Failed to publish crawl results", batch_size=len(batch), error=str(e))
+            return
+        
+        results = {product_id: result for product_id, _, result, _ in batch}
+        try:
+            async with async_session_maker() as db:
+                _, alerts = await write_crawl_results(db, result_items(results), attempts=attempts)
+                await db.commit()
+
+            # Broker publish is blocking; keep it off the event loop
+            await asyncio.get_running_loop().run_in_executor(None, enqueue_notifications, alerts)
+            self.stats["written"] += len(results)
+        except Exception as e:
+            # Products stay due and are retried once their dispatch claims expire
+            logger.error("Failed to write crawl results", batch_size=len(results), error=str(e))
+
+
+def main():
+    daemon = CrawlDaemon()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, daemon.stop)
+    try:
+        loop.run_until_complete(daemon.run())
+    finally:
+        loop.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,8 +5,9 @@ Playwright-based web scraping for global e-commerce sites
 import re
 import asyncio
 from decimal import Decimal
-from typing import Optional, Dict, Any, List
-from dataclasses import dataclass
+from typing import Optional, Dict, Any, List, Callable, Awaitable
+from dataclasses import dataclass, asdict
+from enum import Enum
 from urllib.parse import urlparse
 
 from playwright.async_api import async_playwright, Page, Browser, TimeoutError as PlaywrightTimeout
@@ -18,6 +19,22 @@ from app.config import settings
 logger = structlog.get_logger()
 
 
+class FailureKind(str, Enum):
+    """Why a crawl failed; drives the retry policy"""
+    TIMEOUT = "timeout"  # Page load timed out
+    BLOCKED = "blocked"  # Bot detection / CAPTCHA
+    PARSE = "parse"  # Page loaded but no price could be extracted
+    NOT_FOUND = "not_found"  # 404/410, or redirected away from the product
+    NETWORK = "network"  # DNS, connection resets, browser errors
+
+
+def failure_kind_for(error: BaseException) -> FailureKind:
+    """Failure kind of an exception raised around a crawl (e.g. by the browser)"""
+    if isinstance(error, (PlaywrightTimeout, asyncio.TimeoutError)):
+        return FailureKind.TIMEOUT
+    return FailureKind.NETWORK
+
+
 @dataclass
 class CrawlResult:
     """Result from crawling a product page"""
@@ -31,6 +48,25 @@ class CrawlResult:
     is_available: bool = True
     error: Optional[str] = None
     domain: Optional[str] = None
+    crawled_at: Optional[float] = None  # Epoch seconds the page was fetched (set by single-flight)
+    failure_kind: Optional[str] = None  # FailureKind value when success is False
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-safe representation (prices as strings)"""
+        data = asdict(self)
+        for key in ("price", "original_price"):
+            if data[key] is not None:
+                data[key] = str(data[key])
+        return data
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CrawlResult":
+        """Rebuild a result from to_dict() output"""
+        data = dict(data)
+        for key in ("price", "original_price"):
+            if data.get(key) is not None:
+                data[key] = Decimal(data[key])
+        return cls(**data)
 
 
 class PriceCrawler:
@@ -1597,6 +1633,7 @@ class PriceCrawler:
     def __init__(self):
         self.browser: Optional[Browser] = None
         self.playwright = None
+        self._start_lock = asyncio.Lock()
     
     async def __aenter__(self):
         await self.start()
@@ -1608,7 +1645,24 @@ class PriceCrawler:
     async def start(self):
         """Initialize Playwright browser"""
         self.playwright = await async_playwright().start()
-        self.browser = await self.playwright.chromium.launch(
+        try:
+            self.browser = await self._launch()
+        except Exception:
+            await self.playwright.stop()
+            self.playwright = None
+            raise
+        logger.info("Browser started")
+    
+    async def ensure_started(self):
+        """Start the browser once, however many crawls are waiting for it"""
+        if self.browser:
+            return
+        async with self._start_lock:
+            if not self.browser:
+                await self.start()
+    
+    async def _launch(self) -> Browser:
+        return await self.playwright.chromium.launch(
             headless=True,
             args=[
                 "--disable-blink-features=AutomationControlled",
@@ -1619,14 +1673,15 @@ class PriceCrawler:
                 "--window-size=1920,1080",
             ]
         )
-        logger.info("Browser started")
     
     async def close(self):
         """Close browser and cleanup"""
         if self.browser:
             await self.browser.close()
+            self.browser = None
         if self.playwright:
             await self.playwright.stop()
+            self.playwright = None
         logger.info("Browser closed")
     
     def _get_domain(self, url: str) -> str:
@@ -1635,6 +1690,17 @@ class PriceCrawler:
         domain = parsed.netloc.replace("www.", "")
         return domain
     
+    def _redirected_off_product(self, requested_url: str, final_url: str) -> bool:
+        """Whether the store sent us to its home page or a search page instead"""
+        requested = urlparse(requested_url)
+        final = urlparse(final_url)
+        if final.path.rstrip("/") == requested.path.rstrip("/"):
+            return False
+        if final.path in ("", "/"):
+            return True
+        path = final.path.lower()
+        return path in ("/s", "/search", "/sch/i.html") or path.startswith(("/search/", "/s/"))
+    
     def _get_site_config(self, domain: str) -> Dict[str, Any]:
         """Get site-specific selectors or use defaults"""
         # Check for exact domain match
@@ -1717,8 +1783,7 @@ class PriceCrawler:
         domain = self._get_domain(url)
         config = self._get_site_config(domain)
         
-        if not self.browser:
-            await self.start()
+        await self.ensure_started()
         
         # More realistic browser fingerprint
         context = await self.browser.new_context(
@@ -1763,7 +1828,25 @@ class PriceCrawler:
         
         try:
             # Navigate to page
-            await page.goto(url, wait_until="networkidle", timeout=settings.REQUEST_TIMEOUT * 1000)
+            response = await page.goto(url, wait_until="networkidle", timeout=settings.REQUEST_TIMEOUT * 1000)
+            
+            if response is not None and response.status in (404, 410):
+                return CrawlResult(
+                    success=False,
+                    url=url,
+                    domain=domain,
+                    error=f"Product page not found (HTTP {response.status})",
+                    failure_kind=FailureKind.NOT_FOUND,
+                )
+            
+            if self._redirected_off_product(url, page.url):
+                return CrawlResult(
+                    success=False,
+                    url=url,
+                    domain=domain,
+                    error="Product page redirected to a search or home page",
+                    failure_kind=FailureKind.NOT_FOUND,
+                )
             
             # Check for bot detection / CAPTCHA pages
             page_title = await page.title()
@@ -1787,7 +1870,8 @@ class PriceCrawler:
                     success=False,
                     url=url,
                     domain=domain,
-                    error=f"Access blocked by {domain}. This store has strong bot protection."
+                    error=f"Access blocked by {domain}. This store has strong bot protection.",
+                    failure_kind=FailureKind.BLOCKED,
                 )
             
             # Wait for dynamic content (longer for Amazon)
@@ -1831,7 +1915,8 @@ class PriceCrawler:
                     url=url,
                     domain=domain,
                     name=name,
-                    error="Could not extract price from page"
+                    error="Could not extract price from page",
+                    failure_kind=FailureKind.PARSE,
                 )
             
             logger.info(
@@ -1863,7 +1948,8 @@ class PriceCrawler:
                 success=False,
                 url=url,
                 domain=domain,
-                error="Page load timeout"
+                error="Page load timeout",
+                failure_kind=FailureKind.TIMEOUT,
             )
         except Exception as e:
             logger.error("Error crawling page", url=url, error=str(e))
@@ -1871,7 +1957,8 @@ class PriceCrawler:
                 success=False,
                 url=url,
                 domain=domain,
-                error=str(e)
+                error=str(e),
+                failure_kind=FailureKind.NETWORK,
             )
         finally:
             await context.close()
@@ -2006,18 +2093,48 @@ class PriceCrawler:
 
 # Singleton instance for reuse
 _crawler: Optional[PriceCrawler] = None
+# Concurrent first calls (a cold worker's batch) must launch one browser, not one each
+_crawler_lock = asyncio.Lock()
 
 
 async def get_crawler() -> PriceCrawler:
     """Get or create crawler instance"""
     global _crawler
     if _crawler is None:
-        _crawler = PriceCrawler()
-        await _crawler.start()
+        async with _crawler_lock:
+            if _crawler is None:
+                crawler = PriceCrawler()
+                await crawler.start()
+                # Published only once started, so no caller sees a half-started crawler
+                _crawler = crawler
     return _crawler
 
 
-async def crawl_product(url: str) -> CrawlResult:
-    """Convenience function to crawl a single product"""
+async def close_crawler():
+    """Close the shared crawler instance, if one was started"""
+    global _crawler
+    async with _crawler_lock:
+        if _crawler is not None:
+            await _crawler.close()
+            _crawler = None
+
+
+async def crawl_product(
+    url: str,
+    fetch: Optional[Callable[[str], Awaitable[CrawlResult]]] = None,
+) -> CrawlResult:
+    """
+    Convenience function to crawl a single product
+    Concurrent calls for the same canonical URL share one crawl. `fetch`
+    loads the page (default: the shared crawler).
+    """
+    fetch = fetch or _crawl_uncoalesced
+    if settings.CRAWL_SINGLE_FLIGHT:
+        from app.crawler.singleflight import single_flight
+        return await single_flight.crawl(url, fetch)
+    return await fetch(url)
+
+
+async def _crawl_uncoalesced(url: str) -> CrawlResult:
     crawler = await get_crawler()
     return await crawler.crawl(url)
@@ -0,0 +1,172 @@
+"""
+Single-Flight Crawls
+Coalesce concurrent crawls of the same product URL
+
+Callers in one process that ask for the same canonical URL share one
+in-flight crawl. Across processes a Redis lease (SET NX PX) elects a single
+crawler; the others wait for its result, which stays readable for
+CRAWL_SHARE_SECONDS so callers arriving just after it finished reuse it
+instead of opening another page.
+"""
+import asyncio
+import hashlib
+import json
+import re
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Optional
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
+
+import redis
+import structlog
+
+from app.config import settings
+from app.crawler.engine import CrawlResult
+from app.redis_client import get_async_redis
+
+logger = structlog.get_logger()
+
+LEASE_KEY = "crawl:lease:{key}"
+RESULT_KEY = "crawl:flight:{key}"
+LEASE_POLL_SECONDS = 0.5
+
+# Query parameters that never change the product a URL points at
+TRACKING_PARAMS = {
+    "gclid", "fbclid", "msclkid", "ref", "ref_", "tag", "psc", "th",
+    "smid", "spm", "clickid", "affid", "irclickid", "cmpid",
+}
+AMAZON_ASIN = re.compile(r"/(?:dp|gp/product|gp/aw/d)/([A-Z0-9]{10})", re.IGNORECASE)
+
+# Delete the lease only if we still hold it
+RELEASE_LEASE = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+def canonical_url(url: str) -> str:
+    """
+    Normalize a product URL so equivalent links share one crawl
+    Lowercases the host, drops "www.", fragments and tracking parameters,
+    sorts the query, and reduces Amazon links to /dp/<ASIN>.
+    """
+    parsed = urlparse(url.strip())
+    host = parsed.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+
+    if host.startswith("amazon."):
+        match = AMAZON_ASIN.search(parsed.path)
+        if match:
+            return f"https://{host}/dp/{match.group(1).upper()}"
+
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith("utm_")
+    )
+    path = parsed.path.rstrip("/") or "/"
+    return urlunparse(("https", host, path, "", urlencode(query), ""))
+
+
+def flight_key(url: str) -> str:
+    """Short Redis-safe key for a URL's canonical form"""
+    return hashlib.blake2b(canonical_url(url).encode(), digest_size=16).hexdigest()
+
+
+Fetch = Callable[[str], Awaitable[CrawlResult]]
+
+
+class SingleFlight:
+    """
+    Per-process registry of in-flight crawls, backed by a Redis lease
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def crawl(self, url: str, fetch: Fetch) -> CrawlResult:
+        """Crawl a URL, joining an identical crawl already in flight"""
+        key = flight_key(url)
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            # shield: one waiter giving up must not cancel the shared crawl
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self._crawl_leased(key, url, fetch)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Retrieved here; waiters re-raise it themselves
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _crawl_leased(self, key: str, url: str, fetch: Fetch) -> CrawlResult:
+        """Crawl under the cross-process lease, or reuse the holder's result"""
+        lease_key = LEASE_KEY.format(key=key)
+        result_key = RESULT_KEY.format(key=key)
+        token = uuid.uuid4().hex
+
+        try:
+            r = get_async_redis()
+            shared = await self._shared_result(r, result_key)
+            if shared:
+                return shared
+
+            deadline = time.monotonic() + settings.CRAWL_LEASE_SECONDS
+            while not await r.set(lease_key, token, nx=True, px=settings.CRAWL_LEASE_SECONDS * 1000):
+                # Another process is crawling this URL: wait for its result
+                await asyncio.sleep(LEASE_POLL_SECONDS)
+                shared = await self._shared_result(r, result_key)
+                if shared:
+                    return shared
+                if time.monotonic() > deadline:
+                    logger.warning("Crawl lease wait timed out", url=url)
+                    break
+        except redis.RedisError as e:
+            # Coalescing is an optimization; never block a crawl on Redis
+            logger.warning("Crawl lease unavailable", url=url, error=str(e))
+            return await self._fetch(url, fetch)
+
+        try:
+            result = await self._fetch(url, fetch)
+        except BaseException:
+            await self._release(r, lease_key, token)
+            raise
+
+        try:
+            await r.set(result_key, json.dumps(result.to_dict()), ex=settings.CRAWL_SHARE_SECONDS)
+        except redis.RedisError as e:
+            logger.warning("Failed to share crawl result", url=url, error=str(e))
+        await self._release(r, lease_key, token)
+        return result
+
+    async def _release(self, r, lease_key: str, token: str):
+        try:
+            await r.eval(RELEASE_LEASE, 1, lease_key, token)
+        except redis.RedisError as e:
+            logger.warning("Failed to release crawl lease", lease=lease_key, error=str(e))
+
+    async def _shared_result(self, r, result_key: str) -> Optional[CrawlResult]:
+        raw = await r.get(result_key)
+        return CrawlResult.from_dict(json.loads(raw)) if raw else None
+
+    async def _fetch(self, url: str, fetch: Fetch) -> CrawlResult:
+        result = await fetch(url)
+        # Lets writers recognise a shared result they've already applied
+        if result.crawled_at is None:
+            result.crawled_at = time.time()
+        return result
+
+
+single_flight = SingleFlight()
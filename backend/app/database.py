@@ -1,16 +1,48 @@
 """
 Database Session Management
 """
+import json
+import os
+import socket
+import time
+from typing import Any, Dict, List
+
+import structlog
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
-from sqlalchemy.pool import NullPool
 from app.config import settings
 
-# Create async engine
+logger = structlog.get_logger()
+
+
+def pool_options(role: str) -> Dict[str, Any]:
+    """Pool sizing for a process role (see DATABASE_POOL_PROFILES)"""
+    profile = settings.DATABASE_POOL_PROFILES.get(role)
+    if profile is None:
+        raise ValueError(f"Unknown DATABASE_POOL_ROLE: {role}")
+    return {
+        "pool_size": profile.get("pool_size", settings.DATABASE_POOL_SIZE),
+        "max_overflow": profile.get("max_overflow", 0),
+        "pool_timeout": profile.get("pool_timeout", 30),
+        "pool_pre_ping": settings.DATABASE_POOL_PRE_PING,
+        "pool_recycle": settings.DATABASE_POOL_RECYCLE_SECONDS,
+    }
+
+
+# Create async engine. Connections are bound to the event loop that opened
+# them, so each process must keep one loop (see app.tasks.run_async).
 engine = create_async_engine(
-    settings.DATABASE_URL,
+    make_url(settings.DATABASE_URL).update_query_dict(
+        {"prepared_statement_cache_size": str(settings.DATABASE_STATEMENT_CACHE_SIZE)}
+    ),
     echo=settings.DEBUG,
-    poolclass=NullPool,  # For async
     future=True,
+    connect_args={
+        "statement_cache_size": settings.DATABASE_STATEMENT_CACHE_SIZE,
+        "server_settings": {"application_name": f"pricedrop-{settings.DATABASE_POOL_ROLE}"},
+    },
+    **pool_options(settings.DATABASE_POOL_ROLE),
 )
 
 # Session factory
@@ -23,6 +55,76 @@ async_session_maker = async_sessionmaker(
 )
 
 
+# ============ Pool Statistics ============
+
+POOL_STATS_KEY = "db:pool:stats"  # Hash: process -> latest stats (JSON)
+POOL_STATS_INTERVAL = 30  # Seconds between reports from one process
+POOL_STATS_MAX_AGE = 300  # Reports older than this belong to dead processes
+
+_pool_counters = {"connects": 0, "checkouts": 0}
+_last_report = 0.0
+
+
+@event.listens_for(engine.sync_engine, "connect")
+def _count_connect(dbapi_connection, connection_record):
+    _pool_counters["connects"] += 1
+
+
+@event.listens_for(engine.sync_engine, "checkout")
+def _count_checkout(dbapi_connection, connection_record, connection_proxy):
+    _pool_counters["checkouts"] += 1
+
+
+def pool_stats() -> Dict[str, Any]:
+    """
+    Connection pool state of this process
+    `connects` vs `checkouts` shows how often a session had to open a new
+    connection instead of reusing one.
+    """
+    pool = engine.pool
+    return {
+        "process": f"{socket.gethostname()}:{os.getpid()}",
+        "role": settings.DATABASE_POOL_ROLE,
+        "pool_size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "connects": _pool_counters["connects"],
+        "checkouts": _pool_counters["checkouts"],
+        "reported_at": time.time(),
+    }
+
+
+def report_pool_stats(force: bool = False):
+    """Publish this process's pool stats for GET /ops/db-pools (throttled)"""
+    global _last_report
+    now = time.time()
+    if not force and now - _last_report < POOL_STATS_INTERVAL:
+        return
+    _last_report = now
+
+    from app.redis_client import get_redis
+    stats = pool_stats()
+    get_redis().hset(POOL_STATS_KEY, stats["process"], json.dumps(stats))
+
+
+def reported_pool_stats() -> List[Dict[str, Any]]:
+    """Recent pool stats published by all processes"""
+    from app.redis_client import get_redis
+    r = get_redis()
+    reports = []
+    stale = []
+    for process, raw in r.hgetall(POOL_STATS_KEY).items():
+        stats = json.loads(raw)
+        if time.time() - stats["reported_at"] > POOL_STATS_MAX_AGE:
+            stale.append(process)
+        else:
+            reports.append(stats)
+    if stale:
+        r.hdel(POOL_STATS_KEY, *stale)
+    return sorted(reports, key=lambda stats: (stats["role"], stats["process"]))
+
+
 async def get_db() -> AsyncSession:
     """Dependency for getting async database session"""
     async with async_session_maker() as session:
@@ -36,11 +138,32 @@ async def get_db() -> AsyncSession:
             await session.close()
 
 
+# Columns added to existing tables after their first release (create_all skips them)
+_ADDED_COLUMNS = [
+    "ALTER TABLE products ADD COLUMN IF NOT EXISTS permanent_failures INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE products ADD COLUMN IF NOT EXISTS dead_since TIMESTAMP WITH TIME ZONE",
+    "ALTER TABLE price_history ADD COLUMN IF NOT EXISTS last_seen_at TIMESTAMP WITH TIME ZONE",
+    "ALTER TABLE price_history ADD COLUMN IF NOT EXISTS observations INTEGER NOT NULL DEFAULT 1",
+    "ALTER TABLE products ADD COLUMN IF NOT EXISTS next_crawl_at TIMESTAMP WITH TIME ZONE",
+    # create_all only indexes new tables
+    "CREATE INDEX IF NOT EXISTS ix_products_due ON products (is_active, next_crawl_at)",
+]
+
+
 async def init_db():
     """Initialize database tables"""
     from app.models import Base
+    from app.services.history_partitions import ensure_partitions, is_partitioned
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        for statement in _ADDED_COLUMNS:
+            await conn.execute(text(statement))
+        if await is_partitioned(conn):
+            await ensure_partitions(conn)
+        else:
+            logger.warning(
+                "price_history is not partitioned; run python -m app.services.history_partitions migrate"
+            )
 
 
 async def close_db():
@@ -0,0 +1,55 @@
+"""
+Identifiers
+Time-ordered UUIDs (version 7) for high-insert tables
+
+A v7 UUID starts with its creation time in Unix milliseconds, so new keys
+sort after existing ones and inserts append to the right edge of the primary
+key B-tree instead of splitting random pages. Within one millisecond, a
+12-bit counter keeps keys from this process increasing.
+
+v7 keys share the UUID column type with the v4 keys already stored, so no
+rewrite is needed: old rows keep their keys and only new rows get v7 ones.
+The old random keys stop receiving neighbours, so page splits stop at
+once. Index bloat left by v4 inserts can be reclaimed later with
+REINDEX INDEX CONCURRENTLY. For price_history it also goes away as v4-era
+partitions pass retention.
+"""
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Optional
+
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+
+def uuid7() -> uuid.UUID:
+    """New time-ordered UUID (RFC 9562 version 7)"""
+    global _last_ms, _counter
+    with _lock:
+        ms = time.time_ns() // 1_000_000
+        if ms > _last_ms:
+            _last_ms = ms
+            # Random start in the lower half leaves room to count up
+            _counter = int.from_bytes(os.urandom(2), "big") & 0x7FF
+        else:
+            # Same millisecond (or the clock stepped back): keep increasing
+            _counter += 1
+            if _counter > 0xFFF:
+                _last_ms += 1
+                _counter = 0
+        ms, counter = _last_ms, _counter
+
+    rand_b = int.from_bytes(os.urandom(8), "big") & ((1 << 62) - 1)
+    value = (ms & ((1 << 48) - 1)) << 80 | 0x7 << 76 | counter << 64 | 0b10 << 62 | rand_b
+    return uuid.UUID(int=value)
+
+
+def uuid7_time(value: uuid.UUID) -> Optional[datetime]:
+    """Creation time embedded in a v7 UUID (None for other versions, e.g. older v4 keys)"""
+    if value.version != 7:
+        return None
+    return datetime.fromtimestamp((value.int >> 80) / 1000, tz=timezone.utc)
@@ -43,11 +43,10 @@ async def lifespan(app: FastAPI):
     logger.info("Shutting down...")
     await close_db()
     
-    # Close crawler if running
-    from app.crawler import get_crawler
+    # Close crawler if one was started in this process (crawls run on workers)
+    from app.crawler import close_crawler
     try:
-        crawler = await get_crawler()
-        await crawler.close()
+        await close_crawler()
     except Exception:
         pass
 
@@ -127,12 +126,14 @@ async def root():
 
 
 # Include routers
-from app.api import auth, products, alerts, stats
+from app.api import auth, products, alerts, stats, ops, crawl_jobs
 
 app.include_router(auth.router, prefix="/api/v1")
 app.include_router(products.router, prefix="/api/v1")
+app.include_router(crawl_jobs.router, prefix="/api/v1")
 app.include_router(alerts.router, prefix="/api/v1")
 app.include_router(stats.router, prefix="/api/v1")
+app.include_router(ops.router, prefix="/api/v1")
 
 
 if __name__ == "__main__":
@@ -15,6 +15,8 @@ from sqlalchemy.orm import DeclarativeBase, relationship, Mapped, mapped_column
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 import uuid
 
+from app.ids import uuid7
+
 
 class Base(DeclarativeBase):
     pass
@@ -99,7 +101,7 @@ class Product(Base):
     """Tracked product model"""
     __tablename__ = "products"
     
-    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
     
     # Product Info
@@ -121,10 +123,15 @@ class Product(Base):
     # Crawl Info
     domain: Mapped[str] = mapped_column(String(255), nullable=False, index=True)
     last_crawled_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
+    # Stored next_crawl_at(), set with every crawl so dispatch reads only due rows
+    next_crawl_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
     last_crawl_status: Mapped[CrawlStatus] = mapped_column(
         Enum(CrawlStatus), default=CrawlStatus.PENDING
     )
     crawl_error: Mapped[Optional[str]] = mapped_column(Text)
+    # Negative cache: dead products (gone, or unparseable for many crawls) are only probed
+    permanent_failures: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    dead_since: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
     
     # Metadata
     extra_data: Mapped[Optional[dict]] = mapped_column(JSONB)
@@ -150,17 +157,25 @@ class Product(Base):
     __table_args__ = (
         Index("ix_products_user_active", "user_id", "is_active"),
         Index("ix_products_last_crawled", "last_crawled_at"),
+        Index("ix_products_due", "is_active", "next_crawl_at"),
     )
     
     def __repr__(self):
         return f"<Product {self.name[:30]}>"
+    
+    @property
+    def tracking_status(self) -> str:
+        """User-facing crawl state: "tracking", or "dead" while only probed"""
+        return "dead" if self.dead_since else "tracking"
 
 
 class PriceHistory(Base):
     """Price history tracking"""
     __tablename__ = "price_history"
     
-    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    # Partitioned by month on recorded_at (see app.services.history_partitions),
+    # so the partition key is part of the primary key
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     product_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("products.id"), nullable=False)
     
     price: Mapped[Decimal] = mapped_column(Numeric(10, 2), nullable=False)
@@ -168,7 +183,12 @@ class PriceHistory(Base):
     
     is_available: Mapped[bool] = mapped_column(Boolean, default=True)
     
-    recorded_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow, index=True)
+    recorded_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), primary_key=True, default=datetime.utcnow, index=True
+    )
+    # Run-length storage (PRICE_HISTORY_MODE=runs): repeats of this price extend the row
+    last_seen_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
+    observations: Mapped[int] = mapped_column(Integer, default=1, server_default="1")
     
     # Relationships
     product: Mapped["Product"] = relationship("Product", back_populates="price_history")
@@ -176,12 +196,54 @@ class PriceHistory(Base):
     # Indexes
     __table_args__ = (
         Index("ix_price_history_product_date", "product_id", "recorded_at"),
+        {"postgresql_partition_by": "RANGE (recorded_at)"},
     )
     
     def __repr__(self):
         return f"<PriceHistory ${self.price} at {self.recorded_at}>"
 
 
+class PriceRollupMixin:
+    """
+    Per-product summary of the observations in one time bucket
+    Maintained incrementally as results land (see app.services.price_rollups).
+    """
+    product_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("products.id"), primary_key=True)
+    bucket: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    
+    # OHLC; open/close belong to the earliest/latest observation seen so far
+    open_price: Mapped[Decimal] = mapped_column(Numeric(10, 2), nullable=False)
+    high_price: Mapped[Decimal] = mapped_column(Numeric(10, 2), nullable=False)
+    low_price: Mapped[Decimal] = mapped_column(Numeric(10, 2), nullable=False)
+    close_price: Mapped[Decimal] = mapped_column(Numeric(10, 2), nullable=False)
+    close_available: Mapped[bool] = mapped_column(Boolean, nullable=False)
+    opened_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    closed_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    
+    # Running totals for the average and availability fraction
+    price_sum: Mapped[Decimal] = mapped_column(Numeric(16, 2), nullable=False)
+    observations: Mapped[int] = mapped_column(Integer, nullable=False)
+    available_observations: Mapped[int] = mapped_column(Integer, nullable=False)
+    
+    @property
+    def average_price(self) -> Decimal:
+        return self.price_sum / self.observations
+    
+    @property
+    def availability(self) -> float:
+        return self.available_observations / self.observations
+
+
+class PriceHistoryHourly(PriceRollupMixin, Base):
+    """Hourly price rollups"""
+    __tablename__ = "price_history_hourly"
+
+
+class PriceHistoryDaily(PriceRollupMixin, Base):
+    """Daily price rollups"""
+    __tablename__ = "price_history_daily"
+
+
 class AlertType(str, PyEnum):
     PRICE_DROP = "price_drop"
     TARGET_REACHED = "target_reached"
@@ -199,7 +261,7 @@ class Alert(Base):
     """User alerts/notifications"""
     __tablename__ = "alerts"
     
-    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
     product_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("products.id"), nullable=False)
     
@@ -262,3 +324,41 @@ class SupportedSite(Base):
     
     def __repr__(self):
         return f"<SupportedSite {self.domain}>"
+
+
+class SweepStatus(str, PyEnum):
+    RUNNING = "running"
+    COMPLETED = "completed"
+    ABANDONED = "abandoned"
+
+
+class CrawlSweep(Base):
+    """One pass of bulk crawl dispatch over due products, with a resumable cursor"""
+    __tablename__ = "crawl_sweeps"
+    
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    status: Mapped[SweepStatus] = mapped_column(Enum(SweepStatus), default=SweepStatus.RUNNING)
+    
+    # Candidate set: products due by the cutoff, walked in ID order
+    cutoff: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    cursor: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True))
+    
+    # Progress
+    scanned: Mapped[int] = mapped_column(Integer, default=0)
+    dispatched: Mapped[int] = mapped_column(Integer, default=0)
+    succeeded: Mapped[int] = mapped_column(Integer, default=0)
+    failed: Mapped[int] = mapped_column(Integer, default=0)
+    ticks: Mapped[int] = mapped_column(Integer, default=0)
+    
+    # Timestamps
+    started_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
+    
+    # Indexes
+    __table_args__ = (
+        Index("ix_crawl_sweeps_status_started", "status", "started_at"),
+    )
+    
+    def __repr__(self):
+        return f"<CrawlSweep {self.id} {self.status}>"
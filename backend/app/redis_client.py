@@ -0,0 +1,39 @@
+"""
+Redis Client Helpers
+Shared connections for caching, coordination and metrics
+"""
+from typing import Optional
+
+import redis
+import redis.asyncio as aioredis
+
+from app.config import settings
+
+# Process-wide clients (redis-py pools are fork-aware and thread-safe)
+_client: Optional[redis.Redis] = None
+_async_client: Optional[aioredis.Redis] = None
+_broker_client: Optional[redis.Redis] = None
+
+
+def get_redis() -> redis.Redis:
+    """Get synchronous Redis client (Celery tasks, beat, CLI tools)"""
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    return _client
+
+
+def get_async_redis() -> aioredis.Redis:
+    """Get asyncio Redis client (API request handlers)"""
+    global _async_client
+    if _async_client is None:
+        _async_client = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+    return _async_client
+
+
+def get_broker_redis() -> redis.Redis:
+    """Get Redis client for the Celery broker database (queue inspection)"""
+    global _broker_client
+    if _broker_client is None:
+        _broker_client = redis.Redis.from_url(settings.CELERY_BROKER_URL)
+    return _broker_client
@@ -0,0 +1,6 @@
+# Scheduler Module
+from app.scheduler.fair_share import (
+    DeficitRoundRobin, record_queue_wait, get_queue_wait_stats, summarize_waits
+)
+
+__all__ = ["DeficitRoundRobin", "record_queue_wait", "get_queue_wait_stats", "summarize_waits"]
@@ -0,0 +1,89 @@
+"""
+Crawl Queue Admission Control
+Inspect broker queue depth and age before enqueueing more bulk work
+"""
+import base64
+import json
+import time
+from typing import List, Optional
+
+import structlog
+
+from app.celery_app import celery_app
+from app.config import settings
+from app.redis_client import get_broker_redis
+
+logger = structlog.get_logger()
+
+# Kombu's Redis transport keeps one list per priority step: "<queue>\x06\x16<step>"
+PRIORITY_SEP = "\x06\x16"
+PRIORITY_STEPS = celery_app.conf.broker_transport_options.get("priority_steps", [0, 3, 6, 9])
+
+
+def queue_keys(queue: str):
+    """Broker list keys backing a queue, highest priority first"""
+    return [queue if step == 0 else f"{queue}{PRIORITY_SEP}{step}" for step in PRIORITY_STEPS]
+
+
+def queue_depth(queue: str) -> int:
+    """Number of messages waiting in a broker queue (all priority steps)"""
+    r = get_broker_redis()
+    pipe = r.pipeline(transaction=False)
+    for key in queue_keys(queue):
+        pipe.llen(key)
+    return sum(pipe.execute())
+
+
+def _message_enqueued_at(raw: bytes) -> Optional[float]:
+    """Extract our `enqueued_at` kwarg from a raw kombu message"""
+    try:
+        message = json.loads(raw)
+        body = message["body"]
+        if message.get("properties", {}).get("body_encoding") == "base64":
+            body = base64.b64decode(body)
+        _args, kwargs, _embed = json.loads(body)
+        return kwargs.get("enqueued_at")
+    except Exception:
+        return None
+
+
+def oldest_task_age(queue: str) -> Optional[float]:
+    """Age in seconds of the oldest waiting task, if it carries an enqueue time"""
+    r = get_broker_redis()
+    pipe = r.pipeline(transaction=False)
+    for key in queue_keys(queue):
+        pipe.lindex(key, -1)  # LPUSH/BRPOP: oldest message sits at the tail
+
+    timestamps = [
+        ts for ts in (_message_enqueued_at(raw) for raw in pipe.execute() if raw)
+        if ts is not None
+    ]
+    if not timestamps:
+        return None
+    return max(0.0, time.time() - min(timestamps))
+
+
+def admission_verdict(depth: int, oldest_age: Optional[float]) -> Optional[str]:
+    """
+    Admission policy for observed queue state (also used by the simulator)
+    Returns a reason string when the queues are saturated, None when admitted
+    """
+    if depth >= settings.CRAWL_QUEUE_MAX_DEPTH:
+        return f"queue depth {depth} >= {settings.CRAWL_QUEUE_MAX_DEPTH}"
+    if oldest_age is not None and oldest_age >= settings.CRAWL_QUEUE_MAX_AGE_SECONDS:
+        return f"oldest task age {oldest_age:.0f}s >= {settings.CRAWL_QUEUE_MAX_AGE_SECONDS}s"
+    return None
+
+
+def admission_check(queues: List[str]) -> Optional[str]:
+    """
+    Decide whether more bulk crawl work may be enqueued
+    Returns a reason string when the queues are saturated, None when admitted
+    """
+    depth = sum(queue_depth(queue) for queue in queues)
+    verdict = admission_verdict(depth, None)
+    if verdict:
+        return verdict
+
+    ages = [age for age in (oldest_task_age(queue) for queue in queues) if age is not None]
+    return admission_verdict(depth, max(ages) if ages else None)
@@ -0,0 +1,58 @@
+"""
+Beat Tick Claims
+At-most-once execution of periodic tasks per scheduled tick
+
+Beat runs on several nodes under RedBeat, which lets only the holder of its
+Redis lock dispatch. A failover can still send one tick twice: the old leader
+publishes just before its lock lapses and the new leader publishes again on
+takeover. Periodic tasks claim their tick first, so the second copy is a no-op.
+
+A tick is identified by the period-sized slot its message was scheduled in
+(floor(time / period)). Beat schedules are aligned to those slots (see
+app.celery_app), so both copies of a tick fall in the same slot however late
+either one runs.
+"""
+import time
+from datetime import datetime
+from typing import Any, Optional
+
+import structlog
+
+from app.redis_client import get_redis
+
+logger = structlog.get_logger()
+
+TICK_CLAIM_KEY = "beat:tick:{name}:{tick}"
+
+# Header stamped on every published message (see app.celery_app)
+SENT_AT_HEADER = "sent_at"
+
+
+def scheduled_time(request: Any) -> float:
+    """
+    When a task's message was meant to run: its eta, else its publish time
+    Falls back to now for messages published without the header.
+    """
+    eta = getattr(request, "eta", None)
+    if eta:
+        return (eta if isinstance(eta, datetime) else datetime.fromisoformat(eta)).timestamp()
+    sent_at = getattr(request, SENT_AT_HEADER, None)
+    if sent_at is not None:
+        return float(sent_at)
+    return time.time()
+
+
+def claim_tick(name: str, period_seconds: float, at: Optional[float] = None) -> bool:
+    """
+    Claim the tick of a periodic task scheduled at `at` (default: now)
+    Returns False when another copy of this tick already ran. The claim
+    outlives the tick by a period, so a copy delayed in the queue still
+    finds it.
+    """
+    at = time.time() if at is None else at
+    tick = int(at // period_seconds)
+    ttl_ms = max(1, int(period_seconds * 2 * 1000))
+    claimed = get_redis().set(TICK_CLAIM_KEY.format(name=name, tick=tick), 1, nx=True, px=ttl_ms)
+    if not claimed:
+        logger.info("Duplicate beat tick skipped", task=name, tick=tick)
+    return bool(claimed)
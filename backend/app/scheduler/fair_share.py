@@ -0,0 +1,153 @@
+"""
+Fair-Share Crawl Dispatch
+Deficit round-robin ordering of crawl work across users, plus queue-wait metrics
+"""
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Hashable, List, Optional, Tuple
+
+import structlog
+
+from app.redis_client import get_redis
+
+logger = structlog.get_logger()
+
+# Redis keys for queue-wait metrics
+QUEUE_WAIT_KEY = "crawl:queue_wait:{user_id}"
+QUEUE_WAIT_USERS_KEY = "crawl:queue_wait:users"
+QUEUE_WAIT_SAMPLES = 200  # Recent samples kept per user
+QUEUE_WAIT_TTL = 7 * 86400  # Forget users idle for a week
+
+
+class DeficitRoundRobin:
+    """
+    Deficit round-robin scheduler over per-flow FIFO queues
+
+    Every flow (a user) earns `quantum * weight` credit each round and
+    dispatches items while its credit covers their cost. A user tracking
+    hundreds of products therefore gets a bounded share of each round
+    instead of pushing everyone else to the back of the crawl queue.
+    """
+
+    def __init__(self, quantum: float = 1.0):
+        self.quantum = quantum
+        self._queues: Dict[Hashable, Deque[Tuple[Any, float]]] = {}
+        self._weights: Dict[Hashable, float] = {}
+        self._deficits: Dict[Hashable, float] = {}
+        self._active: Deque[Hashable] = deque()
+        self._credited = False  # Head flow already received this round's quantum
+
+    def __len__(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def push(self, flow: Hashable, item: Any, weight: float = 1.0, cost: float = 1.0):
+        """Queue an item for a flow"""
+        if weight <= 0:
+            raise ValueError("Flow weight must be positive")
+
+        if flow not in self._queues:
+            self._queues[flow] = deque()
+            self._deficits[flow] = 0.0
+            self._active.append(flow)
+
+        self._weights[flow] = weight
+        self._queues[flow].append((item, cost))
+
+    def pop(self) -> Optional[Tuple[Hashable, Any]]:
+        """Return the next (flow, item) in fair-share order, or None when empty"""
+        while self._active:
+            flow = self._active[0]
+            queue = self._queues[flow]
+
+            if not self._credited:
+                self._deficits[flow] += self.quantum * self._weights[flow]
+                self._credited = True
+
+            item, cost = queue[0]
+            if cost <= self._deficits[flow]:
+                queue.popleft()
+                self._deficits[flow] -= cost
+
+                # Idle flows don't bank credit (standard DRR)
+                if not queue:
+                    self._active.popleft()
+                    del self._queues[flow]
+                    del self._deficits[flow]
+                    del self._weights[flow]
+                    self._credited = False
+
+                return flow, item
+
+            # Out of credit for this round - move to the back
+            self._active.rotate(-1)
+            self._credited = False
+
+        return None
+
+    def drain(self):
+        """Yield all queued (flow, item) pairs in fair-share order"""
+        while True:
+            entry = self.pop()
+            if entry is None:
+                return
+            yield entry
+
+
+def summarize_waits(samples: List[float]) -> Dict[str, float]:
+    """Compute count and percentile summary for queue-wait samples"""
+    if not samples:
+        return {"count": 0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+
+    ordered = sorted(samples)
+
+    def percentile(p: float) -> float:
+        index = min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))
+        return round(ordered[index], 3)
+
+    return {
+        "count": len(ordered),
+        "p50": percentile(0.50),
+        "p95": percentile(0.95),
+        "max": round(ordered[-1], 3),
+    }
+
+
+def record_queue_wait(user_id: str, wait_seconds: float):
+    """Record how long a crawl task waited in the queue for a user"""
+    r = get_redis()
+    key = QUEUE_WAIT_KEY.format(user_id=user_id)
+
+    pipe = r.pipeline(transaction=False)
+    pipe.lpush(key, round(max(wait_seconds, 0.0), 3))
+    pipe.ltrim(key, 0, QUEUE_WAIT_SAMPLES - 1)
+    pipe.expire(key, QUEUE_WAIT_TTL)
+    pipe.zadd(QUEUE_WAIT_USERS_KEY, {user_id: time.time()})
+    pipe.execute()
+
+
+def get_queue_wait_stats(user_id: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+    """
+    Get queue-wait summaries per user
+    Returns a single user's stats, or the most recently active users sorted by p95
+    """
+    r = get_redis()
+
+    if user_id:
+        user_ids = [user_id]
+    else:
+        # Drop users whose samples have expired
+        r.zremrangebyscore(QUEUE_WAIT_USERS_KEY, 0, time.time() - QUEUE_WAIT_TTL)
+        user_ids = r.zrevrange(QUEUE_WAIT_USERS_KEY, 0, limit - 1)
+
+    pipe = r.pipeline(transaction=False)
+    for uid in user_ids:
+        pipe.lrange(QUEUE_WAIT_KEY.format(user_id=uid), 0, -1)
+
+    stats = []
+    for uid, samples in zip(user_ids, pipe.execute()):
+        summary = summarize_waits([float(s) for s in samples])
+        summary["user_id"] = uid
+        stats.append(summary)
+
+    stats.sort(key=lambda s: s["p95"], reverse=True)
+    return stats
@@ -0,0 +1,58 @@
+"""
+Crawl Retry Policies
+Per-failure-kind retry limits with exponential backoff and jitter
+"""
+import random
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from app.crawler.engine import FailureKind
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    Retry limit and backoff for one kind of failure
+    Retry n (0-based) waits a random time in [cap/2, cap], where
+    cap = min(max_delay, base_delay * 2**n). The jitter spreads retries
+    of a failure burst (one retailer timing out) across the window.
+    """
+    max_retries: int
+    base_delay: float  # Seconds
+    max_delay: float
+
+    def delay(self, attempt: int, rng: random.Random = random) -> Optional[float]:
+        """Seconds to wait before retry number `attempt`, or None when exhausted"""
+        if attempt >= self.max_retries:
+            return None
+        cap = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return rng.uniform(cap / 2, cap)
+
+
+# Delays stay well under the Redis broker's visibility timeout (1 h), after
+# which a countdown task held by a worker would be redelivered.
+RETRY_POLICIES: Dict[str, RetryPolicy] = {
+    # Slow retailer or a bad moment: usually fine a few minutes later
+    FailureKind.TIMEOUT.value: RetryPolicy(max_retries=3, base_delay=120, max_delay=900),
+    FailureKind.NETWORK.value: RetryPolicy(max_retries=4, base_delay=60, max_delay=900),
+    # Retrying a bot wall quickly only deepens the block
+    FailureKind.BLOCKED.value: RetryPolicy(max_retries=2, base_delay=900, max_delay=1800),
+    # Layout glitches sometimes clear on reload; persistent ones won't
+    FailureKind.PARSE.value: RetryPolicy(max_retries=1, base_delay=300, max_delay=300),
+    # Gone is gone
+    FailureKind.NOT_FOUND.value: RetryPolicy(max_retries=0, base_delay=0, max_delay=0),
+}
+
+
+def will_retry(failure_kind: Optional[str], attempt: int) -> bool:
+    """Whether a failure on attempt `attempt` (0-based) is crawled again"""
+    policy = RETRY_POLICIES.get(failure_kind) if failure_kind else None
+    return policy is not None and attempt < policy.max_retries
+
+
+def retry_delay(failure_kind: Optional[str], attempt: int, rng: random.Random = random) -> Optional[float]:
+    """Backoff before the next retry of a failed crawl, or None to give up"""
+    policy = RETRY_POLICIES.get(failure_kind) if failure_kind else None
+    if policy is None:
+        return None
+    return policy.delay(attempt, rng)
@@ -0,0 +1,221 @@
+"""
+Domain-Affinity Crawl Routing
+Consistent hashing of retailer domains onto bulk crawl workers
+"""
+import bisect
+import hashlib
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+import structlog
+from celery.signals import celeryd_after_setup, worker_ready, worker_shutdown
+
+from app.celery_app import QUEUE_CRAWL_BULK
+from app.config import settings
+from app.redis_client import get_redis, get_broker_redis
+from app.scheduler.admission import queue_keys, queue_depth
+
+logger = structlog.get_logger()
+
+NODES_KEY = "crawl:nodes"  # Sorted set: node name -> last heartbeat
+NODE_QUEUE = QUEUE_CRAWL_BULK + ".{node}"
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+def domain_group(domain: Optional[str]) -> str:
+    """
+    Map a domain to its affinity group
+    Regional storefronts of one retailer (amazon.com, amazon.de, ...) share
+    browser state and should land on the same workers.
+    """
+    if not domain:
+        return ""
+    for prefix, group in settings.CRAWL_DOMAIN_GROUPS.items():
+        if domain.startswith(prefix):
+            return group
+    return domain
+
+
+class HashRing:
+    """
+    Consistent-hash ring with virtual nodes
+    Adding or removing a node only remaps the keys adjacent to its points.
+    """
+
+    def __init__(self, nodes: List[str], replicas: int = 100):
+        self.nodes = sorted(set(nodes))
+        self._points: List[int] = []
+        self._owners: Dict[int, str] = {}
+        for node in self.nodes:
+            for i in range(replicas):
+                point = _hash(f"{node}#{i}")
+                self._owners[point] = node
+                self._points.append(point)
+        self._points.sort()
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def preference_list(self, key: str) -> Iterator[str]:
+        """Yield distinct nodes clockwise from the key's position"""
+        if not self._points:
+            return
+        seen = set()
+        start = bisect.bisect(self._points, _hash(key))
+        for i in range(len(self._points)):
+            node = self._owners[self._points[(start + i) % len(self._points)]]
+            if node not in seen:
+                seen.add(node)
+                yield node
+                if len(seen) == len(self.nodes):
+                    return
+
+    def node_for(self, key: str) -> Optional[str]:
+        """Primary node for a key"""
+        return next(self.preference_list(key), None)
+
+
+def affinity_max_depth() -> int:
+    """Crawls a worker's queue may hold: CRAWL_AFFINITY_MAX_BACKLOG_MINUTES at its rate limit"""
+    return max(1, int(settings.CRAWL_NODE_CRAWLS_PER_MINUTE * settings.CRAWL_AFFINITY_MAX_BACKLOG_MINUTES))
+
+
+class DomainRouter:
+    """
+    Per-dispatch routing of crawl tasks to worker queues
+    Uses bounded-load consistent hashing: a domain goes to its primary worker
+    unless that worker's queue is full, then to the next worker on the ring,
+    and finally to the shared bulk queue. Depths count crawls, not messages.
+    """
+
+    def __init__(self, nodes: List[str], max_depth: Optional[int] = None, depths: Optional[Dict[str, int]] = None):
+        self.ring = HashRing(nodes)
+        self.max_depth = max_depth if max_depth is not None else affinity_max_depth()
+        self._depths = dict(depths or {})
+
+    @classmethod
+    def from_live_nodes(cls) -> "DomainRouter":
+        """Build a router from registered workers, reclaiming work from dead ones"""
+        reclaim_dead_nodes()
+        nodes = live_nodes()
+        # A batch message carries up to CRAWL_TASK_BATCH_SIZE crawls
+        depths = {
+            node: queue_depth(NODE_QUEUE.format(node=node)) * settings.CRAWL_TASK_BATCH_SIZE
+            for node in nodes
+        }
+        return cls(nodes, depths=depths)
+
+    @property
+    def queues(self) -> List[str]:
+        """Affinity queues of all nodes in the ring"""
+        return [NODE_QUEUE.format(node=node) for node in self.ring.nodes]
+
+    def queue_for(self, domain: Optional[str]) -> str:
+        """Pick the queue for one crawl and account for it"""
+        for node in self.ring.preference_list(domain_group(domain)):
+            if self._depths.get(node, 0) < self.max_depth:
+                self._depths[node] = self._depths.get(node, 0) + 1
+                return NODE_QUEUE.format(node=node)
+        return QUEUE_CRAWL_BULK
+
+
+# ============ Worker Membership ============
+
+def live_nodes() -> List[str]:
+    """Bulk crawl workers with a recent heartbeat"""
+    cutoff = time.time() - settings.CRAWL_NODE_TTL_SECONDS
+    return get_redis().zrangebyscore(NODES_KEY, cutoff, "+inf")
+
+
+def register_node(node: str):
+    """Record a heartbeat for a worker node"""
+    get_redis().zadd(NODES_KEY, {node: time.time()})
+
+
+def _requeue_node_queue(node: str) -> int:
+    """Move a node's waiting tasks back onto the shared bulk queue"""
+    broker = get_broker_redis()
+    moved = 0
+    for source, target in zip(queue_keys(NODE_QUEUE.format(node=node)), queue_keys(QUEUE_CRAWL_BULK)):
+        # Oldest messages sit at the tail; keep their order on the shared queue
+        while broker.lmove(source, target, "RIGHT", "LEFT") is not None:
+            moved += 1
+    return moved
+
+
+def retire_node(node: str):
+    """Take a worker out of the ring immediately (its backlog is reclaimed by dispatch)"""
+    get_redis().zadd(NODES_KEY, {node: time.time() - settings.CRAWL_NODE_TTL_SECONDS - 1})
+
+
+def reclaim_dead_nodes():
+    """
+    Hand the backlog of dead workers to the shared bulk queue (rebalancing)
+    Dead nodes stay on the list for a grace period, because unacked tasks
+    they held are restored to their queue only after the broker's
+    visibility timeout.
+    """
+    r = get_redis()
+    now = time.time()
+    cutoff = now - settings.CRAWL_NODE_TTL_SECONDS
+    forget_before = cutoff - settings.CRAWL_NODE_RECLAIM_GRACE_SECONDS
+
+    for node in r.zrangebyscore(NODES_KEY, "-inf", cutoff):
+        moved = _requeue_node_queue(node)
+        if moved:
+            logger.info("Reclaimed crawl node backlog", node=node, requeued=moved)
+
+    r.zremrangebyscore(NODES_KEY, "-inf", forget_before)
+
+
+_node_name: Optional[str] = None
+_heartbeat_stop = threading.Event()
+
+
+@celeryd_after_setup.connect
+def _setup_node_queue(sender, instance, **kwargs):
+    """Bulk crawl workers also consume their own affinity queue"""
+    global _node_name
+    if not settings.CRAWL_DOMAIN_AFFINITY:
+        return
+
+    queues = instance.app.amqp.queues
+    consuming = queues.consume_from
+    if consuming and QUEUE_CRAWL_BULK not in consuming:
+        return  # Not a bulk crawl worker
+
+    _node_name = settings.CRAWL_NODE_NAME or sender
+    queues.select_add(NODE_QUEUE.format(node=_node_name))
+
+
+@worker_ready.connect
+def _start_heartbeat(**kwargs):
+    if not _node_name:
+        return
+
+    def beat():
+        while not _heartbeat_stop.is_set():
+            try:
+                register_node(_node_name)
+            except Exception as e:
+                logger.warning("Crawl node heartbeat failed", node=_node_name, error=str(e))
+            _heartbeat_stop.wait(settings.CRAWL_NODE_TTL_SECONDS / 3)
+
+    threading.Thread(target=beat, name="crawl-node-heartbeat", daemon=True).start()
+    logger.info("Crawl node joined ring", node=_node_name)
+
+
+@worker_shutdown.connect
+def _stop_heartbeat(**kwargs):
+    if not _node_name:
+        return
+    _heartbeat_stop.set()
+    try:
+        retire_node(_node_name)
+        logger.info("Crawl node left ring", node=_node_name)
+    except Exception as e:
+        logger.warning("Failed to retire crawl node", node=_node_name, error=str(e))
@@ -0,0 +1,412 @@
+"""
+Crawl Capacity Simulator
+Discrete-event replay of crawl scheduling for worker capacity planning
+
+Runs entirely offline (no Redis, database or browser) but drives the same
+policy code as production: phase-spread due times and domain windows
+(next_crawl_at / is_crawl_due), fair-share dispatch (schedule_due_page),
+admission control (admission_verdict), domain-affinity routing (DomainRouter)
+and failure-classified retries (retry_delay). Current settings apply, so
+environment overrides such as CRAWL_INTERVAL_HOURS are simulated too.
+
+Workers are grouped into worker nodes of --node-concurrency slots (one per
+affinity node when --nodes is set). With per-product tasks
+(CRAWL_TASK_BATCH_SIZE 1) each node starts at most
+CRAWL_NODE_CRAWLS_PER_MINUTE crawls a minute, like the Celery rate_limit on
+crawl_single_product; batch tasks are not rate limited.
+
+Per-domain behaviour comes from a JSON profile of recorded crawls:
+
+    {"domains": {"amazon.com": {"share": 0.6,
+                                "durations": [4.1, 5.3, 9.8],
+                                "failures": {"timeout": 0.03, "blocked": 0.01},
+                                "rate_per_minute": 30}}}
+
+`share` is the fraction of tracked products on the domain, `durations` are
+crawl times in seconds (sampled with replacement), `failures` maps failure
+kinds to per-attempt probabilities and `rate_per_minute` caps crawl starts.
+
+    python -m app.scheduler.simulator --profile domains.json --products 50000 \\
+        --tiers free=0.8,pro=0.2 --workers 20,40,80 --node-concurrency 4 --hours 48
+"""
+import argparse
+import heapq
+import json
+import random
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from app.celery_app import QUEUE_CRAWL_BULK
+from app.config import settings
+from app.models import SubscriptionTier
+from app.scheduler.admission import admission_verdict
+from app.scheduler.fair_share import summarize_waits
+from app.scheduler.retry import retry_delay
+from app.scheduler.routing import DomainRouter, NODE_QUEUE
+from app.tasks.crawler_tasks import crawl_interval_seconds, crawl_phase, next_crawl_at, schedule_due_page
+
+
+@dataclass
+class DomainProfile:
+    """Recorded crawl behaviour of one retailer domain"""
+    domain: str
+    share: float = 1.0
+    durations: List[float] = field(default_factory=lambda: [6.0])
+    failures: Dict[str, float] = field(default_factory=dict)
+    rate_per_minute: Optional[float] = None
+
+    def sample_duration(self, rng: random.Random) -> float:
+        return rng.choice(self.durations)
+
+    def sample_failure(self, rng: random.Random) -> Optional[str]:
+        """Failure kind of one crawl attempt, or None when it succeeds"""
+        draw = rng.random()
+        for kind, rate in self.failures.items():
+            if draw < rate:
+                return kind
+            draw -= rate
+        return None
+
+
+def load_profile(path: Optional[str]) -> List[DomainProfile]:
+    """Domain profiles from a JSON file (one generic domain when no file is given)"""
+    if not path:
+        return [DomainProfile("example.com")]
+    with open(path) as f:
+        domains = json.load(f)["domains"]
+    return [DomainProfile(domain, **spec) for domain, spec in domains.items()]
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """Parse "free=0.8,pro=0.2" into a weight mapping"""
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+@dataclass
+class SimProduct:
+    product_id: str
+    user_id: str
+    tier: SubscriptionTier
+    domain: str
+    last_crawled_at: Optional[datetime] = None
+
+
+@dataclass
+class SimTask:
+    product: SimProduct
+    due_at: float
+    enqueued_at: float
+    queue: str
+    attempt: int = 0
+    pool: int = 0  # Worker pool that ran the last attempt
+
+
+class CrawlSimulator:
+    """
+    Event-driven model of beat ticks, broker queues and crawl worker slots
+    Workers are concurrency slots; a slot waiting on a domain's or its
+    node's rate limit counts as occupied but not crawling.
+    """
+
+    def __init__(
+        self,
+        domains: List[DomainProfile],
+        products: int,
+        workers: int,
+        tiers: Dict[str, float],
+        products_per_user: int = 10,
+        new_products: int = 0,
+        nodes: int = 0,
+        node_concurrency: int = 4,
+        start: Optional[float] = None,
+        seed: int = 0,
+    ):
+        self.domains = {profile.domain: profile for profile in domains}
+        self.workers = workers
+        self.nodes = [f"sim{i}" for i in range(nodes)]
+        self.start = time.time() if start is None else start
+        self.rng = random.Random(seed)
+
+        self.now = self.start
+        self._events: List[Tuple[float, int, str, Any]] = []
+        self._seq = 0
+        self._due: List[Tuple[float, str]] = []  # (due_at, product_id)
+        self.products: Dict[str, SimProduct] = {}
+
+        # Broker queues and the worker pools consuming them (own queue first)
+        if self.nodes:
+            self.queues: Dict[str, Deque[SimTask]] = {NODE_QUEUE.format(node=n): deque() for n in self.nodes}
+            self.queues[QUEUE_CRAWL_BULK] = deque()
+            per_node, extra = divmod(workers, len(self.nodes))
+            self.pools = [
+                [per_node + (1 if i < extra else 0), [NODE_QUEUE.format(node=n), QUEUE_CRAWL_BULK]]
+                for i, n in enumerate(self.nodes)
+            ]
+        else:
+            self.queues = {QUEUE_CRAWL_BULK: deque()}
+            self.pools = [
+                [min(node_concurrency, workers - first), [QUEUE_CRAWL_BULK]]
+                for first in range(0, workers, node_concurrency)
+            ]
+        self._domain_next_start: Dict[str, float] = {}
+        # Celery's per-worker rate_limit applies to per-product tasks only
+        self.node_rate = settings.CRAWL_NODE_CRAWLS_PER_MINUTE if settings.CRAWL_TASK_BATCH_SIZE <= 1 else None
+        self._node_next_start = [0.0] * len(self.pools)
+
+        # Metrics
+        self.lateness: List[float] = []
+        self.lateness_by_tier: Dict[str, List[float]] = {}
+        self.queue_waits: List[float] = []
+        self.backlog: List[int] = []
+        self.attempts = 0
+        self.retries = 0
+        self.succeeded = 0
+        self.failed: Dict[str, int] = {}
+        self.throttled_ticks = 0
+        self.crawling_seconds = 0.0
+        self.occupied_seconds = 0.0
+
+        self._populate(products, new_products, tiers, products_per_user)
+
+    # ============ Setup ============
+
+    def _populate(self, products: int, new_products: int, tiers: Dict[str, float], products_per_user: int):
+        """Existing products start in steady state; new ones are due immediately"""
+        profiles = list(self.domains.values())
+        shares = [profile.share for profile in profiles]
+        tier_names = list(tiers)
+        tier_weights = [tiers[name] for name in tier_names]
+        interval = crawl_interval_seconds()
+
+        user_id, user_tier = None, None
+        for i in range(products + new_products):
+            if i % products_per_user == 0:
+                user_id = str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+                user_tier = SubscriptionTier(self.rng.choices(tier_names, tier_weights)[0])
+            product_id = str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+            domain = self.rng.choices(profiles, shares)[0].domain
+            product = SimProduct(product_id, user_id, user_tier, domain)
+
+            if i < products:
+                # Last crawled at its most recent slot before the simulation starts
+                phase = crawl_phase(product_id)
+                slot = phase + ((self.start - phase) // interval) * interval
+                product.last_crawled_at = datetime.fromtimestamp(slot, tz=timezone.utc)
+
+            self.products[product_id] = product
+            self._schedule_due(product)
+
+    def _schedule_due(self, product: SimProduct):
+        due_at = next_crawl_at(product.product_id, product.domain, product.last_crawled_at)
+        heapq.heappush(self._due, (max(due_at, self.start), product.product_id))
+
+    def _push_event(self, at: float, kind: str, payload: Any = None):
+        self._seq += 1
+        heapq.heappush(self._events, (at, self._seq, kind, payload))
+
+    # ============ Dispatch ============
+
+    def _queue_state(self) -> Tuple[int, Optional[float]]:
+        depth = sum(len(queue) for queue in self.queues.values())
+        heads = [queue[0].enqueued_at for queue in self.queues.values() if queue]
+        return depth, (self.now - min(heads)) if heads else None
+
+    def _tick(self):
+        """One beat dispatch tick: the due slice in one fair-share schedule, unless throttled"""
+        due = []
+        while self._due and self._due[0][0] <= self.now:
+            due.append(heapq.heappop(self._due))
+        due.sort(key=lambda entry: entry[1])  # Sweeps walk candidates by ID
+
+        # Beyond the tick's limit (or all of it when throttled): a later tick
+        limit = 0 if admission_verdict(*self._queue_state()) else settings.CRAWL_TICK_MAX_DUE
+        if limit == 0 and due:
+            self.throttled_ticks += 1
+        for entry in due[limit:]:
+            heapq.heappush(self._due, entry)
+        if due[:limit]:
+            self._dispatch_page(due[:limit])
+
+        self.backlog.append(self._queue_state()[0])
+        self._start_work()
+
+    def _dispatch_page(self, page: List[Tuple[float, str]]):
+        due_at = dict((product_id, at) for at, product_id in page)
+        rows = [
+            (p.product_id, p.user_id, p.domain, p.last_crawled_at, p.tier, None)
+            for p in (self.products[product_id] for _, product_id in page)
+        ]
+        # Due products leave the due heap, so every one of them claims
+        scheduler = schedule_due_page(rows, self.now, claim=lambda product_ids: product_ids)
+
+        router = None
+        if self.nodes:
+            depths = {node: len(self.queues[NODE_QUEUE.format(node=node)]) for node in self.nodes}
+            router = DomainRouter(self.nodes, depths=depths)
+
+        scheduled = set()
+        for _, (product_id, domain) in scheduler.drain():
+            scheduled.add(product_id)
+            queue = router.queue_for(domain) if router else QUEUE_CRAWL_BULK
+            self.queues[queue].append(SimTask(self.products[product_id], due_at[product_id], self.now, queue))
+
+        # Overdue but outside their domain's window: try again next tick
+        for product_id, at in due_at.items():
+            if product_id not in scheduled:
+                heapq.heappush(self._due, (at, product_id))
+
+    # ============ Workers ============
+
+    def _start_work(self):
+        for index, pool in enumerate(self.pools):
+            free, queue_names = pool
+            while free > 0:
+                queue = next((self.queues[name] for name in queue_names if self.queues[name]), None)
+                if queue is None:
+                    break
+                task = queue.popleft()
+                task.pool = index
+                self._run(task)
+                free -= 1
+            pool[0] = free
+
+    def _run(self, task: SimTask):
+        profile = self.domains[task.product.domain]
+        started = self.now
+        if profile.rate_per_minute:
+            started = max(started, self._domain_next_start.get(profile.domain, 0.0))
+        if self.node_rate:
+            started = max(started, self._node_next_start[task.pool])
+            self._node_next_start[task.pool] = started + 60.0 / self.node_rate
+        if profile.rate_per_minute:
+            self._domain_next_start[profile.domain] = started + 60.0 / profile.rate_per_minute
+
+        duration = profile.sample_duration(self.rng)
+        finished = started + duration
+        self.attempts += 1
+        self.crawling_seconds += duration
+        self.occupied_seconds += finished - self.now
+        self.queue_waits.append(started - task.enqueued_at)
+        if task.attempt == 0:
+            lateness = max(0.0, started - task.due_at)
+            self.lateness.append(lateness)
+            self.lateness_by_tier.setdefault(task.product.tier.value, []).append(lateness)
+
+        self._push_event(finished, "finish", (task, profile.sample_failure(self.rng)))
+
+    def _finish(self, task: SimTask, failure_kind: Optional[str]):
+        self.pools[task.pool][0] += 1
+
+        delay = retry_delay(failure_kind, task.attempt, self.rng) if failure_kind else None
+        if delay is not None:
+            self.retries += 1
+            task.attempt += 1
+            self._push_event(self.now + delay, "retry", task)
+        else:
+            if failure_kind:
+                self.failed[failure_kind] = self.failed.get(failure_kind, 0) + 1
+            else:
+                self.succeeded += 1
+            task.product.last_crawled_at = datetime.fromtimestamp(self.now, tz=timezone.utc)
+            self._schedule_due(task.product)
+        self._start_work()
+
+    # ============ Run ============
+
+    def run(self, hours: float) -> Dict[str, Any]:
+        """Simulate `hours` of operation and summarize it"""
+        end = self.start + hours * 3600
+        tick = settings.CRAWL_DISPATCH_TICK_MINUTES * 60
+        for k in range(int(hours * 3600 // tick) + 1):
+            self._push_event(self.start + k * tick, "tick")
+
+        while self._events and self._events[0][0] <= end:
+            self.now, _, kind, payload = heapq.heappop(self._events)
+            if kind == "tick":
+                self._tick()
+            elif kind == "finish":
+                self._finish(*payload)
+            elif kind == "retry":
+                payload.enqueued_at = self.now
+                self.queues[payload.queue].append(payload)
+                self._start_work()
+
+        self.now = end
+        return self.report(hours)
+
+    def report(self, hours: float) -> Dict[str, Any]:
+        capacity = self.workers * hours * 3600
+        overdue = [self.now - at for at, _ in self._due if at <= self.now]
+        overdue += [self.now - task.due_at for queue in self.queues.values() for task in queue]
+        return {
+            "workers": self.workers,
+            "nodes": len(self.nodes),
+            "worker_nodes": len(self.pools),
+            "products": len(self.products),
+            "hours": hours,
+            "attempts": self.attempts,
+            "retries": self.retries,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "throttled_ticks": self.throttled_ticks,
+            "backlog": {
+                "mean": round(sum(self.backlog) / len(self.backlog), 1) if self.backlog else 0.0,
+                "p95": summarize_waits(self.backlog)["p95"],
+                "max": max(self.backlog, default=0),
+                "final": self.backlog[-1] if self.backlog else 0,
+            },
+            "lateness": summarize_waits(self.lateness),
+            "lateness_by_tier": {tier: summarize_waits(samples) for tier, samples in self.lateness_by_tier.items()},
+            "queue_wait": summarize_waits(self.queue_waits),
+            "overdue_at_end": summarize_waits(overdue),
+            "utilization": round(self.crawling_seconds / capacity, 3) if capacity else 0.0,
+            "occupancy": round(self.occupied_seconds / capacity, 3) if capacity else 0.0,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m app.scheduler.simulator",
+        description="Simulate crawl scheduling to size the crawl worker pool",
+    )
+    parser.add_argument("--profile", help="JSON file of recorded per-domain crawl behaviour")
+    parser.add_argument("--products", type=int, default=10000, help="Tracked products in steady state")
+    parser.add_argument("--new-products", type=int, default=0, help="Products added at the start (due at once)")
+    parser.add_argument("--tiers", default="free=1", help='Subscription mix, e.g. "free=0.8,pro=0.2"')
+    parser.add_argument("--products-per-user", type=int, default=10)
+    parser.add_argument("--workers", default="10", help="Crawl slots; a comma-separated list runs each")
+    parser.add_argument("--nodes", type=int, default=0, help="Domain-affinity nodes sharing the workers (0: off)")
+    parser.add_argument("--node-concurrency", type=int, default=4, help="Crawl slots per worker node without affinity")
+    parser.add_argument("--hours", type=float, default=48.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    domains = load_profile(args.profile)
+    tiers = parse_mix(args.tiers)
+    reports = []
+    for workers in (int(w) for w in args.workers.split(",")):
+        simulator = CrawlSimulator(
+            domains,
+            products=args.products,
+            workers=workers,
+            tiers=tiers,
+            products_per_user=args.products_per_user,
+            new_products=args.new_products,
+            nodes=args.nodes,
+            node_concurrency=args.node_concurrency,
+            seed=args.seed,
+        )
+        reports.append(simulator.run(args.hours))
+    print(json.dumps(reports if len(reports) > 1 else reports[0], indent=2))
+
+
+if __name__ == "__main__":
+    main()
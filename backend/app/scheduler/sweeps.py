@@ -0,0 +1,181 @@
+"""
+Resumable Crawl Sweeps
+Persisted dispatch cursor and progress counters for bulk crawls
+
+A sweep walks the due-candidate set (products due by its cutoff) in
+product ID order. After every dispatched page the cursor is
+checkpointed, so a beat, worker or daemon restart resumes after the last
+dispatched product instead of re-scanning from the start. Completion
+counters are incremented in Redis by the crawl tasks and folded into the
+sweep row at each checkpoint.
+"""
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from uuid import UUID, uuid4
+
+import structlog
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import CrawlSweep, SweepStatus
+from app.redis_client import get_redis, get_async_redis
+
+logger = structlog.get_logger()
+
+SWEEP_PROGRESS_KEY = "crawl:sweep:{sweep_id}"  # Hash: succeeded, failed
+SWEEP_PROGRESS_TTL = 7 * 86400
+
+
+def _epoch(value: datetime) -> float:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def outcome_succeeded(outcome: Dict[str, Any]) -> bool:
+    """Whether a crawl task outcome counts as a successful crawl"""
+    return outcome.get("status") == "success" or (
+        outcome.get("status") == "published" and bool(outcome.get("success"))
+    )
+
+
+def record_sweep_progress(sweep_id: str, outcomes: List[Dict[str, Any]]):
+    """Count finished crawls against their sweep"""
+    if not outcomes:
+        return
+    succeeded = sum(1 for outcome in outcomes if outcome_succeeded(outcome))
+    key = SWEEP_PROGRESS_KEY.format(sweep_id=sweep_id)
+
+    pipe = get_redis().pipeline(transaction=False)
+    pipe.hincrby(key, "succeeded", succeeded)
+    pipe.hincrby(key, "failed", len(outcomes) - succeeded)
+    pipe.expire(key, SWEEP_PROGRESS_TTL)
+    pipe.execute()
+
+
+def _sync_counters(sweep: CrawlSweep):
+    """Copy completion counters from Redis onto the sweep row"""
+    counters = get_redis().hgetall(SWEEP_PROGRESS_KEY.format(sweep_id=sweep.id))
+    if counters:
+        sweep.succeeded = int(counters.get("succeeded", 0))
+        sweep.failed = int(counters.get("failed", 0))
+
+
+async def resume_or_start_sweep(db: AsyncSession, cutoff: datetime, max_age_seconds: float) -> CrawlSweep:
+    """
+    Resume the running sweep, or start a new one with the given cutoff
+    A sweep older than max_age is abandoned: every product it hasn't reached
+    is due again by then and belongs to a fresh sweep.
+    """
+    result = await db.execute(
+        select(CrawlSweep)
+        .where(CrawlSweep.status == SweepStatus.RUNNING)
+        .order_by(CrawlSweep.started_at.desc())
+    )
+    running = result.scalars().all()
+    now = datetime.utcnow()
+
+    for sweep in running:
+        if sweep is running[0] and time.time() - _epoch(sweep.started_at) < max_age_seconds:
+            continue
+        sweep.status = SweepStatus.ABANDONED
+        sweep.finished_at = now
+        _sync_counters(sweep)
+        logger.warning("Crawl sweep abandoned", sweep_id=str(sweep.id), cursor=str(sweep.cursor))
+
+    if running and running[0].status == SweepStatus.RUNNING:
+        sweep = running[0]
+        sweep.ticks += 1
+        logger.info(
+            "Resuming crawl sweep",
+            sweep_id=str(sweep.id),
+            cursor=str(sweep.cursor),
+            dispatched=sweep.dispatched,
+        )
+    else:
+        sweep = CrawlSweep(
+            id=uuid4(), status=SweepStatus.RUNNING, cutoff=cutoff,
+            scanned=0, dispatched=0, succeeded=0, failed=0, ticks=1,
+            started_at=now, updated_at=now,
+        )
+        db.add(sweep)
+        logger.info("Crawl sweep started", sweep_id=str(sweep.id))
+
+    await db.commit()
+    return sweep
+
+
+async def checkpoint_sweep(
+    db: AsyncSession,
+    sweep: CrawlSweep,
+    cursor: UUID,
+    scanned: int,
+    dispatched: int,
+):
+    """Persist the cursor after a dispatched page"""
+    sweep.cursor = cursor
+    sweep.scanned += scanned
+    sweep.dispatched += dispatched
+    _sync_counters(sweep)
+    await db.commit()
+
+
+async def finish_sweep(db: AsyncSession, sweep: CrawlSweep):
+    """Mark a sweep completed once its candidate set is exhausted"""
+    sweep.status = SweepStatus.COMPLETED
+    sweep.finished_at = datetime.utcnow()
+    _sync_counters(sweep)
+    await db.commit()
+    logger.info(
+        "Crawl sweep completed",
+        sweep_id=str(sweep.id),
+        scanned=sweep.scanned,
+        dispatched=sweep.dispatched,
+        ticks=sweep.ticks,
+    )
+
+
+async def live_counters(sweeps: List[CrawlSweep]) -> List[Dict[str, str]]:
+    """Live completion counters of each sweep, in one round trip (API handlers)"""
+    pipe = get_async_redis().pipeline(transaction=False)
+    for sweep in sweeps:
+        pipe.hgetall(SWEEP_PROGRESS_KEY.format(sweep_id=sweep.id))
+    return await pipe.execute() if sweeps else []
+
+
+def sweep_progress(sweep: CrawlSweep, counters: Dict[str, str]) -> Dict[str, Any]:
+    """Progress and throughput of a sweep, given its live completion counters"""
+    succeeded = int(counters.get("succeeded", sweep.succeeded or 0))
+    failed = int(counters.get("failed", sweep.failed or 0))
+    completed = succeeded + failed
+
+    end = _epoch(sweep.finished_at) if sweep.finished_at else time.time()
+    elapsed = max(end - _epoch(sweep.started_at), 1.0)
+
+    return {
+        "id": str(sweep.id),
+        "status": sweep.status.value,
+        "cutoff": sweep.cutoff,
+        "cursor": str(sweep.cursor) if sweep.cursor else None,
+        "scanned": sweep.scanned,
+        "dispatched": sweep.dispatched,
+        "succeeded": succeeded,
+        "failed": failed,
+        "in_flight": max(sweep.dispatched - completed, 0),
+        "ticks": sweep.ticks,
+        "started_at": sweep.started_at,
+        "finished_at": sweep.finished_at,
+        "elapsed_seconds": round(elapsed, 1),
+        "dispatch_per_minute": round(sweep.dispatched * 60 / elapsed, 2),
+        "completed_per_minute": round(completed * 60 / elapsed, 2),
+    }
+
+
+async def get_sweeps(db: AsyncSession, limit: int = 20, sweep_id: Optional[UUID] = None) -> List[CrawlSweep]:
+    """Most recent sweeps, or one sweep by ID"""
+    query = select(CrawlSweep).order_by(CrawlSweep.started_at.desc()).limit(limit)
+    if sweep_id is not None:
+        query = query.where(CrawlSweep.id == sweep_id)
+    result = await db.execute(query)
+    return list(result.scalars().all())
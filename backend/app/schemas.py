@@ -4,7 +4,7 @@ Request/Response models
 """
 from datetime import datetime
 from decimal import Decimal
-from typing import Optional, List
+from typing import Optional, List, Dict, Any
 from uuid import UUID
 from pydantic import BaseModel, EmailStr, HttpUrl, Field, validator
 
@@ -93,6 +93,7 @@ class ProductCreate(BaseModel):
     url: HttpUrl
     target_price: Optional[Decimal] = Field(None, ge=0)
     notify_any_drop: bool = False
+    preview_token: Optional[str] = None  # From /products/preview; reuses its crawl
 
 
 class ProductPreview(BaseModel):
@@ -104,6 +105,7 @@ class ProductPreview(BaseModel):
     image_url: Optional[str]
     domain: str
     is_available: bool
+    preview_token: Optional[str] = None  # Pass to POST /products to skip a second crawl
 
 
 class ProductResponse(BaseModel):
@@ -121,6 +123,8 @@ class ProductResponse(BaseModel):
     domain: str
     last_crawled_at: Optional[datetime]
     last_crawl_status: str
+    tracking_status: str = "tracking"  # "dead": page gone or unreadable, only re-checked weekly
+    dead_since: Optional[datetime] = None
     is_available: bool
     created_at: datetime
     
@@ -151,12 +155,28 @@ class ProductListResponse(BaseModel):
     has_more: bool
 
 
+class CrawlJobResponse(BaseModel):
+    """User-triggered crawl (preview, add, refresh) running on a crawl worker"""
+    id: str
+    kind: str
+    status: str  # queued, running, succeeded, failed
+    result: Optional[Dict[str, Any]] = None  # Preview fields, or {"product_id": ...}
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+
 # ============ Price History Schemas ============
 
 class PricePoint(BaseModel):
-    price: Decimal
+    price: Decimal  # Closing price of the bucket for rollup resolutions
     recorded_at: datetime
     is_available: bool
+    # Rollup resolutions only
+    low_price: Optional[Decimal] = None
+    high_price: Optional[Decimal] = None
+    average_price: Optional[Decimal] = None
+    availability: Optional[float] = None  # Fraction of observations in stock
 
     class Config:
         from_attributes = True
@@ -169,6 +189,7 @@ class PriceHistoryResponse(BaseModel):
     highest_price: Decimal
     average_price: Optional[Decimal]
     price_trend: str  # "up", "down", "stable"
+    resolution: str = "raw"  # "raw", "hourly" or "daily"
 
 
 # ============ Alert Schemas ============
@@ -235,6 +256,56 @@ class UserStats(BaseModel):
     average_price_drop_percent: Optional[float]
 
 
+# ============ Ops Schemas ============
+
+class QueueWaitStats(BaseModel):
+    user_id: str
+    count: int
+    p50: float  # Seconds
+    p95: float
+    max: float
+
+
+class QueueWaitResponse(BaseModel):
+    users: List[QueueWaitStats]
+
+
+class QueueStats(BaseModel):
+    queue: str
+    depth: int
+    oldest_age_seconds: Optional[float]
+
+
+class CrawlSweepProgress(BaseModel):
+    id: str
+    status: str
+    cutoff: datetime
+    cursor: Optional[str]
+    scanned: int
+    dispatched: int
+    succeeded: int
+    failed: int
+    in_flight: int
+    ticks: int  # Beat ticks the sweep spanned
+    started_at: datetime
+    finished_at: Optional[datetime]
+    elapsed_seconds: float
+    dispatch_per_minute: float
+    completed_per_minute: float
+
+
+class DatabasePoolStats(BaseModel):
+    process: str  # hostname:pid
+    role: str  # Pool profile (api, worker, maintenance)
+    pool_size: int
+    checked_out: int
+    checked_in: int
+    overflow: int  # Negative while the pool is below pool_size
+    connects: int  # Connections opened since process start
+    checkouts: int
+    reported_at: datetime
+
+
 # ============ Common Schemas ============
 
 class HealthCheck(BaseModel):
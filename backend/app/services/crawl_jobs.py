@@ -0,0 +1,138 @@
+"""
+Crawl Jobs
+User-triggered crawls (preview, add, refresh) run on crawl workers, not in the API
+
+The API records a job in Redis and enqueues `run_crawl_job` on the
+interactive crawl lane. Clients poll GET /crawl-jobs/{id} or stream
+GET /crawl-jobs/{id}/events; endpoints called with wait=true await the job
+on Redis instead of holding a browser and a DB session open.
+"""
+import asyncio
+import json
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, Optional
+
+from app.config import settings
+from app.redis_client import get_redis, get_async_redis
+
+JOB_KEY = "crawl:job:{job_id}"
+JOB_CHANNEL = "crawl:job:{job_id}:events"
+JOB_POLL_SECONDS = 0.5
+
+# Job kinds
+JOB_PREVIEW = "preview"
+JOB_ADD = "add"
+JOB_REFRESH = "refresh"
+
+# Job statuses
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+TERMINAL_STATUSES = {JOB_SUCCEEDED, JOB_FAILED}
+
+
+def _decode(raw: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    if not raw:
+        return None
+    return {
+        "id": raw["id"],
+        "kind": raw["kind"],
+        "status": raw["status"],
+        "user_id": raw["user_id"],
+        "payload": json.loads(raw.get("payload") or "{}"),
+        "result": json.loads(raw["result"]) if raw.get("result") else None,
+        "error": raw.get("error") or None,
+        "created_at": float(raw["created_at"]),
+        "updated_at": float(raw["updated_at"]),
+    }
+
+
+# ============ API side (asyncio) ============
+
+async def create_job(kind: str, user_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Record a queued job and enqueue it on the interactive crawl lane"""
+    from app.tasks.crawler_tasks import run_crawl_job
+
+    job_id = str(uuid.uuid4())
+    now = time.time()
+    fields = {
+        "id": job_id,
+        "kind": kind,
+        "status": JOB_QUEUED,
+        "user_id": user_id,
+        "payload": json.dumps(payload),
+        "created_at": repr(now),
+        "updated_at": repr(now),
+    }
+    r = get_async_redis()
+    key = JOB_KEY.format(job_id=job_id)
+    await r.hset(key, mapping=fields)
+    await r.expire(key, settings.CRAWL_JOB_TTL_SECONDS)
+
+    # Broker publish is blocking; keep it off the event loop
+    await asyncio.get_running_loop().run_in_executor(
+        None, lambda: run_crawl_job.apply_async(args=(job_id,), kwargs={"enqueued_at": now})
+    )
+    return _decode(fields)
+
+
+async def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    return _decode(await get_async_redis().hgetall(JOB_KEY.format(job_id=job_id)))
+
+
+async def wait_for_job(job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+    """Poll until the job finishes or the timeout passes; returns its last state"""
+    deadline = time.monotonic() + timeout
+    job = await get_job(job_id)
+    while job and job["status"] not in TERMINAL_STATUSES and time.monotonic() < deadline:
+        await asyncio.sleep(JOB_POLL_SECONDS)
+        job = await get_job(job_id)
+    return job
+
+
+async def job_events(job_id: str, timeout: float) -> AsyncIterator[Dict[str, Any]]:
+    """Yield the job's state now and after every change, until it finishes"""
+    pubsub = get_async_redis().pubsub()
+    await pubsub.subscribe(JOB_CHANNEL.format(job_id=job_id))
+    try:
+        # Subscribe first, then read, so no transition falls in between
+        job = await get_job(job_id)
+        deadline = time.monotonic() + timeout
+        while job:
+            yield job
+            if job["status"] in TERMINAL_STATUSES or time.monotonic() >= deadline:
+                return
+            last_status = job["status"]
+            while job and job["status"] == last_status and time.monotonic() < deadline:
+                await pubsub.get_message(ignore_subscribe_messages=True, timeout=JOB_POLL_SECONDS * 2)
+                job = await get_job(job_id)
+    finally:
+        await pubsub.unsubscribe()
+        await pubsub.close()
+
+
+# ============ Worker side ============
+
+def update_job(
+    job_id: str,
+    status: str,
+    result: Optional[Dict[str, Any]] = None,
+    error: Optional[str] = None,
+):
+    """Record a job transition and notify event subscribers"""
+    fields = {"status": status, "updated_at": repr(time.time())}
+    if result is not None:
+        fields["result"] = json.dumps(result, default=str)
+    if error is not None:
+        fields["error"] = error
+
+    pipe = get_redis().pipeline(transaction=False)
+    pipe.hset(JOB_KEY.format(job_id=job_id), mapping=fields)
+    pipe.publish(JOB_CHANNEL.format(job_id=job_id), status)
+    pipe.execute()
+
+
+def load_job(job_id: str) -> Optional[Dict[str, Any]]:
+    return _decode(get_redis().hgetall(JOB_KEY.format(job_id=job_id)))
@@ -0,0 +1,81 @@
+"""
+Price History Downsampling
+Largest-Triangle-Three-Buckets (LTTB) reduction for chart-sized histories
+
+Price histories are step functions: the points where the price or
+availability changes (and the point just before each change) carry the
+shape, the flat stretches between them don't. Those edges are always kept
+and LTTB spends the remaining budget on the rest of the series. When a
+history has more price edges than the budget, LTTB runs over the edges
+themselves; availability transitions are kept regardless.
+"""
+from datetime import datetime
+from decimal import Decimal
+from typing import Sequence
+
+import numpy as np
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Indices of the `threshold` points LTTB keeps (always the first and last)
+    Bucket centroids are computed in one pass; only the choice of each
+    bucket's point, which depends on the previous choice, is sequential.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # Interior points split into threshold - 2 near-equal buckets
+    starts = 1 + (np.arange(threshold - 2) * (n - 2)) // (threshold - 2)
+    ends = np.append(starts[1:], n - 1)
+    counts = ends - starts
+    centroid_x = np.append(np.add.reduceat(x[1:-1], starts - 1) / counts, x[-1])
+    centroid_y = np.append(np.add.reduceat(y[1:-1], starts - 1) / counts, y[-1])
+
+    keep = np.empty(threshold, dtype=np.intp)
+    keep[0], keep[-1] = 0, n - 1
+    anchor = 0
+    for bucket, (start, end) in enumerate(zip(starts, ends)):
+        # Twice the triangle area (anchor, candidate, next bucket's centroid)
+        cx, cy = centroid_x[bucket + 1], centroid_y[bucket + 1]
+        area = np.abs(
+            (x[anchor] - cx) * (y[start:end] - y[anchor])
+            - (x[anchor] - x[start:end]) * (cy - y[anchor])
+        )
+        anchor = start + int(np.argmax(area))
+        keep[bucket + 1] = anchor
+    return keep
+
+
+def _changes(values: np.ndarray) -> np.ndarray:
+    """Indices on both sides of every change in `values`"""
+    changed = np.flatnonzero(values[1:] != values[:-1])
+    return np.union1d(changed, changed + 1)
+
+
+def downsample_indices(
+    times: Sequence[datetime],
+    prices: Sequence[Decimal],
+    available: Sequence[bool],
+    max_points: int,
+) -> np.ndarray:
+    """Sorted indices of the points to keep from a time-ordered series"""
+    n = len(times)
+    if n <= max_points:
+        return np.arange(n)
+
+    x = np.fromiter((at.timestamp() for at in times), dtype=np.float64, count=n)
+    y = np.fromiter((float(price) for price in prices), dtype=np.float64, count=n)
+    transitions = _changes(np.fromiter(available, dtype=bool, count=n))
+    edges = np.union1d(np.union1d(_changes(y), transitions), [0, n - 1])
+
+    if len(edges) >= max_points:
+        picked = edges[lttb(x[edges], y[edges], max_points)]
+        return np.union1d(picked, transitions)
+
+    # Edges fit: LTTB fills the rest of the budget over the whole series
+    budget = max_points - len(edges)
+    if budget < 3:
+        return edges
+    return np.union1d(edges, lttb(x, y, budget))
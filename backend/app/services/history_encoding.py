@@ -0,0 +1,133 @@
+"""
+Price History Encoding
+Compact columnar representations of PriceHistoryResponse
+
+Clients choose the format with the Accept header:
+- application/json (default): one object per point
+- application/vnd.pricedrop.history+json: columnar JSON arrays
+- application/vnd.pricedrop.history: binary
+
+Both columnar formats carry the same columns: a base timestamp (Unix
+seconds) plus per-point deltas in seconds from the previous point, prices in
+integer cents, and availability as a bitmap (bit i of byte i // 8, least
+significant bit first). Rollup extras (low/high/average per bucket) are only
+in the default format.
+
+Binary layout, little-endian:
+    header  magic "PHB1", count u32, base_time i64, lowest/highest/average
+            cents i64 (average -1 when unknown), trend u8, resolution u8,
+            product_id 16 bytes
+    body    count x u32 time deltas, count x i64 cents, ceil(count / 8) bitmap bytes
+"""
+import base64
+import struct
+from typing import Any, Dict, Optional, Tuple
+from uuid import UUID
+
+import numpy as np
+
+from app.schemas import PriceHistoryResponse
+
+MEDIA_JSON = "application/json"
+MEDIA_COLUMNAR_JSON = "application/vnd.pricedrop.history+json"
+MEDIA_BINARY = "application/vnd.pricedrop.history"
+
+BINARY_MAGIC = b"PHB1"
+_HEADER = struct.Struct("<4sIqqqqBB16s")
+
+_TRENDS = ["stable", "up", "down"]
+_RESOLUTIONS = ["raw", "hourly", "daily"]
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """Media type to serve for an Accept header (highest q wins, JSON by default)"""
+    best, best_q = MEDIA_JSON, 0.0
+    for part in (accept or "").split(","):
+        media, _, params = part.strip().partition(";")
+        media = media.strip().lower()
+        if media not in (MEDIA_JSON, MEDIA_COLUMNAR_JSON, MEDIA_BINARY):
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > best_q:
+            best, best_q = media, q
+    return best
+
+
+def _cents(value) -> int:
+    return int(value * 100)
+
+
+def columns(response: PriceHistoryResponse) -> Tuple[int, np.ndarray, np.ndarray, bytes]:
+    """(base_time, time deltas, price cents, availability bitmap) of the history"""
+    points = response.history
+    count = len(points)
+    seconds = np.fromiter((int(p.recorded_at.timestamp()) for p in points), dtype=np.int64, count=count)
+    cents = np.fromiter((_cents(p.price) for p in points), dtype=np.int64, count=count)
+    available = np.fromiter((p.is_available for p in points), dtype=bool, count=count)
+    base_time = int(seconds[0]) if count else 0
+    deltas = np.diff(seconds, prepend=base_time)
+    return base_time, deltas, cents, np.packbits(available, bitorder="little").tobytes()
+
+
+def encode_columnar_json(response: PriceHistoryResponse) -> Dict[str, Any]:
+    base_time, deltas, cents, bitmap = columns(response)
+    return {
+        "product_id": str(response.product_id),
+        "resolution": response.resolution,
+        "price_trend": response.price_trend,
+        "lowest_price_cents": _cents(response.lowest_price),
+        "highest_price_cents": _cents(response.highest_price),
+        "average_price_cents": _cents(response.average_price) if response.average_price is not None else None,
+        "count": len(deltas),
+        "base_time": base_time,
+        "time_deltas": deltas.tolist(),
+        "prices_cents": cents.tolist(),
+        "availability": base64.b64encode(bitmap).decode("ascii"),
+    }
+
+
+def encode_binary(response: PriceHistoryResponse) -> bytes:
+    base_time, deltas, cents, bitmap = columns(response)
+    header = _HEADER.pack(
+        BINARY_MAGIC,
+        len(deltas),
+        base_time,
+        _cents(response.lowest_price),
+        _cents(response.highest_price),
+        _cents(response.average_price) if response.average_price is not None else -1,
+        _TRENDS.index(response.price_trend),
+        _RESOLUTIONS.index(response.resolution),
+        response.product_id.bytes,
+    )
+    return header + deltas.astype("<u4").tobytes() + cents.astype("<i8").tobytes() + bitmap
+
+
+def decode_binary(data: bytes) -> Dict[str, Any]:
+    """Inverse of encode_binary (reference for clients); times are Unix seconds"""
+    magic, count, base_time, lowest, highest, average, trend, resolution, product_id = _HEADER.unpack_from(data)
+    if magic != BINARY_MAGIC:
+        raise ValueError("Not a binary price history")
+    offset = _HEADER.size
+    deltas = np.frombuffer(data, dtype="<u4", count=count, offset=offset)
+    offset += 4 * count
+    cents = np.frombuffer(data, dtype="<i8", count=count, offset=offset)
+    offset += 8 * count
+    bitmap = np.frombuffer(data, dtype=np.uint8, offset=offset)
+    return {
+        "product_id": UUID(bytes=product_id),
+        "resolution": _RESOLUTIONS[resolution],
+        "price_trend": _TRENDS[trend],
+        "lowest_price_cents": lowest,
+        "highest_price_cents": highest,
+        "average_price_cents": None if average < 0 else average,
+        "times": (base_time + np.cumsum(deltas, dtype=np.int64)).tolist() if count else [],
+        "prices_cents": cents.tolist(),
+        "available": np.unpackbits(bitmap, count=count, bitorder="little").astype(bool).tolist(),
+    }
@@ -0,0 +1,295 @@
+"""
+Price History File Store
+Append-only, memory-mapped columnar files per product (PRICE_HISTORY_STORE=files)
+
+Each product has a directory under PRICE_HISTORY_FILES_PATH holding:
+- a head segment: one append-only file per column (head.ts: Unix seconds
+  i64, head.cents: price cents i64, head.avail: u1), appended under a
+  per-product flock so the columns stay aligned
+- sealed monthly segments (YYYYMM.seg): "PHS1", count u32, then the ts,
+  cents and avail columns back to back, sorted by time, written atomically
+  and memory-mapped by readers
+
+Compaction (daily, from the cleanup task) folds head points into their
+monthly segments, dropping exact duplicates, and empties the head. Retention
+deletes whole monthly segments, like partition drops in Postgres. Reads only
+open the segments that overlap the requested range.
+
+Every API and worker process must see the same directory (one shared volume
+with working flock). Readers hold the product lock shared, so they wait out
+an append or compaction instead of reading a half-rewritten product.
+
+Observations are held on the database session and handed to the store's
+writer thread once its transaction commits, so a rolled-back crawl leaves no
+points behind and the commit doesn't wait on file I/O. Points become
+readable shortly after the commit; a crash before they are appended loses
+them. A replayed result is deduplicated on compaction.
+"""
+import asyncio
+import fcntl
+import os
+import struct
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+from uuid import UUID
+
+import numpy as np
+import structlog
+from sqlalchemy import event
+
+from app.services.history_partitions import (
+    expired_months, month_start, retention_cutoff,
+)
+from app.services.price_history import Point, PriceHistoryStore
+
+logger = structlog.get_logger()
+
+# (name, dtype) of each column, in file order
+COLUMNS: List[Tuple[str, str]] = [("ts", "<i8"), ("cents", "<i8"), ("avail", "u1")]
+
+SEGMENT_MAGIC = b"PHS1"
+_SEGMENT_HEADER = struct.Struct("<4sI")
+
+Columns = Dict[str, np.ndarray]
+
+# Session.info key of observations waiting for the transaction to commit
+PENDING_KEY = "pending_history_files"
+
+
+def _seconds(at: datetime) -> int:
+    return int((at.replace(tzinfo=timezone.utc) if at.tzinfo is None else at).timestamp())
+
+
+def _month_key(month: datetime) -> str:
+    return f"{month.year:04d}{month.month:02d}"
+
+
+def _key_month(key: str) -> datetime:
+    return datetime(int(key[:4]), int(key[4:]), 1, tzinfo=timezone.utc)
+
+
+def _empty() -> Columns:
+    return {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS}
+
+
+def _concat(parts: List[Columns]) -> Columns:
+    if not parts:
+        return _empty()
+    return {name: np.concatenate([part[name] for part in parts]) for name, _ in COLUMNS}
+
+
+def _sorted_unique(columns: Columns) -> Columns:
+    """Sort by time; of points with the same timestamp keep the last appended"""
+    order = np.argsort(columns["ts"], kind="stable")
+    ts = columns["ts"][order]
+    keep = np.append(ts[1:] != ts[:-1], True) if len(ts) else np.empty(0, dtype=bool)
+    return {name: columns[name][order][keep] for name, _ in COLUMNS}
+
+
+# ============ Segment Files ============
+
+def write_segment(path: Path, columns: Columns):
+    """Write a sealed segment atomically (temp file + rename)"""
+    count = len(columns["ts"])
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "wb") as f:
+        f.write(_SEGMENT_HEADER.pack(SEGMENT_MAGIC, count))
+        for name, dtype in COLUMNS:
+            f.write(columns[name].astype(dtype).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def read_segment(path: Path) -> Columns:
+    """Memory-map a sealed segment's columns"""
+    # Map through the handle that read the header: compaction may replace the path
+    with open(path, "rb") as f:
+        magic, count = _SEGMENT_HEADER.unpack(f.read(_SEGMENT_HEADER.size))
+        if magic != SEGMENT_MAGIC:
+            raise ValueError(f"Not a price history segment: {path}")
+        columns = {}
+        offset = _SEGMENT_HEADER.size
+        for name, dtype in COLUMNS:
+            if count:
+                columns[name] = np.memmap(f, dtype=dtype, mode="r", offset=offset, shape=(count,))
+            else:
+                columns[name] = np.empty(0, dtype=dtype)
+            offset += np.dtype(dtype).itemsize * count
+    return columns
+
+
+def read_head(directory: Path) -> Columns:
+    """
+    Load the head columns, cut to their common length (a crash can leave one short)
+    Read rather than mapped: compaction truncates the head under readers.
+    """
+    sizes = {}
+    for name, dtype in COLUMNS:
+        path = directory / f"head.{name}"
+        sizes[name] = path.stat().st_size // np.dtype(dtype).itemsize if path.exists() else 0
+    count = min(sizes.values())
+    if not count:
+        return _empty()
+    return {
+        name: np.fromfile(directory / f"head.{name}", dtype=dtype, count=count)
+        for name, dtype in COLUMNS
+    }
+
+
+@contextmanager
+def product_lock(directory: Path, shared: bool = False):
+    """
+    Per-product lock: exclusive for appends and compaction, shared for reads
+    A reader never sees compaction half done (segments listed before it,
+    head read after the truncate).
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / "lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# ============ Store ============
+
+class FileHistoryStore(PriceHistoryStore):
+    """Price history in per-product columnar files (see module docstring)"""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        # One thread keeps appends in commit order and off the event loop
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-files")
+
+    def product_dir(self, product_id) -> Path:
+        product_id = str(product_id)
+        return self.root / product_id[:2] / product_id
+
+    # ----- Writes -----
+
+    def append(self, product_id, points: Columns):
+        directory = self.product_dir(product_id)
+        with product_lock(directory):
+            # Realign after a crash mid-append before adding to the columns
+            count = len(read_head(directory)["ts"])
+            for name, dtype in COLUMNS:
+                with open(directory / f"head.{name}", "ab") as f:
+                    f.truncate(count * np.dtype(dtype).itemsize)
+                    f.write(points[name].astype(dtype).tobytes())
+
+    def _record(self, observations: List[Dict[str, Any]]):
+        for o in observations:
+            self.append(o["product_id"], {
+                "ts": np.array([_seconds(o["recorded_at"])], dtype="<i8"),
+                "cents": np.array([int(o["price"] * 100)], dtype="<i8"),
+                "avail": np.array([1 if o["is_available"] else 0], dtype="u1"),
+            })
+
+    async def record(self, db, observations: List[Dict[str, Any]]):
+        session = db.sync_session
+        if not session.in_transaction():
+            session.begin()  # Tie the points to this transaction's outcome
+        if PENDING_KEY not in session.info:
+            session.info[PENDING_KEY] = []
+            event.listen(session, "after_commit", self._after_commit)
+            event.listen(session, "after_soft_rollback", self._after_rollback)
+        session.info[PENDING_KEY].extend(observations)
+
+    def _after_commit(self, session):
+        observations, session.info[PENDING_KEY] = session.info[PENDING_KEY], []
+        if observations:
+            self._writer.submit(self._record, observations).add_done_callback(self._appended)
+
+    def _appended(self, future: Future):
+        if future.exception():
+            logger.error("Price history append failed", error=str(future.exception()))
+
+    def flush(self):
+        """Wait for committed points queued so far to be appended"""
+        self._writer.submit(lambda: None).result()
+
+    def _after_rollback(self, session, previous_transaction):
+        if previous_transaction.nested or not session.info[PENDING_KEY]:
+            return
+        dropped, session.info[PENDING_KEY] = session.info[PENDING_KEY], []
+        logger.info("Discarded price history of rolled back transaction", points=len(dropped))
+
+    # ----- Reads -----
+
+    def _read(self, product_id, since: datetime) -> List[Point]:
+        directory = self.product_dir(product_id)
+        if not directory.exists():
+            return []
+        first_key = _month_key(month_start(since))
+        with product_lock(directory, shared=True):
+            parts = [
+                read_segment(path) for path in sorted(directory.glob("*.seg"))
+                if path.stem >= first_key
+            ]
+            parts.append(read_head(directory))
+            columns = _sorted_unique(_concat(parts))
+
+        start = np.searchsorted(columns["ts"], _seconds(since))
+        return [
+            (Decimal(int(cents)).scaleb(-2), datetime.fromtimestamp(int(ts), tz=timezone.utc), bool(avail))
+            for ts, cents, avail in zip(
+                columns["ts"][start:], columns["cents"][start:], columns["avail"][start:]
+            )
+        ]
+
+    async def read(self, db, product_id: UUID, since: datetime) -> List[Point]:
+        return await asyncio.to_thread(self._read, product_id, since)
+
+    # ----- Maintenance -----
+
+    def compact_product(self, directory: Path) -> int:
+        """Fold the head into monthly segments; returns the points moved"""
+        with product_lock(directory):
+            head = read_head(directory)
+            count = len(head["ts"])
+            if not count:
+                return 0
+            months = head["ts"].astype("datetime64[s]").astype("datetime64[M]")
+            for month in np.unique(months):
+                key = str(month).replace("-", "")
+                in_month = months == month
+                path = directory / f"{key}.seg"
+                parts = [read_segment(path)] if path.exists() else []
+                parts.append({name: head[name][in_month] for name, _ in COLUMNS})
+                write_segment(path, _sorted_unique(_concat(parts)))
+            # Segments are durable; a crash before this re-merges the head harmlessly
+            for name, _ in COLUMNS:
+                os.truncate(directory / f"head.{name}", 0)
+            return count
+
+    def drop_expired(self, directory: Path, cutoff: datetime) -> int:
+        """Delete whole monthly segments past retention; returns segments removed"""
+        segments = {_key_month(path.stem): path for path in directory.glob("*.seg")}
+        expired = expired_months(sorted(segments), cutoff)
+        for month in expired:
+            segments[month].unlink()
+        return len(expired)
+
+    def _maintain(self, now: datetime) -> Dict[str, Any]:
+        cutoff = retention_cutoff(now)
+        compacted = dropped = 0
+        if self.root.exists():
+            for shard in os.scandir(self.root):
+                if not shard.is_dir():
+                    continue
+                for product in os.scandir(shard.path):
+                    if product.is_dir():
+                        directory = Path(product.path)
+                        compacted += self.compact_product(directory)
+                        dropped += self.drop_expired(directory, cutoff)
+        logger.info("Compacted price history files", points=compacted, dropped_segments=dropped)
+        return {"deleted": 0, "compacted_points": compacted, "dropped_segments": dropped}
+
+    async def maintain(self, now: datetime) -> Dict[str, Any]:
+        return await asyncio.to_thread(self._maintain, now)
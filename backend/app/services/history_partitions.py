@@ -0,0 +1,219 @@
+"""
+Price History Partitions
+Monthly range partitions of price_history on recorded_at
+
+Each calendar month (UTC) is its own partition, created ahead of time by the
+daily maintenance task; a DEFAULT partition catches anything outside them.
+Retention detaches and drops whole months once their last day is past
+HISTORY_RETENTION_DAYS, a catalog change that takes milliseconds however many
+rows the month holds. Runs (PRICE_HISTORY_MODE=runs) never extend across a
+month boundary, so dropping a month never cuts a run that is still live.
+
+Tables created before partitioning are converted with
+    python -m app.services.history_partitions migrate
+which renames the old table, creates the partitioned one in its place (new
+writes land there immediately) and copies the retained months over one
+transaction at a time before dropping the old table.
+"""
+import argparse
+import asyncio
+import re
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+import structlog
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.config import settings
+
+logger = structlog.get_logger()
+
+PARENT = "price_history"
+LEGACY = "price_history_legacy"
+DEFAULT_PARTITION = "price_history_default"
+
+_PARTITION_NAME = re.compile(r"^price_history_p(\d{4})(\d{2})$")
+
+_COLUMNS = "id, product_id, price, currency, is_available, recorded_at, last_seen_at, observations"
+
+
+# ============ Month Math ============
+
+def month_start(at: datetime) -> datetime:
+    """First instant (UTC) of the month containing `at`"""
+    at = at.replace(tzinfo=timezone.utc) if at.tzinfo is None else at.astimezone(timezone.utc)
+    return at.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(start: datetime) -> datetime:
+    return (start + timedelta(days=32)).replace(day=1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"{PARENT}_p{month.year:04d}{month.month:02d}"
+
+
+def partition_month(name: str) -> Optional[datetime]:
+    """Month a partition covers, or None for tables that are not month partitions"""
+    match = _PARTITION_NAME.match(name)
+    if not match:
+        return None
+    return datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=timezone.utc)
+
+
+def months_between(first: datetime, last: datetime) -> List[datetime]:
+    """Month starts from the month of `first` through the month of `last`"""
+    months = []
+    month = month_start(first)
+    while month <= last:
+        months.append(month)
+        month = next_month(month)
+    return months
+
+
+def retention_cutoff(now: datetime) -> datetime:
+    return now - timedelta(days=settings.HISTORY_RETENTION_DAYS)
+
+
+def expired_months(months: List[datetime], cutoff: datetime) -> List[datetime]:
+    """Months that end on or before the cutoff (all their rows are expired)"""
+    return [month for month in months if next_month(month) <= cutoff]
+
+
+# ============ DDL ============
+
+def create_partition_sql(month: datetime) -> str:
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF {PARENT} "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month(month).isoformat()}')"
+    )
+
+
+def drop_partition_sql(name: str) -> Tuple[str, str]:
+    return (
+        f"ALTER TABLE {PARENT} DETACH PARTITION {name}",
+        f"DROP TABLE {name}",
+    )
+
+
+async def is_partitioned(conn: AsyncConnection, table: str = PARENT) -> bool:
+    result = await conn.execute(
+        text(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = :table AND pg_table_is_visible(c.oid)"
+        ),
+        {"table": table},
+    )
+    return result.scalar() is not None
+
+
+async def month_partitions(conn: AsyncConnection) -> List[str]:
+    result = await conn.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits i "
+            "JOIN pg_class parent ON parent.oid = i.inhparent "
+            "JOIN pg_class child ON child.oid = i.inhrelid "
+            "WHERE parent.relname = :parent AND pg_table_is_visible(parent.oid)"
+        ),
+        {"parent": PARENT},
+    )
+    return sorted(name for name in result.scalars().all() if partition_month(name))
+
+
+async def ensure_partitions(conn: AsyncConnection, now: Optional[datetime] = None, since: Optional[datetime] = None):
+    """Create month partitions from `since` (default: this month) through HISTORY_PARTITIONS_AHEAD months ahead"""
+    now = now or datetime.now(timezone.utc)
+    last = month_start(now)
+    for _ in range(settings.HISTORY_PARTITIONS_AHEAD):
+        last = next_month(last)
+    for month in months_between(since or now, last):
+        await conn.execute(text(create_partition_sql(month)))
+    await conn.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARENT} DEFAULT"))
+
+
+async def drop_expired_partitions(conn: AsyncConnection, now: Optional[datetime] = None) -> List[str]:
+    """Detach and drop the month partitions past retention; returns their names"""
+    cutoff = retention_cutoff(now or datetime.now(timezone.utc))
+    by_month = {partition_month(name): name for name in await month_partitions(conn)}
+    dropped = []
+    for month in expired_months(sorted(by_month), cutoff):
+        for statement in drop_partition_sql(by_month[month]):
+            await conn.execute(text(statement))
+        dropped.append(by_month[month])
+    return dropped
+
+
+# ============ Migration ============
+
+async def migrate(engine) -> int:
+    """
+    Convert an unpartitioned price_history into monthly partitions
+    Returns the number of rows copied. Safe to re-run after an interruption:
+    months already copied are skipped by primary key.
+    """
+    from app.models import PriceHistory
+
+    async with engine.begin() as conn:
+        if not await is_partitioned(conn):
+            indexes = (await conn.execute(
+                text("SELECT indexname FROM pg_indexes WHERE tablename = :table"), {"table": PARENT}
+            )).scalars().all()
+            await conn.execute(text(f"ALTER TABLE {PARENT} RENAME TO {LEGACY}"))
+            # Index names are schema-wide; free them for the new table
+            for index in indexes:
+                await conn.execute(text(f"ALTER INDEX {index} RENAME TO {index}_legacy"))
+            await conn.run_sync(PriceHistory.__table__.create)
+            logger.info("Created partitioned price_history", legacy_table=LEGACY)
+
+        legacy = await conn.execute(
+            text("SELECT to_regclass(:table) IS NOT NULL"), {"table": LEGACY}
+        )
+        if not legacy.scalar():
+            return 0
+        oldest = (await conn.execute(text(f"SELECT min(recorded_at) FROM {LEGACY}"))).scalar()
+        now = datetime.now(timezone.utc)
+        first = max(oldest, retention_cutoff(now)) if oldest else now
+        await ensure_partitions(conn, now, since=first)
+
+    copied = 0
+    for month in months_between(first, now):
+        async with engine.begin() as conn:
+            result = await conn.execute(
+                text(
+                    f"INSERT INTO {PARENT} ({_COLUMNS}) SELECT {_COLUMNS} FROM {LEGACY} "
+                    "WHERE recorded_at >= :start AND recorded_at < :end ON CONFLICT DO NOTHING"
+                ),
+                {"start": month, "end": next_month(month)},
+            )
+            copied += result.rowcount
+        logger.info("Copied price history month", partition=partition_name(month), rows=result.rowcount)
+
+    async with engine.begin() as conn:
+        await conn.execute(text(f"DROP TABLE {LEGACY}"))
+    logger.info("Price history migration complete", copied=copied)
+    return copied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Price history partition maintenance")
+    parser.add_argument("command", choices=["migrate", "maintain"])
+    args = parser.parse_args()
+
+    from app.database import engine
+
+    async def run():
+        if args.command == "migrate":
+            await migrate(engine)
+        else:
+            async with engine.begin() as conn:
+                await ensure_partitions(conn)
+                dropped = await drop_expired_partitions(conn)
+            logger.info("Partition maintenance complete", dropped=dropped)
+        await engine.dispose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
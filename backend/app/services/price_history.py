@@ -0,0 +1,216 @@
+"""
+Price History Storage
+Row-per-crawl ("points") or change-only run-length ("runs") price history
+
+In runs mode an observation equal to the product's latest history row (same
+price and availability) only moves that row's last_seen_at forward and bumps
+its observation count; a change, or the first sighting in a new calendar
+month (price_history is partitioned by month), starts a new row. Readers expand runs back
+into evenly spaced points, so the history API is the same in both modes and
+tables written in either mode read the same.
+
+Raw observations go to a PriceHistoryStore chosen by PRICE_HISTORY_STORE:
+the price_history table ("postgres") or append-only columnar files outside
+the database ("files", see app.services.history_files). Rollups stay in
+Postgres either way.
+"""
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+import structlog
+from sqlalchemy import Boolean, DateTime, Numeric, column, delete, func, select, update, values
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.ids import uuid7
+from app.models import PriceHistory
+from app.services.history_partitions import (
+    is_partitioned, ensure_partitions, drop_expired_partitions, month_start, retention_cutoff,
+)
+from app.services.price_rollups import record_rollups
+
+logger = structlog.get_logger()
+
+_history = PriceHistory.__table__
+
+# (price, recorded_at, is_available)
+Point = Tuple[Decimal, datetime, bool]
+
+# Rows per DELETE when price_history is not yet partitioned
+HISTORY_DELETE_BATCH = 10000
+
+# Last sighting of a row's price (SQL): filter on this, not recorded_at, so
+# runs that started before a cutoff but continue past it are kept
+run_end = func.coalesce(PriceHistory.last_seen_at, PriceHistory.recorded_at)
+
+
+def runs_enabled() -> bool:
+    return settings.PRICE_HISTORY_MODE == "runs"
+
+
+def _utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def extend_runs_statement(observations: List[Dict[str, Any]]):
+    """
+    Extend each product's latest row when the observation repeats it
+    Returns the product IDs whose run was extended.
+    """
+    batch = values(
+        column("product_id", PG_UUID(as_uuid=True)),
+        column("price", Numeric(10, 2)),
+        column("is_available", Boolean),
+        column("seen_at", DateTime(timezone=True)),
+        name="observed",
+    ).data([(o["product_id"], o["price"], o["is_available"], o["recorded_at"]) for o in observations])
+
+    latest = _history.alias("latest")
+    latest_id = (
+        select(latest.c.id)
+        .where(latest.c.product_id == batch.c.product_id)
+        .order_by(latest.c.recorded_at.desc())
+        .limit(1)
+        .correlate(batch)
+        .scalar_subquery()
+    )
+    return (
+        update(_history)
+        .where(
+            _history.c.id == latest_id,
+            _history.c.price == batch.c.price,
+            _history.c.is_available == batch.c.is_available,
+            # Keep each run inside one monthly partition so retention can drop months whole
+            func.date_trunc("month", func.timezone("UTC", _history.c.recorded_at))
+            == func.date_trunc("month", func.timezone("UTC", batch.c.seen_at)),
+        )
+        .values(last_seen_at=batch.c.seen_at, observations=_history.c.observations + 1)
+        .returning(_history.c.product_id)
+    )
+
+
+async def record_observations(db: AsyncSession, observations: List[Dict[str, Any]]):
+    """
+    Store successful price observations and their rollups (caller commits)
+    Each observation has product_id, price, currency, is_available and
+    recorded_at; at most one per product.
+    """
+    if not observations:
+        return
+    await record_rollups(db, observations)
+    await history_store().record(db, observations)
+
+
+def expand_runs(rows: Sequence[PriceHistory], since: datetime) -> List[Point]:
+    """
+    Expand history rows into (price, recorded_at, is_available) points
+    A run of n observations becomes n points evenly spaced from its first to
+    its last sighting; points before `since` are dropped.
+    """
+    since = _utc(since)
+    points = []
+    for row in rows:
+        start = _utc(row.recorded_at)
+        count = row.observations or 1
+        if count == 1 or row.last_seen_at is None:
+            times = [start]
+        else:
+            step = (_utc(row.last_seen_at) - start) / (count - 1)
+            times = [start + step * i for i in range(count)]
+        points.extend((row.price, at, row.is_available) for at in times if at >= since)
+    return points
+
+
+# ============ Stores ============
+
+class PriceHistoryStore(ABC):
+    """Backend holding raw price observations"""
+
+    @abstractmethod
+    async def record(self, db: AsyncSession, observations: List[Dict[str, Any]]):
+        """Append observations (at most one per product)"""
+
+    @abstractmethod
+    async def read(self, db: AsyncSession, product_id: UUID, since: datetime) -> List[Point]:
+        """A product's points from `since` on, oldest first"""
+
+    @abstractmethod
+    async def maintain(self, now: datetime) -> Dict[str, Any]:
+        """Periodic upkeep: retention and storage layout (daily cleanup task)"""
+
+
+class PostgresHistoryStore(PriceHistoryStore):
+    """The price_history table (monthly partitions, optional run-length rows)"""
+
+    async def record(self, db: AsyncSession, observations: List[Dict[str, Any]]):
+        if runs_enabled():
+            extended = set((await db.execute(extend_runs_statement(observations))).scalars().all())
+            observations = [o for o in observations if o["product_id"] not in extended]
+        if observations:
+            # One multi-row INSERT (insertmanyvalues) for the whole batch
+            await db.execute(
+                _history.insert(),
+                [{"id": uuid7(), "observations": 1, **o} for o in observations],
+            )
+
+    async def read(self, db: AsyncSession, product_id: UUID, since: datetime) -> List[Point]:
+        result = await db.execute(
+            select(PriceHistory)
+            .where(
+                PriceHistory.product_id == product_id,
+                run_end >= since,
+                # Runs never span months: lets Postgres skip older partitions
+                PriceHistory.recorded_at >= month_start(since)
+            )
+            .order_by(PriceHistory.recorded_at)
+        )
+        # Run-length rows (PRICE_HISTORY_MODE=runs) expand back into points
+        return expand_runs(result.scalars().all(), since)
+
+    async def maintain(self, now: datetime) -> Dict[str, Any]:
+        from app.database import async_session_maker, engine
+
+        async with engine.begin() as conn:
+            if await is_partitioned(conn):
+                await ensure_partitions(conn, now)
+                dropped = await drop_expired_partitions(conn, now)
+                logger.info("Dropped expired history partitions", partitions=dropped)
+                return {"deleted": 0, "dropped_partitions": dropped}
+
+        # Unpartitioned table (not migrated yet): delete in bounded batches
+        logger.warning("price_history is not partitioned; deleting expired rows")
+        cutoff = retention_cutoff(now)
+        deleted = 0
+        while True:
+            async with async_session_maker() as db:
+                expired = select(PriceHistory.id).where(run_end < cutoff).limit(HISTORY_DELETE_BATCH)
+                result = await db.execute(
+                    delete(PriceHistory).where(PriceHistory.id.in_(expired.scalar_subquery()))
+                )
+                await db.commit()
+            deleted += result.rowcount
+            if result.rowcount < HISTORY_DELETE_BATCH:
+                break
+        logger.info("Cleaned up old history", deleted_count=deleted)
+        return {"deleted": deleted}
+
+
+_store: Optional[PriceHistoryStore] = None
+
+
+def history_store() -> PriceHistoryStore:
+    """The configured PriceHistoryStore (one per process)"""
+    global _store
+    if _store is None:
+        if settings.PRICE_HISTORY_STORE == "postgres":
+            _store = PostgresHistoryStore()
+        elif settings.PRICE_HISTORY_STORE == "files":
+            from app.services.history_files import FileHistoryStore
+            _store = FileHistoryStore(settings.PRICE_HISTORY_FILES_PATH)
+        else:
+            raise ValueError(f"Unknown PRICE_HISTORY_STORE: {settings.PRICE_HISTORY_STORE}")
+    return _store
@@ -0,0 +1,187 @@
+"""
+Price History Rollups
+Hourly and daily per-product OHLC summaries of price observations
+
+Every observation stored through record_observations is also folded into its
+hour and day bucket with one INSERT ... ON CONFLICT DO UPDATE per resolution,
+so rollups stay current without rescanning history. Long-range history
+requests read one row per bucket, whatever the crawl frequency.
+
+Rollups for history recorded before they existed are filled with
+    python -m app.services.price_rollups backfill
+"""
+import argparse
+import asyncio
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Type
+
+import structlog
+from sqlalchemy import case, delete, func, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models import PriceHistoryDaily, PriceHistoryHourly, PriceRollupMixin
+
+logger = structlog.get_logger()
+
+RESOLUTION_RAW = "raw"
+RESOLUTION_HOURLY = "hourly"
+RESOLUTION_DAILY = "daily"
+
+ROLLUP_MODELS: Dict[str, Type[PriceRollupMixin]] = {
+    RESOLUTION_HOURLY: PriceHistoryHourly,
+    RESOLUTION_DAILY: PriceHistoryDaily,
+}
+
+# date_trunc unit per resolution
+_UNITS = {RESOLUTION_HOURLY: "hour", RESOLUTION_DAILY: "day"}
+
+
+def history_resolution(days: int) -> str:
+    """Resolution the history endpoint serves for a range of `days`"""
+    if days <= settings.HISTORY_RAW_MAX_DAYS:
+        return RESOLUTION_RAW
+    if days <= settings.HISTORY_HOURLY_MAX_DAYS:
+        return RESOLUTION_HOURLY
+    return RESOLUTION_DAILY
+
+
+def bucket_start(at: datetime, resolution: str) -> datetime:
+    """Start (UTC) of the bucket containing `at`"""
+    at = at.replace(tzinfo=timezone.utc) if at.tzinfo is None else at.astimezone(timezone.utc)
+    at = at.replace(minute=0, second=0, microsecond=0)
+    return at.replace(hour=0) if resolution == RESOLUTION_DAILY else at
+
+
+def bucket_rows(resolution: str, observations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """One single-observation rollup row per observation, in its bucket"""
+    return [
+        {
+            "product_id": o["product_id"],
+            "bucket": bucket_start(o["recorded_at"], resolution),
+            "open_price": o["price"],
+            "high_price": o["price"],
+            "low_price": o["price"],
+            "close_price": o["price"],
+            "close_available": o["is_available"],
+            "opened_at": o["recorded_at"],
+            "closed_at": o["recorded_at"],
+            "price_sum": o["price"],
+            "observations": 1,
+            "available_observations": 1 if o["is_available"] else 0,
+        }
+        for o in observations
+    ]
+
+
+def upsert_statement(resolution: str, observations: List[Dict[str, Any]]):
+    """Fold observations (at most one per product) into their buckets"""
+    model = ROLLUP_MODELS[resolution]
+    table = model.__table__
+    statement = insert(model).values(bucket_rows(resolution, observations))
+    new = statement.excluded
+    # Results can land out of order: open/close follow observation time
+    is_earlier = new.opened_at < table.c.opened_at
+    is_later = new.closed_at >= table.c.closed_at
+    return statement.on_conflict_do_update(
+        index_elements=[table.c.product_id, table.c.bucket],
+        set_={
+            "open_price": case((is_earlier, new.open_price), else_=table.c.open_price),
+            "opened_at": func.least(table.c.opened_at, new.opened_at),
+            "close_price": case((is_later, new.close_price), else_=table.c.close_price),
+            "close_available": case((is_later, new.close_available), else_=table.c.close_available),
+            "closed_at": func.greatest(table.c.closed_at, new.closed_at),
+            "high_price": func.greatest(table.c.high_price, new.high_price),
+            "low_price": func.least(table.c.low_price, new.low_price),
+            "price_sum": table.c.price_sum + new.price_sum,
+            "observations": table.c.observations + new.observations,
+            "available_observations": table.c.available_observations + new.available_observations,
+        },
+    )
+
+
+async def record_rollups(db: AsyncSession, observations: List[Dict[str, Any]]):
+    """Add observations to the hourly and daily rollups (caller commits)"""
+    if not observations:
+        return
+    for resolution in ROLLUP_MODELS:
+        await db.execute(upsert_statement(resolution, observations))
+
+
+async def load_rollups(db: AsyncSession, product_id, resolution: str, since: datetime) -> List[PriceRollupMixin]:
+    """A product's rollup rows from the bucket containing `since`, oldest first"""
+    model = ROLLUP_MODELS[resolution]
+    result = await db.execute(
+        select(model)
+        .where(model.product_id == product_id, model.bucket >= bucket_start(since, resolution))
+        .order_by(model.bucket)
+    )
+    return list(result.scalars().all())
+
+
+def rollup_average(rollups: List[PriceRollupMixin]) -> Optional[Decimal]:
+    """Observation-weighted average price across buckets"""
+    count = sum(rollup.observations for rollup in rollups)
+    if not count:
+        return None
+    return sum((rollup.price_sum for rollup in rollups), Decimal(0)) / count
+
+
+async def prune_rollups(db: AsyncSession, now: datetime) -> int:
+    """Delete rollups past retention (caller commits); returns rows deleted"""
+    deleted = 0
+    for model, days in (
+        (PriceHistoryHourly, settings.HISTORY_HOURLY_RETENTION_DAYS),
+        (PriceHistoryDaily, settings.HISTORY_RETENTION_DAYS),
+    ):
+        result = await db.execute(delete(model).where(model.bucket < now - timedelta(days=days)))
+        deleted += result.rowcount
+    return deleted
+
+
+# ============ Backfill ============
+
+def backfill_sql(resolution: str) -> str:
+    """
+    Build a resolution's rollups from price_history
+    Run-length rows count all their observations at the run's start. Buckets
+    that already exist are left alone.
+    """
+    table = ROLLUP_MODELS[resolution].__tablename__
+    bucket = f"date_trunc('{_UNITS[resolution]}', recorded_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC'"
+    return (
+        f"INSERT INTO {table} (product_id, bucket, open_price, high_price, low_price, close_price, "
+        "close_available, opened_at, closed_at, price_sum, observations, available_observations) "
+        f"SELECT product_id, {bucket}, "
+        "(array_agg(price ORDER BY recorded_at))[1], max(price), min(price), "
+        "(array_agg(price ORDER BY recorded_at DESC))[1], "
+        "(array_agg(is_available ORDER BY recorded_at DESC))[1], "
+        "min(recorded_at), max(coalesce(last_seen_at, recorded_at)), "
+        "sum(price * observations), sum(observations), "
+        "sum(CASE WHEN is_available THEN observations ELSE 0 END) "
+        f"FROM price_history GROUP BY product_id, {bucket} "
+        "ON CONFLICT DO NOTHING"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Price history rollup maintenance")
+    parser.add_argument("command", choices=["backfill"])
+    parser.parse_args()
+
+    from app.database import engine
+
+    async def run():
+        for resolution in ROLLUP_MODELS:
+            async with engine.begin() as conn:
+                result = await conn.execute(text(backfill_sql(resolution)))
+            logger.info("Backfilled price rollups", resolution=resolution, rows=result.rowcount)
+        await engine.dispose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+"""
+Crawl Result Stream
+Redis Streams pipeline separating fetching from DB writes and alert evaluation
+
+Crawlers publish compact result records to `crawl:results` and never hold a
+DB connection while a page loads. Two consumer groups run the stages:
+
+- writers (crawl:results): batched Product updates and PriceHistory inserts;
+  after committing, they publish each applied price drop, with the price it
+  actually replaced, to `crawl:drops`
+- alerts (crawl:drops): alert rules, Alert rows and notification enqueue
+
+Alerts follow the writes, so a drop is judged against the stored price it
+replaced, never a price read before the crawl that went stale while writers
+lagged. A writer that dies between its commit and publishing drops loses
+those alerts: the replayed batch is already applied and reports no drops.
+
+Entries are acknowledged only after their batch commits. Entries left
+pending (by a failed batch or a dead consumer) are reclaimed after
+RESULT_STREAM_CLAIM_IDLE_MS and replayed; both stages are idempotent under
+replay. Only an entry that still fails on its own after
+RESULT_STREAM_MAX_DELIVERIES deliveries goes to the dead-letter stream.
+
+Run with: python -m app.services.result_stream writers|alerts
+"""
+import asyncio
+import json
+import os
+import signal
+import socket
+import sys
+import uuid
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+
+import redis
+import structlog
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
+from app.config import settings
+from app.crawler.engine import CrawlResult
+from app.database import async_session_maker
+from app.models import Product, Alert
+from app.redis_client import get_redis
+from app.services.result_writer import write_crawl_results
+
+logger = structlog.get_logger()
+
+RESULTS_STREAM = "crawl:results"
+DROPS_STREAM = "crawl:drops"
+DEAD_LETTER_STREAM = "crawl:results:dead"
+WRITER_GROUP = "writers"
+ALERT_GROUP = "alerts"
+
+# Namespace for deterministic alert IDs (one alert per observation)
+ALERT_ID_NAMESPACE = uuid.UUID("0f3c2a52-8d0e-4c55-9d4c-3f1f7b6a2e10")
+
+StreamEntry = Tuple[str, Dict[str, str]]
+
+
+# ============ Publishing (crawl stage) ============
+
+def publish_crawl_results(
+    items: List[Tuple[str, Optional[Decimal], CrawlResult]],
+    attempts: Optional[Dict[str, int]] = None,
+):
+    """
+    Publish crawl results to the stream in one round trip
+    Each item is (product_id, price before the crawl, result); `attempts`
+    maps product IDs to the crawl's retry number (default 0). The price
+    before the crawl is informational: alerts use the price the write replaced.
+    """
+    attempts = attempts or {}
+    if not items:
+        return
+
+    pipe = get_redis().pipeline(transaction=False)
+    now = datetime.now(timezone.utc).timestamp()
+    for product_id, previous_price, result in items:
+        # Coalesced crawls carry their fetch time, so one shared result
+        # published by two tasks is written once
+        crawled_at = result.crawled_at or now
+        pipe.xadd(
+            RESULTS_STREAM,
+            {
+                "product_id": product_id,
+                "previous_price": str(previous_price) if previous_price is not None else "",
+                "crawled_at": repr(crawled_at),
+                "result": json.dumps(result.to_dict()),
+                "attempt": attempts.get(product_id, 0),
+            },
+            maxlen=settings.RESULT_STREAM_MAXLEN,
+            approximate=True,
+        )
+    pipe.execute()
+
+
+def _parse(fields: Dict[str, str]) -> Tuple[str, Optional[Decimal], datetime, CrawlResult]:
+    previous = fields.get("previous_price")
+    return (
+        fields["product_id"],
+        Decimal(previous) if previous else None,
+        datetime.fromtimestamp(float(fields["crawled_at"]), tz=timezone.utc),
+        CrawlResult.from_dict(json.loads(fields["result"])),
+    )
+
+
+def alert_id_for(product_id: str, crawled_at: datetime) -> uuid.UUID:
+    """
+    Deterministic ID of the alert for one observation
+    A result published twice (shared crawl, redelivered task) maps to one alert.
+    """
+    return uuid.uuid5(ALERT_ID_NAMESPACE, f"{product_id}:{crawled_at.isoformat()}")
+
+
+def publish_drops(drops: List[Tuple[str, datetime, Decimal, Decimal]]):
+    """Publish applied price drops (product_id, crawled_at, replaced price, new price)"""
+    if not drops:
+        return
+
+    pipe = get_redis().pipeline(transaction=False)
+    for product_id, crawled_at, old_price, new_price in drops:
+        pipe.xadd(
+            DROPS_STREAM,
+            {
+                "product_id": product_id,
+                "crawled_at": repr(crawled_at.timestamp()),
+                "old_price": str(old_price),
+                "new_price": str(new_price),
+            },
+            maxlen=settings.RESULT_STREAM_MAXLEN,
+            approximate=True,
+        )
+    pipe.execute()
+
+
+def _parse_drop(fields: Dict[str, str]) -> Tuple[str, datetime, Decimal, Decimal]:
+    return (
+        fields["product_id"],
+        datetime.fromtimestamp(float(fields["crawled_at"]), tz=timezone.utc),
+        Decimal(fields["old_price"]),
+        Decimal(fields["new_price"]),
+    )
+
+
+def _alert_row(alert: Alert) -> Dict[str, object]:
+    """Column values set on a new Alert (defaults fill the rest on insert)"""
+    return {c.key: getattr(alert, c.key) for c in Alert.__table__.columns if c.key in vars(alert)}
+
+
+# ============ Stage handlers ============
+
+async def write_results(entries: List[StreamEntry]):
+    """
+    Writers stage: apply a batch of results with set-based statements
+    A product whose last_crawled_at is already at or past an entry's crawl
+    time has seen that entry, so replays don't duplicate history rows.
+    Committed price drops go on to the alerts stage.
+    """
+    items = []
+    crawl_times = {}
+    attempts = {}
+    for _, fields in entries:
+        product_id, _, crawled_at, crawl_result = _parse(fields)
+        items.append((product_id, crawled_at, crawl_result))
+        crawl_times[product_id] = max(crawled_at, crawl_times.get(product_id, crawled_at))
+        attempts[product_id] = int(fields.get("attempt", 0))
+
+    async with async_session_maker() as db:
+        outcomes, _ = await write_crawl_results(db, items, evaluate_alerts=False, attempts=attempts)
+        await db.commit()
+
+    # Outcomes are for each product's newest result in the batch
+    drops = [
+        (product_id, crawl_times[product_id], Decimal(outcome["old_price"]), Decimal(outcome["new_price"]))
+        for product_id, outcome in outcomes.items()
+        if outcome["status"] == "success" and Decimal(outcome["new_price"]) < Decimal(outcome["old_price"])
+    ]
+    publish_drops(drops)
+    logger.info("Crawl results written", batch_size=len(entries), applied=len(outcomes), drops=len(drops))
+
+
+async def evaluate_alerts(entries: List[StreamEntry]):
+    """
+    Alerts stage: create alerts for a batch of applied price drops
+    Alert IDs derive from the observation (product and crawl time) and are
+    inserted with ON CONFLICT DO NOTHING, so replays and duplicate
+    publications notify once.
+    """
+    from app.tasks.crawler_tasks import build_alert, enqueue_notifications
+
+    drops = [_parse_drop(fields) for _, fields in entries]
+    if not drops:
+        return
+
+    async with async_session_maker() as db:
+        result = await db.execute(
+            select(Product).where(
+                Product.id.in_({UUID(d[0]) for d in drops}),
+                Product.is_active == True
+            )
+        )
+        products = {str(p.id): p for p in result.scalars().all()}
+
+        candidates = {}
+        for product_id, crawled_at, old_price, new_price in drops:
+            if product_id not in products:
+                continue
+            alert_id = alert_id_for(product_id, crawled_at)
+            alert = build_alert(products[product_id], old_price, new_price, alert_id=alert_id)
+            if alert:
+                candidates[alert_id] = alert
+
+        alerts = []
+        if candidates:
+            # Only alerts not already stored come back to be notified
+            inserted = await db.execute(
+                insert(Alert)
+                .values([_alert_row(alert) for alert in candidates.values()])
+                .on_conflict_do_nothing(index_elements=[Alert.id])
+                .returning(Alert.id)
+            )
+            alerts = [candidates[alert_id] for alert_id in inserted.scalars().all()]
+        await db.commit()
+
+    # Broker publish is blocking; keep it off the event loop
+    await asyncio.get_running_loop().run_in_executor(None, enqueue_notifications, alerts)
+    logger.info("Crawl results evaluated for alerts", batch_size=len(entries), alerts=len(alerts))
+
+
+# Consumer group -> (stream it reads, handler)
+STAGES = {
+    WRITER_GROUP: (RESULTS_STREAM, write_results),
+    ALERT_GROUP: (DROPS_STREAM, evaluate_alerts),
+}
+
+
+# ============ Consumer loop ============
+
+class StreamConsumer:
+    """
+    Consumer-group worker for one pipeline stage
+    Reads batches, reclaims stale pending entries from dead consumers,
+    and acknowledges only after the stage handler succeeds.
+    """
+
+    def __init__(self, group: str, name: Optional[str] = None):
+        self.group = group
+        self.stream, self.handler = STAGES[group]
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.redis = get_redis()
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    def _ensure_group(self):
+        try:
+            self.redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def _read(self) -> List[StreamEntry]:
+        """Reclaimed entries first, then new ones"""
+        # Reply is [next_id, entries] (Redis 6.2) or [next_id, entries, deleted_ids] (7+)
+        claimed = self.redis.xautoclaim(
+            self.stream, self.group, self.name,
+            min_idle_time=settings.RESULT_STREAM_CLAIM_IDLE_MS,
+            count=settings.RESULT_STREAM_BATCH,
+        )[1]
+        if claimed:
+            # Entries trimmed from the stream while pending can only be acknowledged
+            trimmed = [entry_id for entry_id, fields in claimed if not fields]
+            if trimmed:
+                self.redis.xack(self.stream, self.group, *trimmed)
+            live = [(entry_id, fields) for entry_id, fields in claimed if fields]
+            if live:
+                return live
+
+        response = self.redis.xreadgroup(
+            self.group, self.name, {self.stream: ">"},
+            count=settings.RESULT_STREAM_BATCH,
+            block=settings.RESULT_STREAM_BLOCK_MS,
+        )
+        return response[0][1] if response else []
+
+    def _deliveries(self, entries: List[StreamEntry]) -> Dict[str, int]:
+        """Times each pending entry has been delivered (XPENDING)"""
+        # Stream IDs are "<ms>-<seq>": compare numerically, not as strings
+        ids = sorted((entry_id for entry_id, _ in entries), key=lambda i: tuple(map(int, i.split("-"))))
+        pending = self.redis.xpending_range(
+            self.stream, self.group, min=ids[0], max=ids[-1],
+            count=len(ids), consumername=self.name,
+        )
+        return {p["message_id"]: p["times_delivered"] for p in pending}
+
+    def _dead_letter(self, entry_id: str, fields: Dict[str, str], error: Exception):
+        self.redis.xadd(
+            DEAD_LETTER_STREAM,
+            {
+                **fields, "stream": self.stream, "group": self.group,
+                "entry_id": entry_id, "error": str(error)[:500],
+            },
+            maxlen=settings.RESULT_STREAM_MAXLEN,
+            approximate=True,
+        )
+        self.redis.xack(self.stream, self.group, entry_id)
+
+    async def _process(self, entries: List[StreamEntry]):
+        try:
+            await self.handler(entries)
+            self.redis.xack(self.stream, self.group, *[entry_id for entry_id, _ in entries])
+            return
+        except Exception as e:
+            logger.error("Stream batch failed; entries stay pending for replay", group=self.group, error=str(e))
+
+        # A failing batch stays pending and is redelivered by XAUTOCLAIM, so
+        # outages only delay results. Entries that keep failing are retried
+        # alone, so one poison record can't hold back its batch forever.
+        deliveries = self._deliveries(entries)
+        for entry_id, fields in entries:
+            delivered = deliveries.get(entry_id, 0)
+            if delivered < settings.RESULT_STREAM_MAX_DELIVERIES:
+                continue
+            try:
+                await self.handler([(entry_id, fields)])
+                self.redis.xack(self.stream, self.group, entry_id)
+            except Exception as e:
+                logger.error(
+                    "Stream entry dead-lettered", group=self.group, entry_id=entry_id,
+                    deliveries=delivered, error=str(e),
+                )
+                self._dead_letter(entry_id, fields, e)
+
+    async def run(self):
+        self._ensure_group()
+        loop = asyncio.get_running_loop()
+        logger.info("Stream consumer started", group=self.group, consumer=self.name)
+
+        while not self._stopping.is_set():
+            # Blocking read runs in a thread so signals are still handled
+            entries = await loop.run_in_executor(None, self._read)
+            if entries:
+                await self._process(entries)
+
+        logger.info("Stream consumer stopped", group=self.group, consumer=self.name)
+
+
+def main():
+    group = sys.argv[1] if len(sys.argv) > 1 else WRITER_GROUP
+    if group not in STAGES:
+        raise SystemExit(f"Usage: python -m app.services.result_stream [{'|'.join(STAGES)}]")
+
+    consumer = StreamConsumer(group)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, consumer.stop)
+    try:
+        loop.run_until_complete(consumer.run())
+    finally:
+        loop.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+Bulk Crawl Result Writer
+Set-based application of a batch of crawl results
+
+One UPDATE ... FROM (VALUES ...) applies every product's price, price
+bounds (LEAST/GREATEST in SQL), crawl status and dead-product counters, and
+one multi-row INSERT adds the PriceHistory rows (preceded, in runs mode, by
+one UPDATE extending unchanged runs); the caller commits once per batch.
+
+Semantics match apply_crawl_result, which still handles single crawls: a
+result no newer than the product's last_crawled_at is skipped, so shared and
+replayed results are written once.
+"""
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+
+import structlog
+from sqlalchemy import (
+    Boolean, DateTime, Integer, Numeric, Text, case, cast, column, func, select, update, values,
+)
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.crawler.engine import CrawlResult
+from app.models import Product, Alert, CrawlStatus
+from app.scheduler.retry import will_retry
+from app.services.price_history import record_observations
+
+logger = structlog.get_logger()
+
+# (product_id, crawl time, result)
+ResultItem = Tuple[str, datetime, CrawlResult]
+
+_products = Product.__table__
+
+
+def _crawled_at(result: CrawlResult) -> datetime:
+    if result.crawled_at:
+        return datetime.fromtimestamp(result.crawled_at, tz=timezone.utc)
+    return datetime.now(timezone.utc)
+
+
+def result_items(results: Dict[str, CrawlResult]) -> List[ResultItem]:
+    """Pair crawl results with their crawl times"""
+    return [(product_id, _crawled_at(result), result) for product_id, result in results.items()]
+
+
+def _latest_per_product(items: List[ResultItem]) -> List[ResultItem]:
+    # UPDATE ... FROM updates a row once per statement; keep the newest result
+    latest: Dict[str, ResultItem] = {}
+    for item in items:
+        current = latest.get(item[0])
+        if current is None or item[1] > current[1]:
+            latest[item[0]] = item
+    return list(latest.values())
+
+
+def update_statement(items: List[ResultItem], attempts: Optional[Dict[str, int]] = None):
+    """
+    UPDATE ... FROM (VALUES ...) applying one result per product
+    Returns (id, old price, old dead_since, new dead_since, currency, domain)
+    for updated rows.
+    `attempts` maps product IDs to their retry number (default 0); a failure
+    that will be retried doesn't count toward marking the product dead.
+    """
+    from app.tasks.crawler_tasks import next_crawl_time
+
+    attempts = attempts or {}
+    rows = []
+    for product_id, crawled_at, result in items:
+        dead_after = None
+        if not result.success and not will_retry(result.failure_kind, attempts.get(product_id, 0)):
+            dead_after = settings.CRAWL_DEAD_AFTER_FAILURES.get(result.failure_kind or "")
+        # Whether the product ends up dead is decided in SQL; send both due
+        # times. The crawled URL's domain almost always is the stored one;
+        # write_crawl_results corrects the rows where it isn't.
+        due_at = next_crawl_time(product_id, result.domain, crawled_at)
+        dead_due_at = next_crawl_time(product_id, result.domain, crawled_at, dead=True)
+        rows.append((
+            UUID(product_id),
+            result.success,
+            result.price if result.success else None,
+            result.is_available if result.success else None,
+            CrawlStatus.SUCCESS if result.success else CrawlStatus.FAILED,
+            None if result.success else result.error,
+            crawled_at,
+            dead_after,
+            due_at,
+            dead_due_at,
+        ))
+
+    batch = values(
+        column("id", PG_UUID(as_uuid=True)),
+        column("success", Boolean),
+        column("price", Numeric(10, 2)),
+        column("is_available", Boolean),
+        column("status", _products.c.last_crawl_status.type),
+        column("error", Text),
+        column("crawled_at", DateTime(timezone=True)),
+        column("dead_after", Integer),
+        column("due_at", DateTime(timezone=True)),
+        column("dead_due_at", DateTime(timezone=True)),
+        name="batch",
+    ).data(rows)
+
+    # None renders as an untyped NULL; a column that is NULL in every row
+    # would be typed text, so cast the nullable ones
+    price = cast(batch.c.price, Numeric(10, 2))
+    is_available = cast(batch.c.is_available, Boolean)
+    error = cast(batch.c.error, Text)
+    dead_after = cast(batch.c.dead_after, Integer)
+    counts_toward_dead = dead_after.is_not(None)
+    dead_since = case(
+        (batch.c.success, None),
+        (
+            counts_toward_dead
+            & (_products.c.dead_since == None)
+            & (_products.c.permanent_failures + 1 >= dead_after),
+            batch.c.crawled_at,
+        ),
+        else_=_products.c.dead_since,
+    )
+
+    # Self-join to return pre-update values (old price for alerts)
+    old = _products.alias("old")
+    return (
+        update(_products)
+        .where(
+            _products.c.id == batch.c.id,
+            old.c.id == _products.c.id,
+            _products.c.is_active == True,
+            (_products.c.last_crawled_at == None) | (_products.c.last_crawled_at < batch.c.crawled_at),
+        )
+        .values(
+            current_price=func.coalesce(price, _products.c.current_price),
+            is_available=func.coalesce(is_available, _products.c.is_available),
+            # LEAST/GREATEST ignore the NULL price of failed crawls
+            lowest_price=func.least(_products.c.lowest_price, price),
+            highest_price=func.greatest(_products.c.highest_price, price),
+            last_crawl_status=batch.c.status,
+            crawl_error=error,
+            last_crawled_at=batch.c.crawled_at,
+            permanent_failures=case(
+                (batch.c.success, 0),
+                (counts_toward_dead, _products.c.permanent_failures + 1),
+                else_=_products.c.permanent_failures,
+            ),
+            dead_since=dead_since,
+            next_crawl_at=case((dead_since.is_not(None), batch.c.dead_due_at), else_=batch.c.due_at),
+        )
+        .returning(
+            _products.c.id, old.c.current_price, old.c.dead_since, _products.c.dead_since,
+            _products.c.currency, _products.c.domain,
+        )
+    )
+
+
+async def write_crawl_results(
+    db: AsyncSession,
+    items: List[ResultItem],
+    evaluate_alerts: bool = True,
+    attempts: Optional[Dict[str, int]] = None,
+) -> Tuple[Dict[str, dict], List[Alert]]:
+    """
+    Apply a batch of crawl results to active products (caller commits)
+    Returns outcomes for the products actually updated, keyed by product ID
+    (same shape as apply_crawl_result), and the alerts to notify.
+    `attempts` as for update_statement.
+    """
+    from app.tasks.crawler_tasks import check_and_create_alert, next_crawl_time
+
+    items = _latest_per_product(items)
+    if not items:
+        return {}, []
+
+    updated = {
+        str(row[0]): row[1:]
+        for row in (await db.execute(update_statement(items, attempts))).all()
+    }
+    if not updated:
+        return {}, []
+
+    outcomes: Dict[str, dict] = {}
+    history = []
+    rescheduled = []
+    drops: Dict[str, Tuple[Decimal, Decimal]] = {}
+    for product_id, crawled_at, result in items:
+        if product_id not in updated:
+            continue
+        old_price, was_dead, dead_since, currency, domain = updated[product_id]
+        if domain != result.domain:
+            # Schedule by the stored domain, as apply_crawl_result does
+            rescheduled.append({
+                "id": UUID(product_id),
+                "next_crawl_at": next_crawl_time(product_id, domain, crawled_at, dead=dead_since is not None),
+            })
+        if not result.success:
+            outcomes[product_id] = {"status": "failed", "error": result.error, "failure_kind": result.failure_kind}
+            if dead_since and not was_dead:
+                logger.warning("Product marked dead", product_id=product_id, failure_kind=result.failure_kind)
+            continue
+
+        outcomes[product_id] = {"status": "success", "old_price": str(old_price), "new_price": str(result.price)}
+        if was_dead:
+            logger.info("Dead product is back", product_id=product_id)
+        history.append({
+            "product_id": UUID(product_id),
+            "price": result.price,
+            "currency": currency,
+            "is_available": result.is_available,
+            "recorded_at": crawled_at,
+        })
+        if result.price < old_price:
+            drops[product_id] = (old_price, result.price)
+
+    if rescheduled:
+        await db.execute(update(Product), rescheduled)
+    await record_observations(db, history)
+
+    alerts = []
+    if evaluate_alerts and drops:
+        # Drops are rare; load just those products for the alert rules
+        result = await db.execute(select(Product).where(Product.id.in_([UUID(pid) for pid in drops])))
+        for product in result.scalars().all():
+            old_price, new_price = drops[str(product.id)]
+            alert = check_and_create_alert(db, product, old_price, new_price)
+            if alert:
+                alerts.append(alert)
+
+    return outcomes, alerts
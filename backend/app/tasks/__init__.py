@@ -1 +1,17 @@
 # Tasks Module
+import asyncio
+from typing import Optional
+
+# One event loop per worker process, so the shared Playwright browser and the
+# pooled database connections (both bound to the loop that opened them)
+# survive across tasks
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def run_async(coro):
+    """Run async function in sync context"""
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_loop)
+    return _loop.run_until_complete(coro)
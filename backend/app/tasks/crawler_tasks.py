@@ -3,44 +3,264 @@ Crawler Background Tasks
 Periodic price checking and history recording
 """
 import asyncio
-from datetime import datetime, timedelta
+import hashlib
+import math
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
 from decimal import Decimal
 from uuid import UUID
-from typing import Optional
+from typing import Optional, List, Tuple
 
 from celery import shared_task
 from sqlalchemy import select, and_
 from sqlalchemy.ext.asyncio import AsyncSession
 import structlog
 
-from app.celery_app import celery_app
+from app.celery_app import (
+    celery_app, QUEUE_CRAWL_BULK, PRIORITY_HIGH, PRIORITY_LOW,
+    DISPATCH_TICK_SECONDS, CLEANUP_TICK_SECONDS,
+)
 from app.database import async_session_maker
-from app.models import Product, PriceHistory, Alert, AlertType, AlertStatus, CrawlStatus
-from app.crawler import crawl_product
+from app.models import (
+    User, Product, Alert, AlertType, AlertStatus, CrawlStatus
+)
+from app.crawler import crawl_product, CrawlResult
+from app.crawler.engine import failure_kind_for
+from app.crawler.cache import crawl_product_cached, issue_preview_token
+from app.config import settings
+from app.ids import uuid7
+from app.scheduler import DeficitRoundRobin, record_queue_wait
+from app.scheduler.admission import admission_check
+from app.scheduler.beat import claim_tick, scheduled_time
+from app.scheduler.retry import retry_delay, will_retry
+from app.scheduler.routing import DomainRouter
+from app.scheduler.sweeps import (
+    resume_or_start_sweep, checkpoint_sweep, finish_sweep, record_sweep_progress
+)
+from app.tasks import run_async
+from app.services.price_history import record_observations, history_store
+from app.services.price_rollups import prune_rollups
+from app.services.result_writer import write_crawl_results, result_items
+from app.services.crawl_jobs import (
+    load_job, update_job, JOB_PREVIEW, JOB_ADD, JOB_REFRESH,
+    JOB_RUNNING, JOB_SUCCEEDED, JOB_FAILED, TERMINAL_STATUSES,
+)
 
 logger = structlog.get_logger()
 
 
-def run_async(coro):
-    """Run async function in sync context"""
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        return loop.run_until_complete(coro)
-    finally:
-        loop.close()
+# ============ Crawl Spreading ============
+# Each product gets a fixed phase within the crawl interval (hashed on its ID),
+# so beat ticks dispatch a thin, steady slice of products instead of the whole
+# due set at once. Domains may also restrict crawls to preferred UTC windows.
+
+DISPATCH_CLAIM_KEY = "crawl:dispatched:{product_id}"
+
+
+def crawl_interval_seconds() -> int:
+    """Target time between crawls of one product"""
+    return settings.CRAWL_INTERVAL_HOURS * 3600
+
+
+def crawl_phase(product_id: str) -> float:
+    """Deterministic per-product offset (seconds) within the crawl interval"""
+    digest = hashlib.blake2b(str(product_id).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % crawl_interval_seconds()
+
+
+def _to_epoch(value: datetime) -> float:
+    """Convert a (possibly naive UTC) datetime to epoch seconds"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _domain_windows(domain: Optional[str]) -> List[Tuple[int, int]]:
+    """Preferred crawl windows (UTC hour ranges) for a domain, empty if unrestricted"""
+    if not domain:
+        return []
+    
+    for pattern, windows in settings.CRAWL_DOMAIN_WINDOWS.items():
+        if domain == pattern or domain.endswith("." + pattern):
+            return [(int(start) % 24, int(end) % 24) for start, end in windows]
+    return []
+
+
+def crawl_window_open(domain: Optional[str], at: float) -> bool:
+    """Check whether `at` (epoch seconds) falls inside the domain's crawl windows"""
+    windows = _domain_windows(domain)
+    if not windows:
+        return True
+    
+    hour = datetime.fromtimestamp(at, tz=timezone.utc).hour
+    for start, end in windows:
+        if start < end and start <= hour < end:
+            return True
+        # Window wrapping midnight, e.g. (22, 6)
+        if start >= end and (hour >= start or hour < end):
+            return True
+    return False
+
+
+def apply_crawl_window(domain: Optional[str], at: float, phase: float) -> float:
+    """
+    Move a crawl time into the domain's next preferred window
+    The product's phase spreads deferred crawls across the window instead of
+    piling them all onto its opening minute.
+    """
+    windows = _domain_windows(domain)
+    if not windows or crawl_window_open(domain, at):
+        return at
+    
+    day_start = math.floor(at / 86400) * 86400
+    candidates = []
+    for day in (0, 1):
+        for start, end in windows:
+            opens = day_start + day * 86400 + start * 3600
+            if opens > at:
+                length = ((end - start) % 24 or 24) * 3600
+                candidates.append(opens + phase % length)
+    return min(candidates)
+
+
+def dead_probe_seconds() -> int:
+    """Time between probes of a product that looks permanently gone"""
+    return settings.CRAWL_DEAD_PROBE_HOURS * 3600
+
+
+def next_crawl_at(
+    product_id: str,
+    domain: Optional[str],
+    last_crawled_at: Optional[datetime],
+    dead_since: Optional[datetime] = None,
+) -> float:
+    """
+    Epoch time when a product is next due
+    Due times sit on the product's phase grid (phase + k * interval), at least
+    CRAWL_MIN_GAP_FRACTION of an interval after the previous crawl, or a full
+    probe interval after it for dead products.
+    """
+    if last_crawled_at is None:
+        return 0.0
+    
+    interval = crawl_interval_seconds()
+    phase = crawl_phase(product_id)
+    gap = dead_probe_seconds() if dead_since else interval * settings.CRAWL_MIN_GAP_FRACTION
+    earliest = _to_epoch(last_crawled_at) + gap
+    nominal = phase + math.ceil((earliest - phase) / interval) * interval
+    return apply_crawl_window(domain, nominal, phase)
+
+
+def next_crawl_time(
+    product_id: str,
+    domain: Optional[str],
+    crawled_at: datetime,
+    dead: bool = False,
+) -> datetime:
+    """next_crawl_at after a crawl at `crawled_at`, as stored in Product.next_crawl_at"""
+    due = next_crawl_at(product_id, domain, crawled_at, crawled_at if dead else None)
+    return datetime.fromtimestamp(due, tz=timezone.utc)
+
+
+def is_crawl_due(
+    product_id: str,
+    domain: Optional[str],
+    last_crawled_at: Optional[datetime],
+    now: float,
+    dead_since: Optional[datetime] = None,
+) -> bool:
+    """Check whether a product should be dispatched on this tick"""
+    if next_crawl_at(product_id, domain, last_crawled_at, dead_since) > now:
+        return False
+    # Overdue products still wait for their domain's window
+    return last_crawled_at is None or crawl_window_open(domain, now)
+
+
+def claim_dispatch(product_ids: List[str]) -> List[str]:
+    """
+    Claim products for dispatch so later ticks don't re-queue them
+    while they still sit in the crawl queue
+    """
+    from app.redis_client import get_redis
+    
+    ttl = int(crawl_interval_seconds() * settings.CRAWL_MIN_GAP_FRACTION)
+    pipe = get_redis().pipeline(transaction=False)
+    for product_id in product_ids:
+        pipe.set(DISPATCH_CLAIM_KEY.format(product_id=product_id), 1, nx=True, ex=ttl)
+    
+    return [pid for pid, claimed in zip(product_ids, pipe.execute()) if claimed]
 
 
-@celery_app.task(bind=True, max_retries=3)
-def crawl_single_product(self, product_id: str):
+def release_dispatch(product_ids: List[str]):
+    """Drop dispatch claims of products that were never queued, so the next tick retries them"""
+    from app.redis_client import get_redis
+    
+    if product_ids:
+        get_redis().delete(*(DISPATCH_CLAIM_KEY.format(product_id=pid) for pid in product_ids))
+
+
+@celery_app.task(bind=True, max_retries=None)  # Bounded per failure kind by RETRY_POLICIES
+def crawl_single_product(
+    self,
+    product_id: str,
+    user_id: Optional[str] = None,
+    enqueued_at: Optional[float] = None,
+    sweep_id: Optional[str] = None,
+):
     """
     Crawl a single product and update its price
     """
-    return run_async(_crawl_single_product(product_id))
+    if user_id and enqueued_at:
+        try:
+            record_queue_wait(user_id, time.time() - enqueued_at)
+        except Exception as e:
+            # Metrics must never fail a crawl
+            logger.warning("Failed to record queue wait", product_id=product_id, error=str(e))
+    
+    try:
+        if settings.CRAWL_RESULT_PIPELINE == "stream":
+            outcome = run_async(
+                _crawl_and_publish([product_id], attempt=self.request.retries)
+            )["results"][product_id]
+        else:
+            outcome = run_async(_crawl_single_product(product_id, attempt=self.request.retries))
+    except Exception as e:
+        _track_sweep(sweep_id, [{"status": "error", "error": str(e)}])
+        raise
+    
+    # Transient failures come back through the crawl queue after a backoff
+    delay = retry_delay(outcome.get("failure_kind"), self.request.retries)
+    if delay is not None:
+        logger.info(
+            "Retrying failed crawl",
+            product_id=product_id,
+            failure_kind=outcome["failure_kind"],
+            attempt=self.request.retries + 1,
+            countdown=round(delay),
+        )
+        raise self.retry(
+            kwargs={**self.request.kwargs, "enqueued_at": time.time() + delay},
+            countdown=delay,
+        )
+    
+    _track_sweep(sweep_id, [outcome])
+    return outcome
+
+
+def _track_sweep(sweep_id: Optional[str], outcomes: List[dict]):
+    """Count finished crawls against the sweep that dispatched them"""
+    if not sweep_id:
+        return
+    try:
+        record_sweep_progress(sweep_id, outcomes)
+    except Exception as e:
+        # Metrics must never fail a crawl
+        logger.warning("Failed to record sweep progress", sweep_id=sweep_id, error=str(e))
 
 
-async def _crawl_single_product(product_id: str):
-    """Async implementation of single product crawl"""
+async def _crawl_single_product(product_id: str, attempt: int = 0):
+    """Async implementation of single product crawl (`attempt`: retries so far)"""
     async with async_session_maker() as db:
         try:
             # Get product
@@ -60,64 +280,13 @@ async def _crawl_single_product(product_id: str):
             logger.info("Crawling product", product_id=product_id, url=product.url)
             crawl_result = await crawl_product(product.url)
             
-            if crawl_result.success:
-                old_price = product.current_price
-                new_price = crawl_result.price
-                
-                # Update product
-                product.current_price = new_price
-                product.is_available = crawl_result.is_available
-                product.last_crawl_status = CrawlStatus.SUCCESS
-                product.crawl_error = None
-                product.last_crawled_at = datetime.utcnow()
-                product.updated_at = datetime.utcnow()
-                
-                # Update price bounds
-                if new_price < product.lowest_price:
-                    product.lowest_price = new_price
-                if new_price > product.highest_price:
-                    product.highest_price = new_price
-                
-                # Add to history
-                price_history = PriceHistory(
-                    product_id=product.id,
-                    price=new_price,
-                    currency=product.currency,
-                    is_available=crawl_result.is_available,
-                )
-                db.add(price_history)
-                
-                # Check if we need to create alert
-                await _check_and_create_alert(db, product, old_price, new_price)
-                
-                await db.commit()
-                
-                logger.info(
-                    "Product crawled successfully",
-                    product_id=product_id,
-                    old_price=str(old_price),
-                    new_price=str(new_price)
-                )
-                
-                return {
-                    "status": "success",
-                    "old_price": str(old_price),
-                    "new_price": str(new_price)
-                }
-            else:
-                product.last_crawl_status = CrawlStatus.FAILED
-                product.crawl_error = crawl_result.error
-                product.last_crawled_at = datetime.utcnow()
-                
-                await db.commit()
-                
-                logger.warning(
-                    "Product crawl failed",
-                    product_id=product_id,
-                    error=crawl_result.error
-                )
-                
-                return {"status": "failed", "error": crawl_result.error}
+            outcome, alert = await apply_crawl_result(db, product, crawl_result, attempt=attempt)
+            await db.commit()
+            
+            # Notify only once the alert row is committed
+            enqueue_notifications([alert] if alert else [])
+            
+            return outcome
                 
         except Exception as e:
             logger.error("Error crawling product", product_id=product_id, error=str(e))
@@ -125,13 +294,206 @@ async def _crawl_single_product(product_id: str):
             raise
 
 
-async def _check_and_create_alert(
+async def apply_crawl_result(
+    db: AsyncSession,
+    product: Product,
+    crawl_result: CrawlResult,
+    crawled_at: Optional[datetime] = None,
+    evaluate_alerts: bool = True,
+    attempt: Optional[int] = None,
+) -> Tuple[dict, Optional[Alert]]:
+    """
+    Apply a crawl result to a loaded product (caller commits)
+    Returns the per-product outcome and the alert to notify, if any.
+    `attempt` is the retry number of crawls retried by RETRY_POLICIES
+    (None when a failure is not retried).
+    """
+    product_id = str(product.id)
+    if crawled_at is None and crawl_result.crawled_at:
+        crawled_at = datetime.utcfromtimestamp(crawl_result.crawled_at)
+    crawled_at = crawled_at or datetime.utcnow()
+    
+    if crawl_result.crawled_at and is_result_applied(product, crawl_result):
+        # A coalesced crawl shared with another caller that already wrote it
+        logger.info("Crawl result already applied", product_id=product_id)
+        return {"status": "duplicate"}, None
+    
+    if crawl_result.success:
+        old_price = product.current_price
+        new_price = crawl_result.price
+        
+        # Update product
+        product.current_price = new_price
+        product.is_available = crawl_result.is_available
+        product.last_crawl_status = CrawlStatus.SUCCESS
+        product.crawl_error = None
+        product.last_crawled_at = crawled_at
+        product.next_crawl_at = next_crawl_time(product_id, product.domain, crawled_at)
+        product.updated_at = datetime.utcnow()
+        if product.dead_since:
+            logger.info("Dead product is back", product_id=product_id)
+        product.permanent_failures = 0
+        product.dead_since = None
+        
+        # Update price bounds
+        if new_price < product.lowest_price:
+            product.lowest_price = new_price
+        if new_price > product.highest_price:
+            product.highest_price = new_price
+        
+        # Add to history
+        await record_observations(db, [{
+            "product_id": product.id,
+            "price": new_price,
+            "currency": product.currency,
+            "is_available": crawl_result.is_available,
+            "recorded_at": crawled_at,
+        }])
+        
+        # Check if we need to create alert
+        alert = None
+        if evaluate_alerts:
+            alert = check_and_create_alert(db, product, old_price, new_price)
+        
+        logger.info(
+            "Product crawled successfully",
+            product_id=product_id,
+            old_price=str(old_price),
+            new_price=str(new_price)
+        )
+        
+        return {
+            "status": "success",
+            "old_price": str(old_price),
+            "new_price": str(new_price)
+        }, alert
+    
+    product.last_crawl_status = CrawlStatus.FAILED
+    product.crawl_error = crawl_result.error
+    product.last_crawled_at = crawled_at
+    record_permanent_failure(product, crawl_result.failure_kind, crawled_at, attempt)
+    product.next_crawl_at = next_crawl_time(
+        product_id, product.domain, crawled_at, dead=product.dead_since is not None
+    )
+    
+    logger.warning(
+        "Product crawl failed",
+        product_id=product_id,
+        error=crawl_result.error
+    )
+    
+    return {"status": "failed", "error": crawl_result.error, "failure_kind": crawl_result.failure_kind}, None
+
+
+async def create_tracked_product(
+    db: AsyncSession,
+    user_id: UUID,
+    url: str,
+    crawl_result: CrawlResult,
+    target_price: Optional[Decimal] = None,
+    notify_any_drop: bool = False,
+) -> Product:
+    """
+    Create a tracked product and its first history point from a crawl (caller commits)
+    """
+    crawled_at = (
+        datetime.utcfromtimestamp(crawl_result.crawled_at) if crawl_result.crawled_at else datetime.utcnow()
+    )
+    product_id = uuid7()
+    product = Product(
+        id=product_id,
+        user_id=user_id,
+        url=url,
+        name=crawl_result.name or "Unknown Product",
+        image_url=crawl_result.image_url,
+        current_price=crawl_result.price,
+        original_price=crawl_result.price,
+        lowest_price=crawl_result.price,
+        highest_price=crawl_result.price,
+        currency=crawl_result.currency,
+        target_price=target_price,
+        notify_any_drop=notify_any_drop,
+        domain=crawl_result.domain,
+        last_crawled_at=crawled_at,
+        next_crawl_at=next_crawl_time(str(product_id), crawl_result.domain, crawled_at),
+        last_crawl_status=CrawlStatus.SUCCESS,
+        is_available=crawl_result.is_available,
+    )
+    db.add(product)
+    await db.flush()
+    
+    # Add initial price history
+    await record_observations(db, [{
+        "product_id": product.id,
+        "price": crawl_result.price,
+        "currency": crawl_result.currency,
+        "is_available": crawl_result.is_available,
+        "recorded_at": crawled_at,
+    }])
+    return product
+
+
+def record_permanent_failure(
+    product: Product,
+    failure_kind: Optional[str],
+    at: datetime,
+    attempt: Optional[int] = None,
+):
+    """
+    Count a failed crawl toward marking the product dead
+    Only failures that retrying won't fix count (the page is gone, or its price
+    can't be parsed); timeouts, bot walls and network errors prove nothing
+    either way and leave the count alone. A crawl counts once, on its final
+    attempt. Dead products drop to one probe per CRAWL_DEAD_PROBE_HOURS until
+    a crawl succeeds again.
+    """
+    threshold = settings.CRAWL_DEAD_AFTER_FAILURES.get(failure_kind) if failure_kind else None
+    if threshold is None:
+        return
+    if attempt is not None and will_retry(failure_kind, attempt):
+        return
+    
+    product.permanent_failures = (product.permanent_failures or 0) + 1
+    if product.dead_since is None and product.permanent_failures >= threshold:
+        product.dead_since = at
+        logger.warning(
+            "Product marked dead",
+            product_id=str(product.id),
+            failure_kind=failure_kind,
+            failures=product.permanent_failures,
+        )
+
+
+def is_result_applied(product: Product, crawl_result: CrawlResult) -> bool:
+    """Whether the product already reflects this (or a newer) crawl"""
+    last = product.last_crawled_at
+    if last is None or not crawl_result.crawled_at:
+        return False
+    if last.tzinfo is None:
+        last = last.replace(tzinfo=timezone.utc)
+    return last.timestamp() >= crawl_result.crawled_at
+
+
+def check_and_create_alert(
     db: AsyncSession, 
     product: Product, 
     old_price: Decimal, 
-    new_price: Decimal
-):
+    new_price: Decimal,
+) -> Optional[Alert]:
     """Check if alert should be created and create it"""
+    alert = build_alert(product, old_price, new_price)
+    if alert:
+        db.add(alert)
+    return alert
+
+
+def build_alert(
+    product: Product,
+    old_price: Decimal,
+    new_price: Decimal,
+    alert_id: Optional[uuid.UUID] = None,
+) -> Optional[Alert]:
+    """The alert a price change warrants under the product's rules, if any (not added)"""
     should_alert = False
     alert_type = AlertType.PRICE_DROP
     
@@ -146,101 +508,560 @@ async def _check_and_create_alert(
             should_alert = True
             alert_type = AlertType.PRICE_DROP
     
-    if should_alert:
-        # Calculate savings
-        savings = old_price - new_price
-        percent_drop = ((old_price - new_price) / old_price) * 100
-        
-        if alert_type == AlertType.TARGET_REACHED:
-            title = "🎯 Target Price Reached!"
-            message = f"{product.name[:50]} dropped to ${new_price}! (Your target: ${product.target_price})"
+    if not should_alert:
+        return None
+    
+    # Calculate savings
+    percent_drop = ((old_price - new_price) / old_price) * 100
+    
+    if alert_type == AlertType.TARGET_REACHED:
+        title = "🎯 Target Price Reached!"
+        message = f"{product.name[:50]} dropped to ${new_price}! (Your target: ${product.target_price})"
+    else:
+        title = "💰 Price Drop Alert!"
+        message = f"{product.name[:50]} dropped from ${old_price} to ${new_price} ({percent_drop:.1f}% off)"
+    
+    alert = Alert(
+        id=alert_id or uuid7(),  # Assigned up front so it can be enqueued after commit
+        user_id=product.user_id,
+        product_id=product.id,
+        alert_type=alert_type,
+        old_price=old_price,
+        new_price=new_price,
+        title=title,
+        message=message,
+        status=AlertStatus.PENDING,
+    )
+    return alert
+
+
+def enqueue_notifications(alerts: List[Alert]):
+    """
+    Trigger notification tasks for committed alerts over one broker connection
+    Target-reached alerts outrank any-drop alerts in the notification lane.
+    """
+    if not alerts:
+        return
+    
+    from app.tasks.notification_tasks import send_alert_notification
+    
+    with celery_app.producer_or_acquire() as producer:
+        for alert in alerts:
+            priority = PRIORITY_HIGH if alert.alert_type == AlertType.TARGET_REACHED else PRIORITY_LOW
+            send_alert_notification.apply_async(
+                args=(str(alert.id),), priority=priority, producer=producer
+            )
+
+
+@celery_app.task(bind=True)
+def crawl_product_batch(
+    self,
+    product_ids: List[str],
+    user_ids: Optional[List[str]] = None,
+    enqueued_at: Optional[float] = None,
+    sweep_id: Optional[str] = None,
+):
+    """
+    Crawl many products in one task
+    One product query, concurrent crawls on this worker's browser, one
+    transaction for all results and one notification publish.
+    """
+    if user_ids and enqueued_at:
+        try:
+            wait = time.time() - enqueued_at
+            for user_id in set(user_ids):
+                record_queue_wait(user_id, wait)
+        except Exception as e:
+            logger.warning("Failed to record queue wait", batch_size=len(product_ids), error=str(e))
+    
+    try:
+        if settings.CRAWL_RESULT_PIPELINE == "stream":
+            outcome = run_async(_crawl_and_publish(product_ids))
         else:
-            title = "💰 Price Drop Alert!"
-            message = f"{product.name[:50]} dropped from ${old_price} to ${new_price} ({percent_drop:.1f}% off)"
-        
-        alert = Alert(
-            user_id=product.user_id,
-            product_id=product.id,
-            alert_type=alert_type,
-            old_price=old_price,
-            new_price=new_price,
-            title=title,
-            message=message,
-            status=AlertStatus.PENDING,
+            outcome = run_async(_crawl_product_batch(product_ids))
+    except Exception as e:
+        _track_sweep(sweep_id, [{"status": "error", "error": str(e)}] * len(product_ids))
+        raise
+    
+    # Retry transient failures one by one; the rest of the batch is done
+    final = []
+    retries = []
+    for product_id, result in outcome["results"].items():
+        delay = retry_delay(result.get("failure_kind"), 0)
+        if delay is None:
+            final.append(result)
+        else:
+            retries.append((product_id, delay))
+    
+    if retries:
+        queue = (self.request.delivery_info or {}).get("routing_key") or QUEUE_CRAWL_BULK
+        with celery_app.producer_or_acquire() as producer:
+            for product_id, delay in retries:
+                crawl_single_product.apply_async(
+                    args=(product_id,),
+                    kwargs={"enqueued_at": time.time() + delay, "sweep_id": sweep_id},
+                    countdown=delay,
+                    retries=1,  # This was the first attempt
+                    queue=queue,
+                    producer=producer,
+                )
+        logger.info("Retrying failed batch crawls", batch_size=len(product_ids), retries=len(retries))
+    
+    _track_sweep(sweep_id, final)
+    return outcome
+
+
+async def crawl_concurrently(urls: List[str]) -> list:
+    """
+    Crawl URLs on this worker's browser, CRAWL_BATCH_CONCURRENCY at a time
+    Returns results in order; a crawl that raised yields its exception.
+    """
+    semaphore = asyncio.Semaphore(settings.CRAWL_BATCH_CONCURRENCY)
+    
+    async def crawl_one(url: str):
+        async with semaphore:
+            return await crawl_product(url)
+    
+    return await asyncio.gather(*(crawl_one(url) for url in urls), return_exceptions=True)
+
+
+def _crawl_error(product_id: str, error: Exception) -> dict:
+    logger.error("Error crawling product", product_id=product_id, error=str(error))
+    return {"status": "error", "error": str(error), "failure_kind": failure_kind_for(error).value}
+
+
+async def _crawl_product_batch(product_ids: List[str]):
+    """Async implementation of batch crawl"""
+    results = {product_id: {"status": "not_found"} for product_id in product_ids}
+    
+    # Read the URLs and release the connection: crawls take minutes
+    async with async_session_maker() as db:
+        result = await db.execute(
+            select(Product.id, Product.url).where(
+                Product.id.in_([UUID(product_id) for product_id in product_ids]),
+                Product.is_active == True
+            )
         )
-        db.add(alert)
-        
-        # Trigger notification task
-        from app.tasks.notification_tasks import send_alert_notification
-        send_alert_notification.delay(str(alert.id))
+        rows = result.fetchall()
+    
+    crawl_results = await crawl_concurrently([url for _, url in rows])
+    
+    crawled = {}
+    for (product_id, _), crawl_result in zip(rows, crawl_results):
+        product_id = str(product_id)
+        if isinstance(crawl_result, Exception):
+            results[product_id] = _crawl_error(product_id, crawl_result)
+            continue
+        crawled[product_id] = crawl_result
+    
+    # Apply all results with set-based statements in one short transaction
+    async with async_session_maker() as db:
+        try:
+            outcomes, alerts = await write_crawl_results(db, result_items(crawled))
+            await db.commit()
+        except Exception as e:
+            logger.error("Error in batch crawl", batch_size=len(product_ids), error=str(e))
+            await db.rollback()
+            raise
+    for product_id in crawled:
+        results[product_id] = outcomes.get(product_id, {"status": "duplicate"})
+    
+    enqueue_notifications(alerts)
+    
+    logger.info(
+        "Batch crawl finished",
+        batch_size=len(product_ids),
+        succeeded=sum(1 for r in results.values() if r["status"] == "success"),
+        alerts=len(alerts),
+    )
+    return {"results": results}
+
+
+async def _crawl_and_publish(product_ids: List[str], attempt: int = 0):
+    """
+    Crawl stage of the result stream pipeline
+    Reads URLs and current prices, releases the DB connection, crawls, and
+    publishes results for the writer and alert consumer groups.
+    """
+    from app.services.result_stream import publish_crawl_results
+    
+    results = {product_id: {"status": "not_found"} for product_id in product_ids}
+    
+    async with async_session_maker() as db:
+        result = await db.execute(
+            select(Product.id, Product.url, Product.current_price).where(
+                Product.id.in_([UUID(product_id) for product_id in product_ids]),
+                Product.is_active == True
+            )
+        )
+        rows = result.fetchall()
+    
+    crawl_results = await crawl_concurrently([url for _, url, _ in rows])
+    
+    items = []
+    for (product_id, _, current_price), crawl_result in zip(rows, crawl_results):
+        product_id = str(product_id)
+        if isinstance(crawl_result, Exception):
+            results[product_id] = _crawl_error(product_id, crawl_result)
+            continue
+        items.append((product_id, current_price, crawl_result))
+        results[product_id] = {
+            "status": "published",
+            "success": crawl_result.success,
+            "error": crawl_result.error,
+            "failure_kind": crawl_result.failure_kind,
+        }
+    
+    publish_crawl_results(items, attempts={product_id: attempt for product_id, _, _ in items})
+    return {"results": results}
 
 
 @celery_app.task
-def crawl_all_products():
+def run_crawl_job(job_id: str, enqueued_at: Optional[float] = None):
+    """
+    Run a user-triggered crawl job (preview, add or refresh)
+    Routed to the interactive crawl lane; status and result go to the job record
+    """
+    job = load_job(job_id)
+    if not job:
+        logger.warning("Crawl job expired before it ran", job_id=job_id)
+        return {"status": "expired"}
+    if job["status"] in TERMINAL_STATUSES:
+        return {"status": job["status"]}  # Redelivered after it already finished
+    
+    if enqueued_at:
+        try:
+            record_queue_wait(job["user_id"], time.time() - enqueued_at)
+        except Exception as e:
+            logger.warning("Failed to record queue wait", job_id=job_id, error=str(e))
+    
+    update_job(job_id, JOB_RUNNING)
+    try:
+        result, error = run_async(_run_crawl_job(job))
+    except Exception as e:
+        logger.error("Crawl job failed", job_id=job_id, kind=job["kind"], error=str(e))
+        update_job(job_id, JOB_FAILED, error="Crawl failed, please try again")
+        raise
+    
+    if error:
+        update_job(job_id, JOB_FAILED, error=error)
+        return {"status": JOB_FAILED}
+    
+    update_job(job_id, JOB_SUCCEEDED, result=result)
+    return {"status": JOB_SUCCEEDED}
+
+
+async def _run_crawl_job(job: dict) -> Tuple[Optional[dict], Optional[str]]:
+    """
+    Async implementation of a crawl job
+    Returns (result, error). No DB session is open while the page loads.
+    """
+    kind = job["kind"]
+    payload = job["payload"]
+    
+    if kind == JOB_PREVIEW:
+        crawl_result = await crawl_product_cached(payload["url"])
+        if not crawl_result.success:
+            return None, f"Could not fetch product: {crawl_result.error}"
+        return {
+            "url": payload["url"],
+            "name": crawl_result.name or "Unknown Product",
+            "price": str(crawl_result.price),
+            "currency": crawl_result.currency,
+            "image_url": crawl_result.image_url,
+            "domain": crawl_result.domain,
+            "is_available": crawl_result.is_available,
+            # Lets the add that follows skip its own crawl
+            "preview_token": await issue_preview_token(job["user_id"], payload["url"], crawl_result),
+        }, None
+    
+    if kind == JOB_ADD:
+        crawl_result = await crawl_product_cached(payload["url"])
+        if not crawl_result.success:
+            return None, f"Could not fetch product: {crawl_result.error}"
+        
+        async with async_session_maker() as db:
+            product = await create_tracked_product(
+                db,
+                user_id=UUID(job["user_id"]),
+                url=payload["url"],
+                crawl_result=crawl_result,
+                target_price=Decimal(payload["target_price"]) if payload.get("target_price") is not None else None,
+                notify_any_drop=payload.get("notify_any_drop", False),
+            )
+            await db.commit()
+        
+        return {"product_id": str(product.id)}, None
+    
+    if kind == JOB_REFRESH:
+        product_id = UUID(payload["product_id"])
+        async with async_session_maker() as db:
+            result = await db.execute(select(Product.url).where(Product.id == product_id))
+            url = result.scalar_one_or_none()
+        if url is None:
+            return None, "Product not found"
+        
+        # Repeated refresh taps within the cache window reuse one crawl
+        crawl_result = await crawl_product_cached(url)
+        
+        async with async_session_maker() as db:
+            result = await db.execute(
+                select(Product).where(Product.id == product_id, Product.is_active == True)
+            )
+            product = result.scalar_one_or_none()
+            if not product:
+                return None, "Product not found"
+            await apply_crawl_result(db, product, crawl_result, evaluate_alerts=False)
+            await db.commit()
+        
+        return {"product_id": str(product_id)}, None
+    
+    return None, f"Unknown crawl job kind: {kind}"
+
+
+@celery_app.task(bind=True)
+def crawl_all_products(self):
     """
-    Crawl all active products
-    Called periodically by Celery Beat
+    Dispatch crawls for products whose jittered slot has arrived
+    Called every CRAWL_DISPATCH_TICK_MINUTES by Celery Beat
     """
+    if not claim_tick("crawl-all-products", DISPATCH_TICK_SECONDS, at=scheduled_time(self.request)):
+        return {"queued": 0, "skipped": "duplicate_tick"}
     return run_async(_crawl_all_products())
 
 
 async def _crawl_all_products():
-    """Async implementation of crawl all products"""
+    """
+    Async implementation of crawl all products
+    Loads the tick's due slice into one fair-share schedule and publishes it,
+    unless the crawl queue is already saturated. Progress is checkpointed on a
+    resumable sweep.
+    """
+    if settings.CRAWL_EXECUTOR == "daemon":
+        # The async crawl daemon pulls due work itself
+        return {"queued": 0, "skipped": "daemon"}
+    
+    now = time.time()
+    router = DomainRouter.from_live_nodes() if settings.CRAWL_DOMAIN_AFFINITY else None
+    
     async with async_session_maker() as db:
         try:
-            # Get all active products that need crawling
-            cutoff = datetime.utcnow() - timedelta(hours=6)  # Don't re-crawl too soon
-            
-            result = await db.execute(
-                select(Product.id).where(
-                    Product.is_active == True,
-                    (Product.last_crawled_at == None) | (Product.last_crawled_at < cutoff)
-                )
-            )
-            product_ids = [str(row[0]) for row in result.fetchall()]
+            # Pick up where the last tick (or a restarted beat) stopped
+            sweep = await resume_or_start_sweep(db, due_cutoff(), crawl_interval_seconds())
+            sweep_id = str(sweep.id)
             
-            logger.info("Starting bulk crawl", product_count=len(product_ids))
+            # Admission control: leave the slice for a later tick
+            throttled = admission_check([QUEUE_CRAWL_BULK] + (router.queues if router else []))
+            if throttled:
+                logger.warning("Crawl queue saturated, deferring", reason=throttled)
+                return {"sweep_id": sweep_id, "queued": 0, "scanned": 0, "throttled": throttled}
             
-            # Queue individual crawl tasks
-            for product_id in product_ids:
-                crawl_single_product.delay(product_id)
+            scheduler, cursor, scanned, exhausted = await load_due_schedule(db, sweep, now)
+            queued = _publish_schedule(scheduler, router, sweep_id=sweep_id)
+            if cursor is not None:
+                await checkpoint_sweep(db, sweep, cursor, scanned, queued)
+            if exhausted:
+                await finish_sweep(db, sweep)
             
-            return {"queued": len(product_ids)}
+            logger.info("Bulk crawl dispatched", sweep_id=sweep_id, scanned=scanned, queued=queued)
+            return {"sweep_id": sweep_id, "queued": queued, "scanned": scanned, "throttled": None}
             
         except Exception as e:
             logger.error("Error in bulk crawl", error=str(e))
             raise
 
 
-@celery_app.task
-def cleanup_old_history():
+def due_cutoff() -> datetime:
+    """A new sweep takes the products due by now"""
+    return datetime.utcnow()
+
+
+def _due_without_schedule(cutoff: datetime):
+    """Rows crawled before next_crawl_at was stored: the minimum gap and probe interval"""
+    min_gap = timedelta(seconds=crawl_interval_seconds() * settings.CRAWL_MIN_GAP_FRACTION)
+    return (
+        (Product.next_crawl_at == None)
+        & ((Product.last_crawled_at == None) | (Product.last_crawled_at < cutoff - min_gap))
+        & (
+            (Product.dead_since == None)
+            | (Product.last_crawled_at < cutoff - timedelta(seconds=dead_probe_seconds()))
+        )
+    )
+
+
+def due_candidates_query(cutoff: datetime, after_id: Optional[UUID] = None):
+    """
+    One keyset page of products due by `cutoff`, ordered by ID
+    The stored next_crawl_at (index ix_products_due) selects only due rows;
+    schedule_due_page still holds overdue ones for their domain windows.
+    """
+    query = (
+        select(
+            Product.id, Product.user_id, Product.domain,
+            Product.last_crawled_at, User.subscription_tier, Product.dead_since
+        )
+        .join(User, User.id == Product.user_id)
+        .where(
+            Product.is_active == True,
+            (Product.next_crawl_at <= cutoff) | _due_without_schedule(cutoff),
+        )
+        .order_by(Product.id)
+        .limit(settings.CRAWL_ENQUEUE_PAGE_SIZE)
+    )
+    if after_id is not None:
+        query = query.where(Product.id > after_id)
+    return query
+
+
+def schedule_due_page(
+    rows,
+    now: float,
+    claim=claim_dispatch,
+    scheduler: Optional[DeficitRoundRobin] = None,
+) -> DeficitRoundRobin:
     """
-    Remove price history older than 1 year
+    Filter a candidate page to due, newly claimed products
+    Adds them to a fair-share scheduler (a new one by default) as
+    (product_id, domain) items and returns it
+    """
+    # Keep only products whose jittered slot has arrived
+    due = [
+        (str(product_id), str(user_id), domain, tier)
+        for product_id, user_id, domain, last_crawled_at, tier, dead_since in rows
+        if is_crawl_due(str(product_id), domain, last_crawled_at, now, dead_since)
+    ]
+    claimed = set(claim([product_id for product_id, _, _, _ in due])) if due else set()
+    
+    # Interleave users so heavy trackers can't starve everyone else
+    if scheduler is None:
+        scheduler = DeficitRoundRobin()
+    for product_id, user_id, domain, tier in due:
+        if product_id in claimed:
+            weight = settings.CRAWL_FAIR_SHARE_WEIGHTS.get(tier.value, 1.0)
+            scheduler.push(user_id, (product_id, domain), weight=weight)
+    return scheduler
+
+
+async def load_due_schedule(
+    db: AsyncSession,
+    sweep,
+    now: float,
+    claim=claim_dispatch,
+) -> Tuple[DeficitRoundRobin, Optional[UUID], int, bool]:
     """
+    Read the sweep's due products for this tick into one fair-share schedule
+    Fair share is decided over the whole slice, not per ID-ordered page: v7
+    keys follow creation time, so a bulk import fills whole pages with one
+    user's products. Stops after CRAWL_TICK_MAX_DUE candidates. Returns the
+    schedule, the cursor to checkpoint, rows scanned and whether the sweep
+    is exhausted.
+    """
+    scheduler = DeficitRoundRobin()
+    cursor = sweep.cursor
+    scanned = 0
+    while True:
+        rows = (await db.execute(due_candidates_query(sweep.cutoff, cursor))).fetchall()
+        if rows:
+            schedule_due_page(rows, now, claim=claim, scheduler=scheduler)
+            cursor = rows[-1][0]
+            scanned += len(rows)
+        if len(rows) < settings.CRAWL_ENQUEUE_PAGE_SIZE:
+            return scheduler, cursor if scanned else None, scanned, True
+        if scanned >= settings.CRAWL_TICK_MAX_DUE:
+            return scheduler, cursor, scanned, False
+
+
+def _publish_schedule(
+    scheduler: DeficitRoundRobin,
+    router: Optional[DomainRouter] = None,
+    sweep_id: Optional[str] = None,
+) -> int:
+    """
+    Publish scheduled products in fair-share order
+    If publishing fails partway, the claims of products not yet queued are
+    released before the error propagates, so the next tick picks them up.
+    """
+    if not len(scheduler):
+        return 0
+    
+    queued = len(scheduler)
+    batch_size = settings.CRAWL_TASK_BATCH_SIZE
+    taken: List[str] = []
+    published = set()
+    
+    def queue_for(domain: Optional[str]) -> str:
+        # Domain affinity: send each retailer to workers already warm for it
+        return router.queue_for(domain) if router else QUEUE_CRAWL_BULK
+    
+    def take():
+        for user_id, (product_id, domain) in scheduler.drain():
+            taken.append(product_id)
+            yield user_id, product_id, domain
+    
+    try:
+        # Publish the whole slice over one pooled broker connection
+        with celery_app.producer_or_acquire() as producer:
+            if batch_size <= 1:
+                for user_id, product_id, domain in take():
+                    crawl_single_product.apply_async(
+                        args=(product_id,),
+                        kwargs={"user_id": user_id, "enqueued_at": time.time(), "sweep_id": sweep_id},
+                        queue=queue_for(domain),
+                        producer=producer,
+                    )
+                    published.add(product_id)
+            else:
+                # Consecutive fair-share slots bound for the same queue share one message
+                pending = {}
+                
+                def flush(queue: str):
+                    chunk = pending.pop(queue)
+                    crawl_product_batch.apply_async(
+                        args=([product_id for _, product_id in chunk],),
+                        kwargs={
+                            "user_ids": [user_id for user_id, _ in chunk],
+                            "enqueued_at": time.time(),
+                            "sweep_id": sweep_id,
+                        },
+                        queue=queue,
+                        producer=producer,
+                    )
+                    published.update(product_id for _, product_id in chunk)
+                
+                for user_id, product_id, domain in take():
+                    queue = queue_for(domain)
+                    pending.setdefault(queue, []).append((user_id, product_id))
+                    if len(pending[queue]) >= batch_size:
+                        flush(queue)
+                for queue in list(pending):
+                    flush(queue)
+    except Exception:
+        list(take())  # Products still in the schedule were claimed too
+        unpublished = [product_id for product_id in taken if product_id not in published]
+        release_dispatch(unpublished)
+        logger.warning("Publish failed; released unqueued dispatch claims", released=len(unpublished))
+        raise
+    
+    return queued
+
+
+@celery_app.task(bind=True)
+def cleanup_old_history(self):
+    """
+    Drop price history past HISTORY_RETENTION_DAYS and maintain its storage
+    """
+    if not claim_tick("cleanup-old-history", CLEANUP_TICK_SECONDS, at=scheduled_time(self.request)):
+        return {"deleted": 0, "skipped": "duplicate_tick"}
     return run_async(_cleanup_old_history())
 
 
 async def _cleanup_old_history():
     """Async implementation of cleanup"""
+    now = datetime.now(timezone.utc)
     async with async_session_maker() as db:
-        try:
-            cutoff = datetime.utcnow() - timedelta(days=365)
-            
-            result = await db.execute(
-                select(PriceHistory).where(PriceHistory.recorded_at < cutoff)
-            )
-            old_records = result.scalars().all()
-            
-            count = len(old_records)
-            for record in old_records:
-                await db.delete(record)
-            
-            await db.commit()
-            
-            logger.info("Cleaned up old history", deleted_count=count)
-            return {"deleted": count}
-            
-        except Exception as e:
-            logger.error("Error cleaning up history", error=str(e))
-            await db.rollback()
-            raise
+        rollups_deleted = await prune_rollups(db, now)
+        await db.commit()
+    
+    # Partition drops / batched deletes, or segment compaction for the file store
+    outcome = await history_store().maintain(now)
+    return {**outcome, "rollups_deleted": rollups_deleted}
@@ -2,7 +2,6 @@
 Notification Background Tasks
 Email and Push notification sending
 """
-import asyncio
 from datetime import datetime
 from uuid import UUID
 from typing import Optional
@@ -15,20 +14,11 @@ from app.celery_app import celery_app
 from app.database import async_session_maker
 from app.models import Alert, User, AlertStatus
 from app.config import settings
+from app.tasks import run_async
 
 logger = structlog.get_logger()
 
 
-def run_async(coro):
-    """Run async function in sync context"""
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        return loop.run_until_complete(coro)
-    finally:
-        loop.close()
-
-
 @celery_app.task(bind=True, max_retries=3)
 def send_alert_notification(self, alert_id: str):
     """
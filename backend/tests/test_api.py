@@ -137,6 +137,134 @@ class TestPriceCrawler:
         assert config == crawler.SITE_CONFIGS["default"]
 
 
+# ============== Database Pool Tests ==============
+
+class TestDatabasePool:
+    """Test per-role connection pool profiles"""
+
+    def test_role_profiles(self):
+        """API processes get the large pool, workers a small one"""
+        from app.config import settings
+        from app.database import pool_options
+
+        api = pool_options("api")
+        worker = pool_options("worker")
+        assert api["pool_size"] == settings.DATABASE_POOL_SIZE
+        assert worker["pool_size"] < api["pool_size"]
+        assert worker["pool_pre_ping"] and worker["pool_recycle"] > 0
+
+        with pytest.raises(ValueError):
+            pool_options("nonexistent")
+
+    def test_pool_stats(self):
+        """The engine pools connections and reports its state"""
+        from app.database import pool_stats
+
+        stats = pool_stats()
+        assert stats["role"] == "api"
+        assert stats["pool_size"] > 0
+        assert stats["checked_out"] == 0
+
+
+# ============== History Encoding Tests ==============
+
+class TestHistoryEncoding:
+    """Test columnar price history encodings"""
+
+    def _response(self):
+        from datetime import datetime, timedelta, timezone
+        from decimal import Decimal
+        from uuid import uuid4
+        from app.schemas import PriceHistoryResponse, PricePoint
+
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        return PriceHistoryResponse(
+            product_id=uuid4(),
+            history=[
+                PricePoint(price=Decimal("19.99"), recorded_at=start, is_available=True),
+                PricePoint(price=Decimal("17.50"), recorded_at=start + timedelta(hours=12), is_available=False),
+                PricePoint(price=Decimal("17.50"), recorded_at=start + timedelta(hours=24), is_available=True),
+            ],
+            lowest_price=Decimal("17.50"),
+            highest_price=Decimal("19.99"),
+            average_price=Decimal("18.33"),
+            price_trend="down",
+            resolution="daily",
+        )
+
+    def test_negotiate_accept(self):
+        """The highest-q supported media type wins; JSON otherwise"""
+        from app.services.history_encoding import negotiate
+
+        assert negotiate(None) == "application/json"
+        assert negotiate("*/*") == "application/json"
+        assert negotiate("application/vnd.pricedrop.history") == "application/vnd.pricedrop.history"
+        assert negotiate(
+            "application/vnd.pricedrop.history;q=0.5, application/vnd.pricedrop.history+json"
+        ) == "application/vnd.pricedrop.history+json"
+
+    def test_columnar_json(self):
+        """Columnar JSON carries deltas, cents and an availability bitmap"""
+        from app.services.history_encoding import encode_columnar_json
+
+        encoded = encode_columnar_json(self._response())
+        assert encoded["base_time"] == 1704067200
+        assert encoded["time_deltas"] == [0, 43200, 43200]
+        assert encoded["prices_cents"] == [1999, 1750, 1750]
+        assert encoded["availability"] == "BQ=="  # 0b101
+        assert encoded["average_price_cents"] == 1833
+
+    def test_binary_round_trip(self):
+        """Binary encoding decodes back to the same series and is compact"""
+        from app.services.history_encoding import decode_binary, encode_binary
+
+        response = self._response()
+        data = encode_binary(response)
+        decoded = decode_binary(data)
+
+        assert decoded["product_id"] == response.product_id
+        assert decoded["times"] == [1704067200, 1704110400, 1704153600]
+        assert decoded["prices_cents"] == [1999, 1750, 1750]
+        assert decoded["available"] == [True, False, True]
+        assert decoded["price_trend"] == "down" and decoded["resolution"] == "daily"
+        assert len(data) < len(response.model_dump_json())
+
+
+# ============== Identifier Tests ==============
+
+class TestTimeOrderedIds:
+    """Test v7 UUID primary keys"""
+
+    def test_uuid7_layout(self):
+        """Version and variant bits are set and the timestamp reads back"""
+        from datetime import datetime, timezone
+        from app.ids import uuid7, uuid7_time
+
+        before = datetime.now(timezone.utc)
+        value = uuid7()
+        assert value.version == 7
+        assert value.variant == "specified in RFC 4122"
+        assert abs((uuid7_time(value) - before).total_seconds()) < 1
+
+    def test_uuid7_monotonic(self):
+        """Keys from one process strictly increase, even within a millisecond"""
+        from app.ids import uuid7
+
+        values = [uuid7() for _ in range(5000)]
+        assert values == sorted(values)
+        assert len(set(values)) == len(values)
+
+    def test_v4_keys_coexist(self):
+        """Existing v4 keys have no embedded time; models default to v7"""
+        import uuid
+        from app.ids import uuid7_time
+        from app.models import Alert, PriceHistory, Product
+
+        assert uuid7_time(uuid.uuid4()) is None
+        for model in (Product, Alert, PriceHistory):
+            assert model.__table__.c.id.default.arg(None).version == 7
+
+
 # ============== Integration Tests ==============
 
 @pytest.mark.asyncio
@@ -0,0 +1,207 @@
+"""
+Backend Tests - Crawler
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from app.crawler.engine import CrawlResult
+from app.crawler.singleflight import SingleFlight, canonical_url, flight_key
+from app.models import Product
+from app.tasks.crawler_tasks import is_result_applied
+
+
+# ============== Single-Flight Tests ==============
+
+class TestSingleFlight:
+    """Test crawl coalescing by canonical URL"""
+
+    def test_canonical_url(self):
+        """Equivalent product links normalize to one key"""
+        assert canonical_url(
+            "https://www.amazon.com/Some-Product/dp/b0abc12345/ref=sr_1_1?th=1&psc=1"
+        ) == "https://amazon.com/dp/B0ABC12345"
+        assert canonical_url(
+            "http://WWW.Target.com/p/item/-/A-123/?utm_source=x&color=red#reviews"
+        ) == "https://target.com/p/item/-/A-123?color=red"
+        assert flight_key("https://bestbuy.com/site/x?b=2&a=1") == flight_key(
+            "https://www.bestbuy.com/site/x/?a=1&b=2&gclid=abc"
+        )
+        assert flight_key("https://bestbuy.com/site/x") != flight_key("https://bestbuy.com/site/y")
+
+    def test_concurrent_callers_share_one_crawl(self):
+        """Callers joining an in-flight crawl don't open another page"""
+        calls = []
+
+        async def fetch(url):
+            calls.append(url)
+            await asyncio.sleep(0.05)
+            return CrawlResult(success=True, url=url, price=Decimal("9.99"))
+
+        async def run():
+            flight = SingleFlight()
+            return await asyncio.gather(*(
+                flight.crawl("https://www.target.com/p/item?utm_source=%d" % i, fetch)
+                for i in range(5)
+            ))
+
+        results = asyncio.run(run())
+
+        assert len(calls) == 1
+        assert all(result is results[0] for result in results)
+        assert results[0].crawled_at is not None
+
+    def test_shared_result_applied_once(self):
+        """A product already updated by a shared crawl skips it"""
+        crawled_at = datetime.utcnow()
+        result = CrawlResult(success=True, url="u", crawled_at=crawled_at.timestamp() - 5)
+        product = Product(last_crawled_at=crawled_at)
+
+        assert is_result_applied(product, result)
+        assert not is_result_applied(Product(last_crawled_at=crawled_at - timedelta(minutes=1)), result)
+        assert not is_result_applied(product, CrawlResult(success=True, url="u"))
+
+
+# ============== Failure Classification Tests ==============
+
+class TestFailureClassification:
+    """Test detection of product pages that are gone"""
+
+    def test_redirected_off_product(self):
+        """Redirects to home or search pages mean the product is gone"""
+        from app.crawler.engine import PriceCrawler
+
+        crawler = PriceCrawler()
+        product = "https://www.amazon.com/dp/B0ABC12345"
+
+        assert crawler._redirected_off_product(product, "https://www.amazon.com/")
+        assert crawler._redirected_off_product(product, "https://www.amazon.com/s?k=widget")
+        assert crawler._redirected_off_product("https://target.com/p/x", "https://target.com/search/x")
+        assert not crawler._redirected_off_product(product, "https://www.amazon.com/dp/B0ABC12345/")
+        assert not crawler._redirected_off_product(product, "https://www.amazon.com/Widget/dp/B0ABC12345")
+
+
+# ============== Crawler Startup Tests ==============
+
+class TestCrawlerStartup:
+    """Test the shared browser is started once"""
+
+    def test_concurrent_get_crawler_starts_one_browser(self, monkeypatch):
+        """A cold worker's concurrent crawls share one started crawler"""
+        from app.crawler import engine
+
+        starts = []
+
+        async def start(self):
+            starts.append(self)
+            await asyncio.sleep(0.05)
+            self.browser = object()
+
+        monkeypatch.setattr(engine.PriceCrawler, "start", start)
+        monkeypatch.setattr(engine, "_crawler", None)
+        monkeypatch.setattr(engine, "_crawler_lock", asyncio.Lock())
+
+        async def run():
+            return await asyncio.gather(*(engine.get_crawler() for _ in range(8)))
+
+        crawlers = asyncio.run(run())
+        assert len(starts) == 1
+        assert all(crawler is starts[0] for crawler in crawlers)
+
+    def test_failed_start_is_not_published(self, monkeypatch):
+        """A crawler whose start fails is not handed to later callers"""
+        from app.crawler import engine
+
+        async def start(self):
+            raise RuntimeError("chromium missing")
+
+        monkeypatch.setattr(engine.PriceCrawler, "start", start)
+        monkeypatch.setattr(engine, "_crawler", None)
+        monkeypatch.setattr(engine, "_crawler_lock", asyncio.Lock())
+
+        async def run():
+            try:
+                await engine.get_crawler()
+            except RuntimeError:
+                pass
+            return engine._crawler
+
+        assert asyncio.run(run()) is None
+
+    def test_lazy_start_runs_once(self, monkeypatch):
+        """Concurrent crawls on an unstarted crawler launch one browser"""
+        from app.crawler.engine import PriceCrawler
+
+        starts = []
+
+        async def start(self):
+            starts.append(self)
+            await asyncio.sleep(0.05)
+            self.browser = object()
+
+        monkeypatch.setattr(PriceCrawler, "start", start)
+
+        async def run():
+            crawler = PriceCrawler()
+            await asyncio.gather(*(crawler.ensure_started() for _ in range(5)))
+
+        asyncio.run(run())
+        assert len(starts) == 1
+
+
+# ============== Crawl Cache Tests ==============
+
+class TestCrawlCache:
+    """Test the in-process layer of the crawl result cache"""
+
+    def test_fresh_hits_and_lru_eviction(self):
+        """Fresh entries hit under any equivalent URL; the oldest entry is evicted"""
+        import time
+        from app.crawler.cache import CrawlCache
+
+        cache = CrawlCache(max_entries=2)
+        now = time.time()
+        cache._remember(flight_key("https://target.com/p/1"), CrawlResult(success=True, url="1", crawled_at=now))
+        cache._remember(flight_key("https://target.com/p/2"), CrawlResult(success=True, url="2", crawled_at=now - 600))
+
+        async def lookup(url, max_age=None):
+            return await cache.get(url, max_age)
+
+        assert asyncio.run(lookup("https://www.target.com/p/1?utm_source=app")).url == "1"
+        assert asyncio.run(lookup("https://target.com/p/2", max_age=60)) is None
+        assert asyncio.run(lookup("https://target.com/p/2", max_age=3600)).url == "2"
+
+        cache._remember(flight_key("https://target.com/p/3"), CrawlResult(success=True, url="3", crawled_at=now))
+        assert flight_key("https://target.com/p/1") not in cache._entries
+        assert len(cache._entries) == 2
+
+
+# ============== Crawl Job Tests ==============
+
+class TestCrawlJobs:
+    """Test crawl job records"""
+
+    def test_decode_job_record(self):
+        """Redis hash fields decode into a job with parsed payload and result"""
+        from app.services.crawl_jobs import _decode, JOB_SUCCEEDED
+
+        job = _decode({
+            "id": "j1",
+            "kind": "preview",
+            "status": JOB_SUCCEEDED,
+            "user_id": "u1",
+            "payload": '{"url": "https://target.com/p/1"}',
+            "result": '{"price": "19.99"}',
+            "created_at": "1700000000.0",
+            "updated_at": "1700000004.5",
+        })
+
+        assert job["payload"]["url"] == "https://target.com/p/1"
+        assert job["result"] == {"price": "19.99"}
+        assert job["error"] is None
+        assert job["updated_at"] - job["created_at"] == 4.5
+        assert _decode({}) is None
@@ -0,0 +1,1428 @@
+"""
+Backend Tests - Crawl Scheduling
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from datetime import datetime, timezone
+from uuid import UUID, uuid4
+
+from app.config import settings
+from app.scheduler.fair_share import DeficitRoundRobin, summarize_waits
+from app.scheduler.admission import _message_enqueued_at
+from app.scheduler.routing import HashRing, DomainRouter, domain_group
+from app.tasks.crawler_tasks import (
+    crawl_interval_seconds, crawl_phase, crawl_window_open, next_crawl_at, is_crawl_due
+)
+
+
+def _referenced(element):
+    """Columns ("table.column") and SQL functions ("name()") an expression uses"""
+    from sqlalchemy.sql import visitors
+    from sqlalchemy.sql.elements import ColumnClause
+    from sqlalchemy.sql.functions import FunctionElement
+
+    names = set()
+    for node in visitors.iterate(element):
+        if isinstance(node, ColumnClause):
+            names.add(f"{getattr(node.table, 'name', None)}.{node.name}")
+        elif isinstance(node, FunctionElement):
+            names.add(f"{node.name}()")
+    return names
+
+
+# ============== Fair-Share Dispatch Tests ==============
+
+class TestDeficitRoundRobin:
+    """Test fair-share ordering across users"""
+
+    def test_interleaves_users(self):
+        """A heavy user queued first must not delay a light user"""
+        drr = DeficitRoundRobin()
+        for i in range(100):
+            drr.push("heavy", f"h{i}")
+        drr.push("light", "l0")
+
+        order = [item for _, item in drr.drain()]
+
+        assert len(order) == 101
+        assert order.index("l0") <= 1
+
+    def test_weights_share_of_each_round(self):
+        """Weighted flows get proportionally more slots per round"""
+        drr = DeficitRoundRobin()
+        for i in range(30):
+            drr.push("pro", f"p{i}", weight=3)
+            drr.push("free", f"f{i}", weight=1)
+
+        first = [flow for flow, _ in list(drr.drain())[:20]]
+
+        assert first.count("pro") == 15
+        assert first.count("free") == 5
+
+    def test_preserves_per_user_fifo(self):
+        """Items for one user come out in the order they were queued"""
+        drr = DeficitRoundRobin()
+        for i in range(5):
+            drr.push("a", i)
+            drr.push("b", i)
+
+        a_items = [item for flow, item in drr.drain() if flow == "a"]
+        assert a_items == [0, 1, 2, 3, 4]
+
+    def test_empty_and_invalid_weight(self):
+        """Empty scheduler returns None; non-positive weights are rejected"""
+        drr = DeficitRoundRobin()
+        assert drr.pop() is None
+
+        with pytest.raises(ValueError):
+            drr.push("a", 1, weight=0)
+
+    def test_summarize_waits(self):
+        """Percentile summary of queue-wait samples"""
+        assert summarize_waits([])["count"] == 0
+
+        summary = summarize_waits([float(i) for i in range(1, 101)])
+        assert summary["count"] == 100
+        assert summary["p50"] == 51.0
+        assert summary["p95"] >= 95.0
+        assert summary["max"] == 100.0
+
+    def test_message_enqueued_at(self):
+        """Enqueue time is read back from a raw Redis-transport message"""
+        import base64
+        import json
+
+        body = json.dumps([["pid"], {"user_id": "u", "enqueued_at": 123.5}, {}])
+        raw = json.dumps({
+            "body": base64.b64encode(body.encode()).decode(),
+            "headers": {},
+            "properties": {"body_encoding": "base64"},
+        })
+
+        assert _message_enqueued_at(raw.encode()) == 123.5
+        assert _message_enqueued_at(b"not json") is None
+
+    def test_fair_share_spans_the_whole_tick(self, monkeypatch):
+        """A light user's product on a later page is not queued behind a heavy user's page"""
+        import asyncio
+        from types import SimpleNamespace
+        from app.models import SubscriptionTier
+        from app.tasks.crawler_tasks import load_due_schedule
+
+        monkeypatch.setattr(settings, "CRAWL_ENQUEUE_PAGE_SIZE", 50)
+        heavy, light = uuid4(), uuid4()
+        # Never crawled, so due; IDs ascend like a bulk import followed by a new user
+        rows = sorted(
+            [(uuid4(), heavy, "example.com", None, SubscriptionTier.FREE, None) for _ in range(50)],
+            key=lambda row: row[0],
+        ) + [(uuid4(), light, "example.com", None, SubscriptionTier.FREE, None)]
+        pages = [rows[:50], rows[50:]]
+
+        class Result:
+            def __init__(self, page):
+                self.page = page
+
+            def fetchall(self):
+                return self.page
+
+        class Session:
+            async def execute(self, query):
+                return Result(pages.pop(0))
+
+        sweep = SimpleNamespace(cutoff=datetime.utcnow(), cursor=None)
+        scheduler, cursor, scanned, exhausted = asyncio.run(
+            load_due_schedule(Session(), sweep, 0.0, claim=lambda product_ids: product_ids)
+        )
+
+        order = [user_id for user_id, _ in scheduler.drain()]
+        assert order.index(str(light)) <= 1
+        assert (cursor, scanned, exhausted) == (rows[-1][0], 51, True)
+
+    def test_failed_publish_releases_unqueued_claims(self, monkeypatch):
+        """Products claimed but not queued when the broker fails are freed for the next tick"""
+        from contextlib import nullcontext
+        from app.celery_app import celery_app
+        from app.tasks import crawler_tasks
+
+        monkeypatch.setattr(settings, "CRAWL_TASK_BATCH_SIZE", 1)
+        scheduler = DeficitRoundRobin()
+        for i in range(5):
+            scheduler.push("u", (f"p{i}", "example.com"))
+
+        sent, released = [], []
+
+        def apply_async(args, **kwargs):
+            if len(sent) == 2:
+                raise ConnectionError("broker unavailable")
+            sent.append(args[0])
+
+        monkeypatch.setattr(celery_app, "producer_or_acquire", lambda: nullcontext())
+        monkeypatch.setattr(crawler_tasks.crawl_single_product, "apply_async", apply_async)
+        monkeypatch.setattr(crawler_tasks, "release_dispatch", released.extend)
+
+        with pytest.raises(ConnectionError):
+            crawler_tasks._publish_schedule(scheduler)
+
+        assert sent == ["p0", "p1"]
+        assert released == ["p2", "p3", "p4"]
+
+
+# ============== Crawl Spreading Tests ==============
+
+class TestCrawlSpreading:
+    """Test jittered slots and domain crawl windows"""
+
+    def test_phase_is_deterministic_and_spread(self):
+        """Phases are stable per product and cover the whole interval"""
+        interval = crawl_interval_seconds()
+        product_id = str(uuid4())
+        assert crawl_phase(product_id) == crawl_phase(product_id)
+
+        buckets = set()
+        for _ in range(500):
+            phase = crawl_phase(str(uuid4()))
+            assert 0 <= phase < interval
+            buckets.add(int(phase // (interval / 12)))
+        assert len(buckets) == 12
+
+    def test_steady_state_period(self):
+        """A product crawled at its slot is next due one interval later"""
+        interval = crawl_interval_seconds()
+        product_id = str(uuid4())
+        slot = crawl_phase(product_id) + 1000 * interval
+        last = datetime.fromtimestamp(slot, tz=timezone.utc)
+
+        assert next_crawl_at(product_id, "example.com", last) == slot + interval
+        assert is_crawl_due(product_id, "example.com", last, slot + interval)
+        assert not is_crawl_due(product_id, "example.com", last, slot + interval - 60)
+
+    def test_never_crawled_is_due(self):
+        """Products without a crawl are due immediately"""
+        assert is_crawl_due(str(uuid4()), "example.com", None, 0.0)
+
+    def test_domain_window(self, monkeypatch):
+        """Deferred crawls land inside the domain's preferred window"""
+        monkeypatch.setattr(settings, "CRAWL_DOMAIN_WINDOWS", {"walmart.com": [[22, 6]]})
+
+        noon = datetime(2024, 1, 1, 12, tzinfo=timezone.utc).timestamp()
+        assert not crawl_window_open("walmart.com", noon)
+        assert crawl_window_open("walmart.com", noon + 12 * 3600)
+        assert crawl_window_open("www2.walmart.com", noon + 14 * 3600)
+        assert crawl_window_open("target.com", noon)
+
+        for _ in range(50):
+            product_id = str(uuid4())
+            due = next_crawl_at(product_id, "walmart.com", datetime(2024, 1, 1, tzinfo=timezone.utc))
+            assert crawl_window_open("walmart.com", due)
+
+
+    def test_stored_due_time_matches_schedule(self):
+        """next_crawl_time stores next_crawl_at, with the probe interval for dead products"""
+        from app.tasks.crawler_tasks import dead_probe_seconds, next_crawl_time
+
+        product_id = str(uuid4())
+        last = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+        stored = next_crawl_time(product_id, "example.com", last)
+        assert stored.timestamp() == next_crawl_at(product_id, "example.com", last)
+        dead = next_crawl_time(product_id, "example.com", last, dead=True)
+        assert dead.timestamp() >= last.timestamp() + dead_probe_seconds()
+
+    def test_due_query_filters_on_indexed_due_time(self):
+        """Dispatch pages select on next_crawl_at, which leads an index after is_active"""
+        from sqlalchemy import Column
+        from sqlalchemy.sql import visitors
+        from app.models import Product
+        from app.tasks.crawler_tasks import due_candidates_query
+
+        query = due_candidates_query(datetime.utcnow())
+        filtered = {
+            element.name for element in visitors.iterate(query.whereclause)
+            if isinstance(element, Column)
+        }
+        assert "next_crawl_at" in filtered
+
+        indexed = [[c.name for c in index.columns] for index in Product.__table__.indexes]
+        assert ["is_active", "next_crawl_at"] in indexed
+
+
+# ============== Domain Affinity Tests ==============
+
+class TestDomainRouting:
+    """Test consistent-hash routing of domains to workers"""
+
+    def test_domain_groups(self):
+        """Regional storefronts share one affinity group"""
+        assert domain_group("amazon.com") == domain_group("amazon.co.uk") == "amazon"
+        assert domain_group("bestbuy.com") == "bestbuy.com"
+
+    def test_minimal_remapping_on_join(self):
+        """Adding a node only moves keys onto the new node"""
+        keys = [f"shop{i}.com" for i in range(1000)]
+        before = HashRing(["a", "b", "c"])
+        after = HashRing(["a", "b", "c", "d"])
+
+        moved = [k for k in keys if before.node_for(k) != after.node_for(k)]
+
+        assert all(after.node_for(k) == "d" for k in moved)
+        assert len(moved) < 400
+
+    def test_preference_list_is_distinct(self):
+        """Fallback order visits every node exactly once"""
+        ring = HashRing(["a", "b", "c"])
+        assert sorted(ring.preference_list("amazon")) == ["a", "b", "c"]
+        assert list(HashRing([]).preference_list("amazon")) == []
+
+    def test_overflow_under_skew(self):
+        """A hot domain spills to the next worker, then to the shared queue"""
+        router = DomainRouter(["a", "b"], max_depth=2)
+        queues = [router.queue_for("amazon.com") for _ in range(5)]
+
+        assert queues[0] == queues[1]
+        assert queues[2] == queues[3] != queues[0]
+        assert queues[4] == "crawl.bulk"
+
+    def test_depth_bound_follows_node_throughput(self, monkeypatch):
+        """A worker's queue holds a few minutes of its crawls, not an hour"""
+        from app.scheduler.routing import affinity_max_depth
+
+        monkeypatch.setattr(settings, "CRAWL_NODE_CRAWLS_PER_MINUTE", 10)
+        monkeypatch.setattr(settings, "CRAWL_AFFINITY_MAX_BACKLOG_MINUTES", 5.0)
+        assert affinity_max_depth() == 50
+        assert DomainRouter(["a"]).max_depth == 50
+
+        monkeypatch.setattr(settings, "CRAWL_NODE_CRAWLS_PER_MINUTE", 60)
+        assert affinity_max_depth() == 300
+
+
+# ============== Queue Routing Tests ==============
+
+class TestQueueRouting:
+    """Test the task lanes"""
+
+    @pytest.mark.parametrize("task, queue", [
+        ("app.tasks.crawler_tasks.crawl_single_product", "crawl.bulk"),
+        ("app.tasks.crawler_tasks.crawl_product_batch", "crawl.bulk"),
+        ("app.tasks.crawler_tasks.run_crawl_job", "crawl.interactive"),
+        ("app.tasks.crawler_tasks.crawl_all_products", "dispatch"),
+        ("app.tasks.crawler_tasks.cleanup_old_history", "maintenance"),
+        ("app.tasks.notification_tasks.send_weekly_digest", "maintenance"),
+        ("app.tasks.notification_tasks.send_alert_notification", "notifications"),
+    ])
+    def test_task_lanes(self, task, queue):
+        """Each task lands on its lane; dispatch ticks share a queue with nothing else"""
+        from app.celery_app import celery_app
+
+        assert celery_app.amqp.router.route({}, task)["queue"].name == queue
+
+    def test_every_lane_is_declared(self):
+        """A worker started without -Q consumes every lane"""
+        from app.celery_app import celery_app
+
+        declared = {queue.name for queue in celery_app.conf.task_queues}
+        assert declared == {"crawl.interactive", "crawl.bulk", "notifications", "dispatch", "maintenance"}
+
+    def test_ops_reports_every_lane(self, monkeypatch):
+        """The ops queue endpoint covers each declared lane, dispatch included"""
+        from app.api import ops
+        from app.celery_app import celery_app
+
+        monkeypatch.setattr(ops, "queue_depth", lambda name: 0)
+        monkeypatch.setattr(ops, "oldest_task_age", lambda name: None)
+
+        reported = {stats.queue for stats in ops.queues()}
+        assert reported == {queue.name for queue in celery_app.conf.task_queues}
+
+
+# ============== Crawl Sweep Tests ==============
+
+class TestCrawlSweeps:
+    """Test sweep progress accounting"""
+
+    def test_outcome_succeeded(self):
+        """Inline and stream-pipeline outcomes count the same way"""
+        from app.scheduler.sweeps import outcome_succeeded
+
+        assert outcome_succeeded({"status": "success", "new_price": "9.99"})
+        assert outcome_succeeded({"status": "published", "success": True})
+        assert not outcome_succeeded({"status": "published", "success": False})
+        assert not outcome_succeeded({"status": "failed", "error": "timeout"})
+        assert not outcome_succeeded({"status": "not_found"})
+
+    def test_progress_folds_in_live_counters(self):
+        """Live counters take precedence over the ones last checkpointed on the row"""
+        from datetime import timedelta
+        from app.models import CrawlSweep, SweepStatus
+        from app.scheduler.sweeps import sweep_progress
+
+        started = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        sweep = CrawlSweep(
+            id=uuid4(), status=SweepStatus.COMPLETED, cutoff=started, scanned=100, dispatched=100,
+            succeeded=10, failed=1, ticks=3, started_at=started, finished_at=started + timedelta(minutes=10),
+        )
+
+        progress = sweep_progress(sweep, {"succeeded": "90", "failed": "5"})
+        assert (progress["succeeded"], progress["failed"], progress["in_flight"]) == (90, 5, 5)
+        assert progress["completed_per_minute"] == 9.5
+        assert sweep_progress(sweep, {})["succeeded"] == 10
+
+
+# ============== Result Stream Tests ==============
+
+class TestResultStream:
+    """Test crawl result records published to the stream"""
+
+    def test_record_round_trip(self):
+        """A stream record rebuilds the original crawl result"""
+        import json
+        from decimal import Decimal
+        from app.crawler.engine import CrawlResult
+        from app.services.result_stream import _parse
+
+        crawl_result = CrawlResult(
+            success=True, url="https://amazon.com/dp/X", price=Decimal("19.99"),
+            original_price=Decimal("24.99"), currency="USD", domain="amazon.com",
+        )
+        fields = {
+            "product_id": "p1",
+            "previous_price": "21.50",
+            "crawled_at": repr(1700000000.25),
+            "result": json.dumps(crawl_result.to_dict()),
+        }
+
+        product_id, previous_price, crawled_at, parsed = _parse(fields)
+
+        assert product_id == "p1"
+        assert previous_price == Decimal("21.50")
+        assert crawled_at.timestamp() == 1700000000.25
+        assert parsed == crawl_result
+        assert _parse({**fields, "previous_price": ""})[1] is None
+
+    class _Redis:
+        """Records acks and dead letters; reports fixed delivery counts"""
+
+        def __init__(self, deliveries):
+            self.deliveries = deliveries
+            self.acked = []
+            self.dead = []
+
+        def xack(self, stream, group, *ids):
+            self.acked.extend(ids)
+
+        def xadd(self, stream, fields, **kwargs):
+            self.dead.append(fields["entry_id"])
+
+        def xpending_range(self, stream, group, min, max, count, consumername=None):
+            return [{"message_id": i, "times_delivered": n} for i, n in self.deliveries.items()]
+
+    def _consumer(self, handler, deliveries):
+        from app.services.result_stream import StreamConsumer, WRITER_GROUP
+
+        consumer = StreamConsumer(WRITER_GROUP, name="test")
+        consumer.redis = self._Redis(deliveries)
+        consumer.handler = handler
+        return consumer
+
+    def test_failed_batch_left_pending(self):
+        """A transient failure neither acks nor dead-letters: the batch is replayed"""
+        import asyncio
+
+        async def handler(entries):
+            raise ConnectionError("database unavailable")
+
+        consumer = self._consumer(handler, {"1-0": 1, "2-0": 1})
+        asyncio.run(consumer._process([("1-0", {}), ("2-0", {})]))
+
+        assert consumer.redis.acked == []
+        assert consumer.redis.dead == []
+
+    def test_poison_entry_dead_lettered_after_max_deliveries(self, monkeypatch):
+        """Past the delivery limit entries run alone; only the failing one is dead-lettered"""
+        import asyncio
+
+        monkeypatch.setattr(settings, "RESULT_STREAM_MAX_DELIVERIES", 3)
+
+        async def handler(entries):
+            if any(entry_id == "2-0" for entry_id, _ in entries):
+                raise ValueError("bad record")
+
+        consumer = self._consumer(handler, {"1-0": 3, "2-0": 3, "3-0": 1})
+        asyncio.run(consumer._process([("1-0", {}), ("2-0", {}), ("3-0", {})]))
+
+        assert consumer.redis.acked == ["1-0", "2-0"]  # 2-0 acked with its dead letter
+        assert consumer.redis.dead == ["2-0"]
+
+    def test_alert_id_per_observation(self):
+        """A result published twice maps to one alert; another crawl gets its own"""
+        from app.services.result_stream import alert_id_for
+
+        crawled_at = datetime(2024, 1, 1, 12, tzinfo=timezone.utc)
+        assert alert_id_for("p1", crawled_at) == alert_id_for("p1", datetime(2024, 1, 1, 12, tzinfo=timezone.utc))
+        assert alert_id_for("p1", crawled_at) != alert_id_for("p1", crawled_at.replace(hour=13))
+        assert alert_id_for("p1", crawled_at) != alert_id_for("p2", crawled_at)
+
+    def test_drops_carry_the_replaced_price(self, monkeypatch):
+        """Writers publish applied drops against the stored price, not the pre-crawl one"""
+        import asyncio
+        import json
+        from decimal import Decimal
+        from app.crawler.engine import CrawlResult
+        from app.services import result_stream
+
+        class Session:
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc):
+                return False
+
+            async def commit(self):
+                pass
+
+        async def write(db, items, evaluate_alerts=True, attempts=None):
+            # Another crawl already lowered the stored price to 9.00
+            return {
+                "p1": {"status": "success", "old_price": "9.00", "new_price": "8.00"},
+                "p2": {"status": "success", "old_price": "5.00", "new_price": "6.00"},
+            }, []
+
+        published = []
+        monkeypatch.setattr(result_stream, "async_session_maker", Session)
+        monkeypatch.setattr(result_stream, "write_crawl_results", write)
+        monkeypatch.setattr(result_stream, "publish_drops", published.extend)
+
+        def entry(product_id, price, at):
+            result = CrawlResult(success=True, url="https://example.com", price=Decimal(price))
+            return (f"{at}-0", {
+                "product_id": product_id, "previous_price": "10.00",
+                "crawled_at": repr(float(at)), "result": json.dumps(result.to_dict()),
+            })
+
+        asyncio.run(result_stream.write_results([
+            entry("p1", "8.00", 1000), entry("p1", "8.50", 900), entry("p2", "6.00", 1000),
+        ]))
+
+        assert published == [
+            ("p1", datetime.fromtimestamp(1000, tz=timezone.utc), Decimal("9.00"), Decimal("8.00")),
+        ]
+
+    def test_alerts_read_the_drop_stream(self):
+        """The alerts group consumes writer-published drops, not raw results"""
+        from app.services.result_stream import (
+            ALERT_GROUP, DROPS_STREAM, RESULTS_STREAM, WRITER_GROUP, StreamConsumer,
+        )
+
+        assert StreamConsumer(ALERT_GROUP, name="test").stream == DROPS_STREAM
+        assert StreamConsumer(WRITER_GROUP, name="test").stream == RESULTS_STREAM
+
+
+# ============== Retry Policy Tests ==============
+
+class TestRetryPolicies:
+    """Test failure-classified retry backoff"""
+
+    def test_backoff_grows_with_jitter_and_caps(self):
+        """Delays double per attempt within [cap/2, cap] and stop at max_delay"""
+        import random
+        from app.scheduler.retry import RetryPolicy
+
+        policy = RetryPolicy(max_retries=5, base_delay=60, max_delay=600)
+        rng = random.Random(7)
+
+        for attempt, cap in enumerate([60, 120, 240, 480, 600]):
+            delay = policy.delay(attempt, rng)
+            assert cap / 2 <= delay <= cap
+        assert policy.delay(5, rng) is None
+
+    def test_policy_per_failure_kind(self):
+        """Transient failures retry; not-found and unclassified failures don't"""
+        from app.crawler.engine import FailureKind
+        from app.scheduler.retry import retry_delay
+
+        assert retry_delay(FailureKind.TIMEOUT.value, 0) is not None
+        assert retry_delay(FailureKind.BLOCKED.value, 0) >= 450
+        assert retry_delay(FailureKind.PARSE.value, 1) is None
+        assert retry_delay(FailureKind.NOT_FOUND.value, 0) is None
+        assert retry_delay(None, 0) is None
+
+
+# ============== Dead Product Tests ==============
+
+class TestDeadProducts:
+    """Test the negative cache for permanently failing products"""
+
+    def test_marked_dead_after_permanent_failures(self):
+        """Repeated not-found crawls mark a product dead; transient failures don't count"""
+        from app.models import Product
+        from app.tasks.crawler_tasks import record_permanent_failure
+
+        product = Product(id=uuid4(), permanent_failures=0)
+        at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        threshold = settings.CRAWL_DEAD_AFTER_FAILURES["not_found"]
+
+        record_permanent_failure(product, "timeout", at)
+        assert product.permanent_failures == 0
+
+        for _ in range(threshold - 1):
+            record_permanent_failure(product, "not_found", at)
+        assert product.dead_since is None
+        assert product.tracking_status == "tracking"
+
+        record_permanent_failure(product, "not_found", at)
+        assert product.dead_since == at
+        assert product.tracking_status == "dead"
+
+    def test_retried_failures_count_once(self):
+        """Only a crawl's final attempt counts; retries of the same crawl don't"""
+        from app.models import Product
+        from app.scheduler.retry import RETRY_POLICIES, retry_delay, will_retry
+        from app.tasks.crawler_tasks import record_permanent_failure
+
+        product = Product(id=uuid4(), permanent_failures=0)
+        at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        retries = RETRY_POLICIES["parse"].max_retries
+
+        for attempt in range(retries + 1):
+            assert will_retry("parse", attempt) == (retry_delay("parse", attempt) is not None)
+            record_permanent_failure(product, "parse", at, attempt=attempt)
+        assert product.permanent_failures == 1
+
+        # Crawls that are never retried (user refreshes) always count
+        record_permanent_failure(product, "parse", at)
+        assert product.permanent_failures == 2
+
+    def test_dead_products_are_only_probed(self):
+        """A dead product is not due again until a full probe interval has passed"""
+        interval = crawl_interval_seconds()
+        product_id = str(uuid4())
+        slot = crawl_phase(product_id) + 1000 * interval
+        last = datetime.fromtimestamp(slot, tz=timezone.utc)
+        probe = settings.CRAWL_DEAD_PROBE_HOURS * 3600
+
+        assert is_crawl_due(product_id, "example.com", last, slot + interval)
+        assert not is_crawl_due(product_id, "example.com", last, slot + interval, dead_since=last)
+        assert is_crawl_due(product_id, "example.com", last, slot + probe, dead_since=last)
+
+
+# ============== Capacity Simulator Tests ==============
+
+class TestCrawlSimulator:
+    """Test the offline crawl capacity simulator"""
+
+    def test_admission_verdict(self):
+        """Depth and age thresholds match production admission control"""
+        from app.scheduler.admission import admission_verdict
+
+        assert admission_verdict(0, None) is None
+        assert admission_verdict(settings.CRAWL_QUEUE_MAX_DEPTH, None)
+        assert admission_verdict(1, settings.CRAWL_QUEUE_MAX_AGE_SECONDS)
+
+    def test_capacity_shows_in_lateness(self):
+        """Enough workers keep crawls on time; too few build a backlog"""
+        from app.scheduler.simulator import CrawlSimulator, DomainProfile
+
+        domains = [DomainProfile("example.com", durations=[30.0], failures={"timeout": 0.05})]
+
+        def run(workers):
+            simulator = CrawlSimulator(
+                domains, products=2000, workers=workers, tiers={"free": 1.0}, start=1_700_000_000, seed=1
+            )
+            return simulator.run(hours=12)
+
+        ample = run(workers=8)
+        starved = run(workers=1)
+
+        assert ample["retries"] > 0
+        assert ample["lateness"]["p95"] < 600
+        assert ample["utilization"] < 0.5
+        assert starved["utilization"] > 0.9
+        assert starved["backlog"]["final"] > ample["backlog"]["final"]
+        assert starved["lateness"]["p95"] > ample["lateness"]["p95"]
+
+    def test_node_rate_limit_bounds_crawls(self, monkeypatch):
+        """Per-product tasks start at most CRAWL_NODE_CRAWLS_PER_MINUTE a minute per node"""
+        from app.scheduler.simulator import CrawlSimulator, DomainProfile
+
+        monkeypatch.setattr(settings, "CRAWL_NODE_CRAWLS_PER_MINUTE", 10)
+        domains = [DomainProfile("example.com", durations=[1.0])]
+
+        def run(batch_size):
+            monkeypatch.setattr(settings, "CRAWL_TASK_BATCH_SIZE", batch_size)
+            simulator = CrawlSimulator(
+                domains, products=0, new_products=3000, workers=8, node_concurrency=4,
+                tiers={"free": 1.0}, start=1_700_000_000, seed=1,
+            )
+            return simulator.run(hours=1)
+
+        limited = run(batch_size=1)
+        assert limited["worker_nodes"] == 2
+        # Two nodes at 10 a minute for an hour, plus slots still waiting on the limit at the end
+        assert limited["attempts"] <= 2 * 10 * 60 + 8
+        assert run(batch_size=10)["attempts"] > limited["attempts"]
+
+
+# ============== Bulk Result Writer Tests ==============
+
+class TestResultWriter:
+    """Test the set-based crawl result writer"""
+
+    def _item(self, product_id, at, success=True, price="9.99", failure_kind=None):
+        from decimal import Decimal
+        from app.crawler.engine import CrawlResult
+
+        result = CrawlResult(
+            url="https://example.com/p/1",
+            success=success,
+            price=Decimal(price) if success else None,
+            error=None if success else "Page not found",
+            failure_kind=failure_kind,
+        )
+        return (product_id, datetime.fromtimestamp(at, tz=timezone.utc), result)
+
+    def test_one_update_for_the_batch(self):
+        """All results go into one UPDATE ... FROM (VALUES ...) with bounds kept in SQL"""
+        from app.models import Product
+        from app.services.result_writer import update_statement
+
+        items = [
+            self._item(str(uuid4()), 1000),
+            self._item(str(uuid4()), 1000, success=False, failure_kind="not_found"),
+        ]
+        statement = update_statement(items)
+        assigned = statement._values
+
+        assert statement.table is Product.__table__
+        assert {"current_price", "lowest_price", "highest_price", "last_crawled_at",
+                "dead_since", "next_crawl_at"} <= set(assigned)
+        assert _referenced(assigned["lowest_price"]) >= {"least()", "products.lowest_price", "batch.price"}
+        assert _referenced(assigned["highest_price"]) >= {"greatest()", "products.highest_price", "batch.price"}
+        # Joined to the batch, and stale results skipped
+        assert _referenced(statement.whereclause) >= {
+            "batch.id", "batch.crawled_at", "products.last_crawled_at",
+        }
+        assert "id" in [column["name"] for column in statement.returning_column_descriptions]
+
+    def test_stored_currency_and_domain_win(self, monkeypatch):
+        """History and scheduling use the product's stored currency and domain, like the single path"""
+        import asyncio
+        from decimal import Decimal
+        from app.services import result_writer
+        from app.tasks.crawler_tasks import next_crawl_time
+
+        moved, kept = str(uuid4()), str(uuid4())
+        items = [self._item(moved, 1000), self._item(kept, 1000)]
+        for _, _, result in items:
+            result.domain, result.currency = "example.com", "USD"
+
+        class Rows:
+            def all(self):
+                return [
+                    (moved, Decimal("10.00"), None, None, "EUR", "shop.example.de"),
+                    (kept, Decimal("10.00"), None, None, "USD", "example.com"),
+                ]
+
+        class Session:
+            def __init__(self):
+                self.statements = []
+
+            async def execute(self, statement, params=None):
+                self.statements.append((statement, params))
+                return Rows()
+
+        recorded = []
+
+        async def record(db, observations):
+            recorded.extend(observations)
+
+        monkeypatch.setattr(result_writer, "record_observations", record)
+        db = Session()
+        asyncio.run(result_writer.write_crawl_results(db, items, evaluate_alerts=False))
+
+        assert {str(o["product_id"]): o["currency"] for o in recorded} == {moved: "EUR", kept: "USD"}
+        _, rescheduled = db.statements[1]
+        crawled_at = datetime.fromtimestamp(1000, tz=timezone.utc)
+        assert rescheduled == [{
+            "id": UUID(moved), "next_crawl_at": next_crawl_time(moved, "shop.example.de", crawled_at),
+        }]
+
+    def test_latest_result_per_product(self):
+        """A product crawled twice in one batch is updated with its newest result"""
+        from app.services.result_writer import _latest_per_product
+
+        product_id = str(uuid4())
+        items = _latest_per_product([
+            self._item(product_id, 2000, price="5.00"),
+            self._item(product_id, 1000, price="7.00"),
+            self._item(str(uuid4()), 1500),
+        ])
+
+        assert len(items) == 2
+        latest = next(item for item in items if item[0] == product_id)
+        assert str(latest[2].price) == "5.00"
+
+
+# ============== Run-Length History Tests ==============
+
+class TestPriceHistoryRuns:
+    """Test change-only price history storage"""
+
+    def test_runs_expand_to_points(self):
+        """A run of n observations reads back as n evenly spaced points"""
+        from datetime import timedelta
+        from decimal import Decimal
+        from app.models import PriceHistory
+        from app.services.price_history import expand_runs
+
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        rows = [
+            PriceHistory(price=Decimal("10.00"), is_available=True, recorded_at=start,
+                         last_seen_at=start + timedelta(hours=36), observations=4),
+            PriceHistory(price=Decimal("8.00"), is_available=True,
+                         recorded_at=start + timedelta(hours=48), observations=1),
+        ]
+
+        points = expand_runs(rows, since=start)
+        assert [at - start for _, at, _ in points] == [timedelta(hours=h) for h in (0, 12, 24, 36, 48)]
+        assert [price for price, _, _ in points] == [Decimal("10.00")] * 4 + [Decimal("8.00")]
+
+        # Runs straddling the cutoff keep only their later points
+        later = expand_runs(rows, since=(start + timedelta(hours=20)).replace(tzinfo=None))
+        assert len(later) == 3
+
+    def test_extend_targets_latest_matching_row(self):
+        """An unchanged observation updates only the product's latest row, if it matches"""
+        from decimal import Decimal
+        from app.models import PriceHistory
+        from app.services.price_history import extend_runs_statement
+
+        observation = {
+            "product_id": uuid4(), "price": Decimal("9.99"), "currency": "USD",
+            "is_available": True, "recorded_at": datetime(2024, 1, 1, tzinfo=timezone.utc),
+        }
+        statement = extend_runs_statement([observation])
+
+        assert statement.table is PriceHistory.__table__
+        assert set(statement._values) == {"last_seen_at", "observations"}
+        assert _referenced(statement._values["observations"]) == {"price_history.observations"}
+        # Latest row of the product (newest recorded_at), with the same price and availability
+        assert _referenced(statement.whereclause) >= {
+            "latest.product_id", "latest.recorded_at", "price_history.id",
+            "price_history.price", "observed.price",
+            "price_history.is_available", "observed.is_available",
+        }
+
+
+# ============== History Partition Tests ==============
+
+class TestHistoryPartitions:
+    """Test monthly price_history partitions and retention"""
+
+    def test_partition_names_round_trip(self):
+        """Partition names encode their month and parse back"""
+        from app.services.history_partitions import month_start, partition_month, partition_name
+
+        month = month_start(datetime(2024, 12, 31, 23, 59, tzinfo=timezone.utc))
+        assert partition_name(month) == "price_history_p202412"
+        assert partition_month("price_history_p202412") == month
+        assert partition_month("price_history_default") is None
+
+    def test_partition_bounds_cover_one_month(self):
+        """Each partition runs from its month start to the next, in UTC"""
+        from app.services.history_partitions import create_partition_sql, month_start
+
+        sql = create_partition_sql(month_start(datetime(2024, 12, 15, tzinfo=timezone.utc)))
+        assert "PARTITION OF price_history" in sql
+        assert "FROM ('2024-12-01T00:00:00+00:00') TO ('2025-01-01T00:00:00+00:00')" in sql
+
+    def test_only_fully_expired_months_are_dropped(self):
+        """A month is dropped only once its last day is past retention"""
+        from app.services.history_partitions import expired_months, months_between, retention_cutoff
+
+        now = datetime(2025, 3, 10, tzinfo=timezone.utc)
+        months = months_between(datetime(2023, 11, 5, tzinfo=timezone.utc), now)
+        expired = expired_months(months, retention_cutoff(now))
+        # Cutoff is 2024-03-10: March 2024 still holds retained rows
+        assert expired[-1] == datetime(2024, 2, 1, tzinfo=timezone.utc)
+        assert len(expired) == 4
+
+    def test_partition_key_in_primary_key(self):
+        """price_history is range partitioned and its key includes recorded_at"""
+        from app.models import PriceHistory
+
+        table = PriceHistory.__table__
+        assert table.dialect_options["postgresql"]["partition_by"] == "RANGE (recorded_at)"
+        assert [column.name for column in table.primary_key] == ["id", "recorded_at"]
+
+    def test_runs_stop_at_month_boundary(self):
+        """A run is only extended by an observation in the same UTC month"""
+        from decimal import Decimal
+        from app.services.price_history import extend_runs_statement
+
+        observation = {
+            "product_id": uuid4(), "price": Decimal("9.99"), "currency": "USD",
+            "is_available": True, "recorded_at": datetime(2024, 2, 1, tzinfo=timezone.utc),
+        }
+        statement = extend_runs_statement([observation])
+        month_match = [
+            criterion for criterion in statement.whereclause.clauses
+            if "date_trunc()" in _referenced(criterion)
+        ]
+        assert len(month_match) == 1
+        assert _referenced(month_match[0]) == {
+            "date_trunc()", "timezone()", "price_history.recorded_at", "observed.seen_at",
+        }
+
+
+# ============== Price Rollup Tests ==============
+
+class TestPriceRollups:
+    """Test hourly/daily price rollups"""
+
+    def test_resolution_follows_range(self):
+        """Short ranges read raw rows; longer ones read hourly, then daily rollups"""
+        from app.services.price_rollups import history_resolution
+
+        assert history_resolution(settings.HISTORY_RAW_MAX_DAYS) == "raw"
+        assert history_resolution(settings.HISTORY_RAW_MAX_DAYS + 1) == "hourly"
+        assert history_resolution(settings.HISTORY_HOURLY_MAX_DAYS) == "hourly"
+        assert history_resolution(365) == "daily"
+
+    def test_bucket_start_is_utc(self):
+        """Buckets start on UTC hour/day boundaries"""
+        from datetime import timedelta
+        from app.services.price_rollups import bucket_start
+
+        at = datetime(2024, 5, 3, 23, 30, tzinfo=timezone(timedelta(hours=-5)))
+        assert bucket_start(at, "hourly") == datetime(2024, 5, 4, 4, tzinfo=timezone.utc)
+        assert bucket_start(at, "daily") == datetime(2024, 5, 4, tzinfo=timezone.utc)
+
+    def test_upsert_folds_into_existing_bucket(self):
+        """A second observation updates high/low/close and the running totals"""
+        from decimal import Decimal
+        from app.services.price_rollups import bucket_rows, upsert_statement
+
+        observation = {
+            "product_id": uuid4(), "price": Decimal("9.99"), "currency": "USD",
+            "is_available": False, "recorded_at": datetime(2024, 1, 1, 10, 15, tzinfo=timezone.utc),
+        }
+        [row] = bucket_rows("daily", [observation])
+        assert row["bucket"] == datetime(2024, 1, 1, tzinfo=timezone.utc)
+        assert (row["observations"], row["available_observations"]) == (1, 0)
+
+        conflict = upsert_statement("daily", [observation])._post_values_clause
+        assert [column.name for column in conflict.inferred_target_elements] == ["product_id", "bucket"]
+        folded = dict(conflict.update_values_to_set)
+        assert _referenced(folded["high_price"]) == {
+            "greatest()", "price_history_daily.high_price", "excluded.high_price",
+        }
+        assert _referenced(folded["observations"]) == {
+            "price_history_daily.observations", "excluded.observations",
+        }
+
+    def test_rollup_average_weights_observations(self):
+        """The average is over observations, not buckets"""
+        from decimal import Decimal
+        from app.models import PriceHistoryDaily
+        from app.services.price_rollups import rollup_average
+
+        rollups = [
+            PriceHistoryDaily(price_sum=Decimal("30.00"), observations=3, available_observations=3),
+            PriceHistoryDaily(price_sum=Decimal("20.00"), observations=1, available_observations=0),
+        ]
+        assert rollup_average(rollups) == Decimal("12.5")
+        assert rollups[0].availability == 1.0
+        assert rollup_average([]) is None
+
+
+# ============== Downsampling Tests ==============
+
+class TestDownsampling:
+    """Test LTTB history downsampling"""
+
+    def _series(self, prices, available=None):
+        from datetime import timedelta
+        from decimal import Decimal
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        times = [start + timedelta(hours=i) for i in range(len(prices))]
+        return times, [Decimal(str(p)) for p in prices], available or [True] * len(prices)
+
+    def test_lttb_keeps_endpoints_and_peaks(self):
+        """LTTB keeps first, last and the extreme points"""
+        import numpy as np
+        from app.services.downsampling import lttb
+
+        x = np.arange(100, dtype=float)
+        y = np.zeros(100)
+        y[37] = 50.0
+        keep = lttb(x, y, 10)
+        assert len(keep) == 10
+        assert keep[0] == 0 and keep[-1] == 99
+        assert 37 in keep
+        assert list(keep) == sorted(keep)
+
+    def test_short_series_untouched(self):
+        """Series within the budget come back whole"""
+        from app.services.downsampling import downsample_indices
+
+        times, prices, available = self._series([10, 9, 8])
+        assert list(downsample_indices(times, prices, available, 100)) == [0, 1, 2]
+
+    def test_price_and_stock_edges_kept(self):
+        """Both sides of every price change and stock transition survive"""
+        from app.services.downsampling import downsample_indices
+
+        prices = [10.0] * 500 + [8.0] * 500
+        available = [True] * 300 + [False] * 700
+        times, prices, available = self._series(prices, available)
+        keep = set(downsample_indices(times, prices, available, 50).tolist())
+
+        assert len(keep) <= 50
+        assert {0, 299, 300, 499, 500, 999} <= keep
+
+    def test_transitions_kept_when_edges_exceed_budget(self):
+        """With more price edges than the budget, stock transitions still survive"""
+        from app.services.downsampling import downsample_indices
+
+        prices = [10.0 + (i % 2) for i in range(1000)]
+        available = [True] * 600 + [False] * 400
+        times, prices, available = self._series(prices, available)
+        keep = set(downsample_indices(times, prices, available, 40).tolist())
+
+        assert {599, 600} <= keep
+        assert len(keep) <= 42
+
+
+# ============== History Store Tests ==============
+
+class TestFileHistoryStore:
+    """Test the append-only columnar file store"""
+
+    def _observation(self, product_id, at, price, available=True):
+        from decimal import Decimal
+        return {
+            "product_id": product_id, "price": Decimal(price), "currency": "USD",
+            "is_available": available, "recorded_at": at,
+        }
+
+    def test_append_and_read_back(self, tmp_path):
+        """Points read back in time order from the requested start"""
+        from datetime import timedelta
+        from decimal import Decimal
+        from app.services.history_files import FileHistoryStore
+
+        store = FileHistoryStore(str(tmp_path))
+        product_id = uuid4()
+        start = datetime(2024, 3, 1, tzinfo=timezone.utc)
+        store._record([self._observation(product_id, start + timedelta(hours=12), "18.50", False)])
+        store._record([self._observation(product_id, start, "19.99")])
+
+        points = store._read(product_id, start)
+        assert points == [
+            (Decimal("19.99"), start, True),
+            (Decimal("18.50"), start + timedelta(hours=12), False),
+        ]
+        assert store._read(product_id, start + timedelta(hours=1)) == points[1:]
+        assert store._read(uuid4(), start) == []
+
+    def test_compaction_seals_months_and_dedupes(self, tmp_path):
+        """Compaction moves the head into monthly segments without duplicates"""
+        from datetime import timedelta
+        from app.services.history_files import FileHistoryStore
+
+        store = FileHistoryStore(str(tmp_path))
+        product_id = uuid4()
+        start = datetime(2024, 1, 31, 12, tzinfo=timezone.utc)
+        for day in range(3):
+            store._record([self._observation(product_id, start + timedelta(days=day), "10.00")])
+        store._record([self._observation(product_id, start, "10.00")])  # replayed result
+
+        assert store.compact_product(store.product_dir(product_id)) == 4
+        directory = store.product_dir(product_id)
+        assert sorted(path.name for path in directory.glob("*.seg")) == ["202401.seg", "202402.seg"]
+        assert (directory / "head.ts").stat().st_size == 0
+        assert len(store._read(product_id, start)) == 3
+
+    def test_head_realigned_after_torn_append(self, tmp_path):
+        """A column left long by a crash is cut back before the next append"""
+        from app.services.history_files import FileHistoryStore
+
+        store = FileHistoryStore(str(tmp_path))
+        product_id = uuid4()
+        at = datetime(2024, 5, 1, tzinfo=timezone.utc)
+        store._record([self._observation(product_id, at, "5.00")])
+        with open(store.product_dir(product_id) / "head.ts", "ab") as f:
+            f.write(b"\x00" * 8)
+
+        store._record([self._observation(product_id, at.replace(day=2), "6.00")])
+        assert [str(price) for price, _, _ in store._read(product_id, at)] == ["5.00", "6.00"]
+
+    def test_points_appended_only_on_commit(self, tmp_path):
+        """A rolled-back transaction leaves no points; a committed one appends them off the loop"""
+        import asyncio
+        import threading
+        from sqlalchemy.ext.asyncio import AsyncSession
+        from app.services.history_files import FileHistoryStore
+
+        store = FileHistoryStore(str(tmp_path))
+        product_id = uuid4()
+        at = datetime(2024, 5, 1, tzinfo=timezone.utc)
+
+        writers = []
+        record = store._record
+
+        def tracked(observations):
+            writers.append(threading.current_thread())
+            record(observations)
+
+        store._record = tracked
+
+        async def scenario():
+            db = AsyncSession()
+            await store.record(db, [self._observation(product_id, at, "5.00")])
+            assert store._read(product_id, at) == []
+            await db.rollback()
+            await store.record(db, [self._observation(product_id, at.replace(day=2), "6.00")])
+            await db.commit()
+            await db.commit()
+
+        asyncio.run(scenario())
+        store.flush()
+        assert [str(price) for price, _, _ in store._read(product_id, at)] == ["6.00"]
+        assert writers and threading.main_thread() not in writers
+
+    def test_reads_wait_for_compaction(self, tmp_path):
+        """A read overlapping an exclusive holder (compaction) waits for it to finish"""
+        import threading
+        from app.services.history_files import FileHistoryStore, product_lock
+
+        store = FileHistoryStore(str(tmp_path))
+        product_id = uuid4()
+        at = datetime(2024, 5, 1, tzinfo=timezone.utc)
+        store._record([self._observation(product_id, at, "5.00")])
+
+        points = []
+        reader = threading.Thread(target=lambda: points.extend(store._read(product_id, at)))
+        with product_lock(store.product_dir(product_id)):
+            reader.start()
+            reader.join(timeout=0.2)
+            assert reader.is_alive()
+        reader.join(timeout=5)
+        assert [str(price) for price, _, _ in points] == ["5.00"]
+
+    def test_incomplete_store_rejected(self):
+        """A backend missing part of the interface fails when created, not when used"""
+        from app.services.price_history import PriceHistoryStore
+
+        class WriteOnlyStore(PriceHistoryStore):
+            async def record(self, db, observations):
+                pass
+
+        with pytest.raises(TypeError):
+            WriteOnlyStore()
+
+    def test_expired_segments_dropped(self, tmp_path):
+        """Retention deletes whole monthly segments"""
+        from app.services.history_files import FileHistoryStore
+
+        store = FileHistoryStore(str(tmp_path))
+        product_id = uuid4()
+        store._record([self._observation(product_id, datetime(2023, 1, 15, tzinfo=timezone.utc), "7.00")])
+        store._record([self._observation(product_id, datetime(2024, 6, 15, tzinfo=timezone.utc), "8.00")])
+
+        outcome = store._maintain(datetime(2024, 7, 1, tzinfo=timezone.utc))
+        assert outcome["compacted_points"] == 2 and outcome["dropped_segments"] == 1
+        assert [path.name for path in store.product_dir(product_id).glob("*.seg")] == ["202406.seg"]
+
+
+# ============== Batch Crawl Tests ==============
+
+class TestBatchCrawl:
+    """Test multi-product crawl tasks"""
+
+    def test_crawls_bounded_by_concurrency(self, monkeypatch):
+        """At most CRAWL_BATCH_CONCURRENCY crawls run at once; errors come back in place"""
+        import asyncio
+        from decimal import Decimal
+        from app.crawler.engine import CrawlResult
+        from app.tasks import crawler_tasks
+
+        in_flight = []
+        peak = []
+
+        async def crawl(url):
+            in_flight.append(url)
+            peak.append(len(in_flight))
+            await asyncio.sleep(0.01)
+            in_flight.remove(url)
+            if url == "bad":
+                raise RuntimeError("boom")
+            return CrawlResult(success=True, url=url, price=Decimal("1.00"))
+
+        monkeypatch.setattr(settings, "CRAWL_BATCH_CONCURRENCY", 3)
+        monkeypatch.setattr(crawler_tasks, "crawl_product", crawl)
+
+        urls = ["u%d" % i for i in range(10)] + ["bad"]
+        results = asyncio.run(crawler_tasks.crawl_concurrently(urls))
+
+        assert max(peak) == 3
+        assert [r.url for r in results[:10]] == urls[:10]
+        assert isinstance(results[10], RuntimeError)
+
+    def test_no_connection_held_while_crawling(self, monkeypatch):
+        """The product query's session is closed before any crawl starts"""
+        import asyncio
+        from contextlib import asynccontextmanager
+        from decimal import Decimal
+        from app.crawler.engine import CrawlResult
+        from app.tasks import crawler_tasks
+
+        product_id = uuid4()
+        open_sessions = []
+        written = []
+
+        class Rows:
+            def fetchall(self):
+                return [(product_id, "https://example.com/p")]
+
+        class Session:
+            async def execute(self, statement):
+                return Rows()
+
+            async def commit(self):
+                pass
+
+            async def rollback(self):
+                pass
+
+        @asynccontextmanager
+        async def session_maker():
+            open_sessions.append(1)
+            try:
+                yield Session()
+            finally:
+                open_sessions.pop()
+
+        async def crawl(url):
+            assert not open_sessions
+            return CrawlResult(success=True, url=url, price=Decimal("5.00"))
+
+        async def write(db, items):
+            written.extend(items)
+            return {pid: {"status": "success"} for pid, _, _ in items}, []
+
+        monkeypatch.setattr(crawler_tasks, "async_session_maker", session_maker)
+        monkeypatch.setattr(crawler_tasks, "crawl_product", crawl)
+        monkeypatch.setattr(crawler_tasks, "write_crawl_results", write)
+        monkeypatch.setattr(crawler_tasks, "enqueue_notifications", lambda alerts: None)
+
+        outcome = asyncio.run(crawler_tasks._crawl_product_batch([str(product_id), str(uuid4())]))
+
+        assert [item[0] for item in written] == [str(product_id)]
+        statuses = sorted(r["status"] for r in outcome["results"].values())
+        assert statuses == ["not_found", "success"]
+
+    def test_transient_failures_requeued_on_origin_queue(self, monkeypatch):
+        """Retryable failures go back one by one as first retries on the same queue"""
+        from contextlib import nullcontext
+        from app.crawler.engine import FailureKind
+        from app.tasks import crawler_tasks
+
+        ok, flaky, gone = str(uuid4()), str(uuid4()), str(uuid4())
+        outcome = {"results": {
+            ok: {"status": "success"},
+            flaky: {"status": "failed", "failure_kind": FailureKind.TIMEOUT.value},
+            gone: {"status": "failed", "failure_kind": FailureKind.NOT_FOUND.value},
+        }}
+        sent = []
+
+        monkeypatch.setattr(settings, "CRAWL_RESULT_PIPELINE", "inline")
+        monkeypatch.setattr(crawler_tasks, "run_async", lambda coroutine: (coroutine.close(), outcome)[1])
+        monkeypatch.setattr(crawler_tasks.celery_app, "producer_or_acquire", lambda: nullcontext())
+        monkeypatch.setattr(
+            crawler_tasks.crawl_single_product, "apply_async", lambda **kwargs: sent.append(kwargs)
+        )
+
+        task = crawler_tasks.crawl_product_batch
+        task.push_request(delivery_info={"routing_key": "crawl.bulk.node-a"})
+        try:
+            assert task.run([ok, flaky, gone]) is outcome
+        finally:
+            task.pop_request()
+
+        assert len(sent) == 1
+        assert sent[0]["args"] == (flaky,)
+        assert sent[0]["retries"] == 1
+        assert sent[0]["queue"] == "crawl.bulk.node-a"
+        assert sent[0]["countdown"] > 0
+
+
+# ============== Crawl Daemon Tests ==============
+
+class TestCrawlDaemon:
+    """Test the daemon's crawl and retry handling"""
+
+    def _run(self, monkeypatch, results, delays):
+        import asyncio
+        from app.crawler import daemon as daemon_module
+
+        calls = []
+
+        async def crawl(url, fetch=None):
+            calls.append((url, fetch))
+            outcome = results[url].pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        monkeypatch.setattr(daemon_module, "crawl_product", crawl)
+        monkeypatch.setattr(
+            daemon_module, "retry_delay", lambda kind, attempt: delays.get((kind, attempt))
+        )
+
+        async def scenario():
+            daemon = daemon_module.CrawlDaemon(browsers=1, concurrency=4, domain_limit=2)
+            for url in results:
+                await daemon._slots.acquire()
+                daemon._spawn(daemon._crawl(url, url, "example.com"))
+            while daemon._inflight:
+                await asyncio.gather(*list(daemon._inflight))
+            written = []
+            while not daemon._results.empty():
+                written.append(daemon._results.get_nowait())
+            return daemon, written
+
+        daemon, written = asyncio.run(scenario())
+        return daemon, written, calls
+
+    def test_crawls_coalesce_through_crawl_product(self, monkeypatch):
+        """Every crawl goes through crawl_product with the daemon's browser pool"""
+        from decimal import Decimal
+        from app.crawler.engine import CrawlResult
+
+        ok = CrawlResult(success=True, url="a", price=Decimal("1.00"))
+        daemon, written, calls = self._run(monkeypatch, {"a": [ok]}, {})
+
+        assert calls == [("a", daemon._fetch)]
+        assert written == [("a", None, ok, 0)]
+
+    def test_transient_failure_retried_before_writing(self, monkeypatch):
+        """A retryable failure is crawled again after its delay; only the final result is written"""
+        import asyncio
+        from decimal import Decimal
+        from app.crawler.engine import CrawlResult, FailureKind
+
+        ok = CrawlResult(success=True, url="a", price=Decimal("1.00"))
+        delays = {(FailureKind.TIMEOUT, 0): 0.01}
+        daemon, written, calls = self._run(
+            monkeypatch, {"a": [asyncio.TimeoutError(), ok]}, delays
+        )
+
+        assert len(calls) == 2
+        assert written == [("a", None, ok, 1)]
+        assert daemon.stats["retried"] == 1
+        assert daemon.stats["succeeded"] == 1 and daemon.stats["failed"] == 0
+
+    def test_exhausted_failure_written(self, monkeypatch):
+        """Failures with no retry left are written with their own failure kind"""
+        from app.crawler.engine import CrawlResult, FailureKind
+
+        gone = CrawlResult(success=False, url="a", failure_kind=FailureKind.NOT_FOUND)
+        daemon, written, calls = self._run(monkeypatch, {"a": [gone]}, {})
+
+        assert len(calls) == 1
+        assert written == [("a", None, gone, 0)]
+        assert daemon.stats["failed"] == 1
+
+    def test_stop_abandons_pending_retries(self, monkeypatch):
+        """Stopping wakes waiting retries without crawling or writing them"""
+        import asyncio
+        from app.crawler import daemon as daemon_module
+        from app.crawler.engine import CrawlResult, FailureKind
+
+        calls = []
+
+        async def crawl(url, fetch=None):
+            calls.append(url)
+            return CrawlResult(success=False, url=url, failure_kind=FailureKind.NETWORK)
+
+        monkeypatch.setattr(daemon_module, "crawl_product", crawl)
+        monkeypatch.setattr(daemon_module, "retry_delay", lambda kind, attempt: 60)
+
+        async def scenario():
+            daemon = daemon_module.CrawlDaemon(browsers=1, concurrency=4, domain_limit=2)
+            await daemon._slots.acquire()
+            await daemon._crawl("a", "a", None)
+            assert len(daemon._inflight) == 1
+            daemon.stop()
+            await asyncio.wait_for(asyncio.gather(*list(daemon._inflight)), timeout=1)
+            return daemon
+
+        daemon = asyncio.run(scenario())
+
+        assert calls == ["a"]
+        assert daemon._results.empty()
+
+
+# ============== Beat Tick Claim Tests ==============
+
+class TestBeatTickClaims:
+    """Test at-most-once periodic ticks"""
+
+    class _Redis:
+        def __init__(self):
+            self.keys = {}
+
+        def set(self, key, value, nx=False, px=None):
+            if nx and key in self.keys:
+                return None
+            self.keys[key] = px
+            return True
+
+    def _claim(self, monkeypatch):
+        from app.scheduler import beat
+
+        redis = self._Redis()
+        monkeypatch.setattr(beat, "get_redis", lambda: redis)
+        return beat.claim_tick, redis
+
+    def test_copies_of_one_tick_run_once(self, monkeypatch):
+        """A failover copy of a tick is skipped, even when it runs much later"""
+        claim_tick, redis = self._claim(monkeypatch)
+        tick = 1_700_000_100  # On the 300 s grid
+
+        assert claim_tick("dispatch", 300, at=tick + 1)
+        assert not claim_tick("dispatch", 300, at=tick + 30)
+        # Claims live at least a period, so a copy stuck in the queue still sees it
+        assert list(redis.keys.values()) == [600_000]
+
+    def test_consecutive_ticks_both_run(self, monkeypatch):
+        """A late tick must not swallow the next one"""
+        claim_tick, _ = self._claim(monkeypatch)
+        tick = 1_700_000_100
+
+        assert claim_tick("dispatch", 300, at=tick + 290)
+        assert claim_tick("dispatch", 300, at=tick + 301)
+        assert claim_tick("cleanup", 300, at=tick + 301)
+
+    def test_scheduled_time_prefers_eta_then_publish_time(self):
+        """Ticks are keyed on when the message was meant to run, not when a worker got to it"""
+        import time
+        from types import SimpleNamespace
+        from app.scheduler.beat import scheduled_time
+
+        eta = datetime(2024, 1, 1, 12, tzinfo=timezone.utc)
+        assert scheduled_time(SimpleNamespace(eta=eta.isoformat(), sent_at=5.0)) == eta.timestamp()
+        assert scheduled_time(SimpleNamespace(eta=None, sent_at=5.0)) == 5.0
+        assert abs(scheduled_time(SimpleNamespace(eta=None)) - time.time()) < 5
+
+    def test_periodic_tasks_run_on_the_tick_grid(self):
+        """Beat schedules start each tick on the grid the claims are keyed on"""
+        from celery.schedules import crontab
+        from app.celery_app import celery_app, DISPATCH_TICK_SECONDS
+
+        schedule = celery_app.conf.beat_schedule["crawl-all-products"]["schedule"]
+        assert isinstance(schedule, crontab)
+        assert all(minute * 60 % DISPATCH_TICK_SECONDS == 0 for minute in schedule.minute)